@@ -4,6 +4,19 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
+import os
+import time
+
+import metrics
+from data_manager import DataManager
+from downsample import fit_to_budget, use_webgl
+from effects import ADJUSTED_COLUMN, ADJUSTED_NOTE, EffectsModel
+from exports import EXPORT_FORMATS, available_formats, export_bytes, export_filename
+from payload import typed_array
+from queries import INDICATOR_INFO, QueryEngine, filter_key
+from schema import enable_copy_on_write
+from spc import ALERT_COLUMNS, SPC_MAX_ANNOTATIONS
+from storage import DAILY, WEEKLY, dataset_version, load_processed
 
 # Configuración de página
 st.set_page_config(
@@ -14,53 +27,210 @@ st.set_page_config(
 )
 
 
+rerun_start = time.perf_counter()
+
+# Las sesiones comparten el dataset: escribir sobre un resultado nunca lo modifica
+enable_copy_on_write()
+
 # Título principal
 st.title("🏭 Philip Morris - Análisis de Performance de Operadores")
 st.markdown("---")
 
-# Cargar datos
-@st.cache_data
-def load_data():
-    df = pd.read_csv('data_weekly_processed.csv')
-    df['Fecha_Inicio'] = pd.to_datetime(df['Fecha_Inicio'])
-    df['Fecha_Fin'] = pd.to_datetime(df['Fecha_Fin'])
-    return df
-
-df = load_data()
-
-# Información de indicadores (para colores y descripciones)
-INDICATOR_INFO = {
-    'MTBF': {
-        'name': 'MTBF (Mean Time Between Failures)',
-        'better': 'higher',
-        'color': '#2ecc71',
-        'description': '⬆️ Mayor es mejor - Tiempo promedio entre fallas'
-    },
-    'Reject_Rate': {
-        'name': 'Reject Rate',
-        'better': 'lower',
-        'color': '#e74c3c',
-        'description': '⬇️ Menor es mejor - Porcentaje de productos rechazados'
-    },
-    'Strategic_PR': {
-        'name': 'Strategic PR (Production Rate)',
-        'better': 'higher',
-        'color': '#3498db',
-        'description': '⬆️ Mayor es mejor - Tasa de producción estratégica'
-    },
-    'UPDT': {
-        'name': 'UPDT (Unplanned Downtime)',
-        'better': 'lower',
-        'color': '#f39c12',
-        'description': '⬇️ Menor es mejor - Tiempo de inactividad no planificado'
+# Métricas del proceso en http://127.0.0.1:PMI_METRICS_PORT/metrics (Streamlit
+# no permite rutas propias); log JSON si hay PMI_METRICS_LOG
+@st.cache_resource
+def metrics_server():
+    metrics.configure_logging()
+    metrics.REGISTRY.register_collector(
+        metrics.cache_collector({'queries': lambda: data_manager().current.cache})
+    )
+    port = int(os.environ.get('PMI_METRICS_PORT', 9108))
+    try:
+        return metrics.start_http_server(port)
+    except OSError as e:
+        print(f"⚠️  No se pudo abrir el puerto {port} para /metrics: {e}")
+        return None
+
+metrics_server()
+
+
+# Consultas compartidas entre reruns y sesiones (índice de series + cache LRU)
+# sobre el dataset semanal (Parquet tipado si existe, si no CSV). Hay una sola
+# copia del dataset por proceso: st.cache_resource no copia (st.cache_data
+# regresaría una copia por llamada) y las sesiones solo leen vistas (ver
+# schema.py). Cuando el ETL reescribe el dataset (cambian tamaño o fecha de
+# modificación) se carga la versión nueva en segundo plano; las cartas de
+# control solo se recalculan para las series que cambiaron. El dataset diario
+# solo se lee para ajustar el puntaje ajustado (effects.py) y no se guarda.
+def load_engine(previous=None):
+    return QueryEngine(load_processed(WEEKLY), previous=previous,
+                       effects=EffectsModel(load_processed(DAILY)))
+
+
+@st.cache_resource
+def data_manager():
+    return DataManager(load_engine, lambda: dataset_version(WEEKLY), refresh=load_engine)
+
+version, engine = data_manager().snapshot()  # Misma versión durante todo el rerun
+
+
+def finish_rerun():
+    """Registra la duración del rerun (llamar antes de st.stop y al final)."""
+    metrics.observe_callback('streamlit_rerun', time.perf_counter() - rerun_start)
+
+
+def export_download(df_export, fmt, dataset):
+    """Archivo de descarga, midiendo tiempo y tamaño."""
+    start = time.perf_counter()
+    data = export_bytes(df_export, fmt)
+    metrics.observe_callback(f"streamlit_export_{dataset}", time.perf_counter() - start, len(data))
+    return data
+
+
+# ==================== ETAPAS CACHEADAS ====================
+# Cada etapa se memoiza con sus propias entradas más la versión de los datos
+# y se comparte entre sesiones: cambiar el indicador no vuelve a armar las
+# opciones de los filtros y una selección ya vista no vuelve a construir sus
+# gráficas. Filtro y estadísticas ya los memoiza QueryEngine (por filter_key).
+# Los parámetros con "_" (el motor de consultas) no forman parte de la llave.
+
+@st.cache_data(max_entries=4)
+def filter_options(version, _engine):
+    """Opciones de los filtros: coordinadores, operadores (por coordinador), máquinas y weeks."""
+    df = _engine.df
+    pares = df[['Coordinador', 'Operador']].drop_duplicates().astype(str)
+    return {
+        'coordinadores': sorted(pares['Coordinador'].unique().tolist()),
+        'operadores': sorted(pares['Operador'].unique().tolist()),
+        'por_coordinador': {
+            coordinador: sorted(grupo['Operador'].unique().tolist())
+            for coordinador, grupo in pares.groupby('Coordinador')
+        },
+        'maquinas': sorted(df['Maquina'].astype(str).unique().tolist()),
+        'weeks': (int(df['Week'].min()), int(df['Week'].max()))
     }
-}
+
+
+@st.cache_resource(max_entries=64)
+def main_chart(version, operadores, maquinas, indicador, week_range, _engine):
+    """
+    Gráfica de evolución de la selección (colores por operador en orden de
+    selección). Retorna (figura, reducida). Las figuras en cache no se modifican.
+    """
+    start = time.perf_counter()
+    key = filter_key(operadores, maquinas, indicador, week_range)
+    fig = go.Figure()
+
+    # Colores para operadores
+    colors = px.colors.qualitative.Set3
+    color_map = {op: colors[i % len(colors)] for i, op in enumerate(operadores)}
+
+    series = []
+    for operador in operadores:
+        for maquina in maquinas:
+            df_plot = _engine.series(operador, maquina, key)
+            if len(df_plot) > 0:
+                series.append((operador, maquina, df_plot))
+
+    # Con muchas series se reducen los puntos (LTTB) y se usa WebGL
+    frames, reduced = fit_to_budget([df_plot for _, _, df_plot in series])
+    scatter = go.Scattergl if use_webgl(sum(len(df_plot) for df_plot in frames)) else go.Scatter
+
+    for (operador, maquina, _), df_plot in zip(series, frames):
+        fig.add_trace(scatter(
+            x=typed_array(df_plot['Week']),
+            y=typed_array(df_plot['Valor_Promedio']),
+            mode='lines+markers',
+            name=f"{operador} - {maquina}",
+            line=dict(width=2, color=color_map[operador]),
+            marker=dict(size=6),
+            hovertemplate=
+                '<b>%{fullData.name}</b><br>' +
+                'Week: %{x}<br>' +
+                f'{indicador}:' + '%{y:.2f}<br>' +
+                '<extra></extra>'
+        ))
+
+    # Añadir línea de promedio general
+    promedio_total = _engine.summary(key)['promedio_general']
+    fig.add_hline(
+        y=promedio_total,
+        line_dash="dash",
+        line_color="red",
+        annotation_text=f"Promedio General: {promedio_total:.2f}",
+        annotation_position="top right"
+    )
+
+    # Alertas SPC más recientes de la selección
+    alerts = _engine.spc_alerts(key).sort_values('Week', ascending=False, kind='stable')
+    for row in alerts.head(SPC_MAX_ANNOTATIONS).itertuples(index=False):
+        fig.add_annotation(
+            x=row.Week,
+            y=row.Valor,
+            text="⚠",
+            hovertext=f"{row.Operador} - {row.Maquina}: {row.Reglas}",
+            showarrow=True,
+            arrowhead=2,
+            arrowcolor="#e74c3c",
+            ax=0,
+            ay=-25,
+            font=dict(color="#e74c3c", size=14)
+        )
+
+    fig.update_layout(
+        xaxis_title="Week",
+        yaxis_title=f"{INDICATOR_INFO[indicador]['name']}",
+        hovermode='x unified',
+        height=500,
+        showlegend=True,
+        legend=dict(
+            orientation="v",
+            yanchor="top",
+            y=1,
+            xanchor="left",
+            x=1.02
+        )
+    )
+
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage='figure')
+    return fig, reduced
+
+
+@st.cache_resource(max_entries=64)
+def coordinator_chart(version, key, _engine):
+    """Estadísticas por coordinador y su gráfica de barras comparativa."""
+    start = time.perf_counter()
+    coord_stats = _engine.coordinator_stats(key)
+
+    fig_coord = go.Figure()
+    
+    fig_coord.add_trace(go.Bar(
+        x=coord_stats['Coordinador'],
+        y=coord_stats['Promedio'],
+        error_y=dict(type='data', array=coord_stats['Desv_Est']),
+        marker_color=['#3498db', '#e74c3c', '#2ecc71'],
+        text=coord_stats['Promedio'].round(2),
+        textposition='outside'
+    ))
+    
+    fig_coord.update_layout(
+        title=f"Comparación de Coordinadores - {INDICATOR_INFO[key[2]]['name']}",
+        xaxis_title="Coordinador",
+        yaxis_title="Promedio",
+        height=400,
+        showlegend=False
+    )
+
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage='figure')
+    return coord_stats, fig_coord
+
 
 # ==================== SIDEBAR ====================
 st.sidebar.header("🎯 Filtros")
+options = filter_options(version, engine)
 
 # 1. Seleccionar Coordinador
-coordinadores = ['Todos'] + sorted(df['Coordinador'].unique().tolist())
+coordinadores = ['Todos'] + options['coordinadores']
 coordinador_selected = st.sidebar.selectbox(
     "👤 Seleccionar Coordinador (LC)",
     coordinadores,
@@ -69,11 +239,9 @@ coordinador_selected = st.sidebar.selectbox(
 
 # 2. Filtrar operadores según coordinador
 if coordinador_selected == 'Todos':
-    operadores_disponibles = sorted(df['Operador'].unique().tolist())
+    operadores_disponibles = options['operadores']
 else:
-    operadores_disponibles = sorted(
-        df[df['Coordinador'] == coordinador_selected]['Operador'].unique().tolist()
-    )
+    operadores_disponibles = options['por_coordinador'].get(coordinador_selected, [])
 
 operadores_selected = st.sidebar.multiselect(
     "👥 Seleccionar Operadores (puedes elegir varios)",
@@ -82,7 +250,7 @@ operadores_selected = st.sidebar.multiselect(
 )
 
 # 3. Seleccionar Máquinas
-maquinas_disponibles = sorted(df['Maquina'].unique().tolist())
+maquinas_disponibles = options['maquinas']
 maquinas_selected = st.sidebar.multiselect(
     "🏭 Seleccionar Máquinas (puedes elegir varias)",
     maquinas_disponibles,
@@ -100,8 +268,7 @@ indicador_selected = st.sidebar.selectbox(
 st.sidebar.info(INDICATOR_INFO[indicador_selected]['description'])
 
 # 5. Rango de Weeks (opcional)
-week_min = int(df['Week'].min())
-week_max = int(df['Week'].max())
+week_min, week_max = options['weeks']
 week_range = st.sidebar.slider(
     "📅 Rango de Weeks",
     week_min, week_max,
@@ -116,177 +283,94 @@ st.sidebar.write(f"**Máquinas:** {len(maquinas_selected)}")
 st.sidebar.write(f"**Indicador:** {INDICATOR_INFO[indicador_selected]['name']}")
 
 # ==================== FILTRAR DATOS ====================
-df_filtered = df[
-    (df['Operador'].isin(operadores_selected)) &
-    (df['Maquina'].isin(maquinas_selected)) &
-    (df['Indicador'] == indicador_selected) &
-    (df['Week'] >= week_range[0]) &
-    (df['Week'] <= week_range[1])
-].copy()
+query_key = filter_key(operadores_selected, maquinas_selected, indicador_selected, week_range)
+df_filtered = engine.filtered(query_key)
 
 # ==================== VALIDACIONES ====================
 if len(operadores_selected) == 0:
     st.warning("⚠️ Por favor selecciona al menos un operador")
+    finish_rerun()
     st.stop()
 
 if len(maquinas_selected) == 0:
     st.warning("⚠️ Por favor selecciona al menos una máquina")
+    finish_rerun()
     st.stop()
 
 if len(df_filtered) == 0:
     st.error("❌ No hay datos disponibles con los filtros seleccionados")
+    finish_rerun()
     st.stop()
 
 # ==================== MÉTRICAS PRINCIPALES ====================
 col1, col2, col3, col4 = st.columns(4)
+summary = engine.summary(query_key)
 
 with col1:
-    total_registros = len(df_filtered)
-    st.metric("📊 Registros Totales", f"{total_registros:,}")
+    st.metric("📊 Registros Totales", f"{summary['total_registros']:,}")
 
 with col2:
-    weeks_analizadas = df_filtered['Week'].nunique()
-    st.metric("📅 Weeks Analizadas", weeks_analizadas)
+    st.metric("📅 Weeks Analizadas", summary['weeks_analizadas'])
 
 with col3:
-    promedio_general = df_filtered['Valor_Promedio'].mean()
-    st.metric(f"📈 Promedio General", f"{promedio_general:.2f}")
+    st.metric(f"📈 Promedio General", f"{summary['promedio_general']:.2f}")
 
 with col4:
-    mejor_performance = df_filtered['Valor_Promedio'].min() if INDICATOR_INFO[indicador_selected]['better'] == 'lower' else df_filtered['Valor_Promedio'].max()
-    st.metric(f"🏆 Mejor Performance", f"{mejor_performance:.2f}")
+    st.metric(f"🏆 Mejor Performance", f"{summary['mejor_performance']:.2f}")
 
 st.markdown("---")
 
 # ==================== GRÁFICA PRINCIPAL: EVOLUCIÓN TEMPORAL ====================
 st.subheader(f"📈 Evolución Temporal - {INDICATOR_INFO[indicador_selected]['name']}")
 
-# Crear figura con Plotly
-fig = go.Figure()
-
-# Colores para operadores
-colors = px.colors.qualitative.Set3
-color_map = {op: colors[i % len(colors)] for i, op in enumerate(operadores_selected)}
-
-for operador in operadores_selected:
-    for maquina in maquinas_selected:
-        df_plot = df_filtered[
-            (df_filtered['Operador'] == operador) &
-            (df_filtered['Maquina'] == maquina)
-        ].sort_values('Week')
-        
-        if len(df_plot) > 0:
-            fig.add_trace(go.Scatter(
-                x=df_plot['Week'],
-                y=df_plot['Valor_Promedio'],
-                mode='lines+markers',
-                name=f"{operador} - {maquina}",
-                line=dict(width=2, color=color_map[operador]),
-                marker=dict(size=6),
-                hovertemplate=
-                    '<b>%{fullData.name}</b><br>' +
-                    'Week: %{x}<br>' +
-                    f'{indicador_selected}:' + '%{y:.2f}<br>' +
-                    '<extra></extra>'
-            ))
-
-# Añadir línea de promedio general
-promedio_total = df_filtered['Valor_Promedio'].mean()
-fig.add_hline(
-    y=promedio_total,
-    line_dash="dash",
-    line_color="red",
-    annotation_text=f"Promedio General: {promedio_total:.2f}",
-    annotation_position="top right"
-)
-
-fig.update_layout(
-    xaxis_title="Week",
-    yaxis_title=f"{INDICATOR_INFO[indicador_selected]['name']}",
-    hovermode='x unified',
-    height=500,
-    showlegend=True,
-    legend=dict(
-        orientation="v",
-        yanchor="top",
-        y=1,
-        xanchor="left",
-        x=1.02
-    )
-)
-
+fig, reduced = main_chart(version, tuple(operadores_selected), tuple(maquinas_selected),
+                          indicador_selected, tuple(week_range), engine)
 st.plotly_chart(fig, use_container_width=True)
+if reduced:
+    st.caption("ℹ️ Gráfica simplificada para no pasar del límite de puntos; acota el rango de weeks para ver todo el detalle.")
 
 # ==================== TABLA COMPARATIVA ====================
 st.markdown("---")
 st.subheader("📋 Tabla Comparativa de Performance")
 
-# Calcular estadísticas por operador y máquina
-stats_table = df_filtered.groupby(['Coordinador', 'Operador', 'Maquina']).agg({
-    'Valor_Promedio': ['mean', 'min', 'max', 'std', 'count']
-}).round(2)
-
-stats_table.columns = ['Promedio', 'Mínimo', 'Máximo', 'Desv. Est.', 'Weeks']
-stats_table = stats_table.reset_index()
+# Estadísticas por operador y máquina, ordenadas y con ranking (mejor performance primero)
+stats_table = engine.stats_table(query_key)
 
-# Ordenar según el indicador (mejor performance primero)
-if INDICATOR_INFO[indicador_selected]['better'] == 'lower':
-    stats_table = stats_table.sort_values('Promedio', ascending=True)
-else:
-    stats_table = stats_table.sort_values('Promedio', ascending=False)
+st.dataframe(stats_table, use_container_width=True, height=400)
+if ADJUSTED_COLUMN in stats_table:
+    st.caption(ADJUSTED_NOTE)
 
-# Añadir ranking
-stats_table.insert(0, 'Ranking', range(1, len(stats_table) + 1))
+# ==================== ALERTAS SPC ====================
+st.markdown("---")
+st.subheader("🚨 Alertas SPC")
+st.caption("Puntos fuera de control en la dirección adversa del indicador "
+           "(límites de 3σ, reglas de Western Electric/Nelson, EWMA y CUSUM).")
 
-st.dataframe(stats_table, use_container_width=True, height=400)
+spc_alerts = engine.spc_alerts(query_key).sort_values('Week', ascending=False, kind='stable')
+if len(spc_alerts) == 0:
+    st.success("✅ Sin alertas en la selección")
+else:
+    st.dataframe(spc_alerts[ALERT_COLUMNS], use_container_width=True, hide_index=True, height=300)
 
 # ==================== RESUMEN POR COORDINADOR ====================
 st.markdown("---")
 st.subheader("🎯 Resumen por Coordinador (LC)")
 
-# Filtrar por todos los coordinadores disponibles en los datos filtrados
-coordinadores_en_datos = df_filtered['Coordinador'].unique()
+coord_stats, fig_coord = coordinator_chart(version, query_key, engine)
 
 col1, col2 = st.columns([2, 1])
 
 with col1:
-    # Crear gráfica de barras comparativa
-    coord_stats = df_filtered.groupby('Coordinador')['Valor_Promedio'].agg(['mean', 'std']).reset_index()
-    coord_stats.columns = ['Coordinador', 'Promedio', 'Desv_Est']
-    
-    fig_coord = go.Figure()
-    
-    fig_coord.add_trace(go.Bar(
-        x=coord_stats['Coordinador'],
-        y=coord_stats['Promedio'],
-        error_y=dict(type='data', array=coord_stats['Desv_Est']),
-        marker_color=['#3498db', '#e74c3c', '#2ecc71'],
-        text=coord_stats['Promedio'].round(2),
-        textposition='outside'
-    ))
-    
-    fig_coord.update_layout(
-        title=f"Comparación de Coordinadores - {INDICATOR_INFO[indicador_selected]['name']}",
-        xaxis_title="Coordinador",
-        yaxis_title="Promedio",
-        height=400,
-        showlegend=False
-    )
-    
     st.plotly_chart(fig_coord, use_container_width=True)
 
 with col2:
     st.markdown("#### 📊 Estadísticas")
-    for coord in coordinadores_en_datos:
-        df_coord = df_filtered[df_filtered['Coordinador'] == coord]
-        promedio = df_coord['Valor_Promedio'].mean()
-        operadores_count = df_coord['Operador'].nunique()
-        
+    for row in coord_stats.itertuples(index=False):
         st.markdown(f"""
-        **{coord}**
-        - Promedio: `{promedio:.2f}`
-        - Operadores: `{operadores_count}`
-        - Registros: `{len(df_coord)}`
+        **{row.Coordinador}**
+        - Promedio: `{row.Promedio:.2f}`
+        - Operadores: `{row.Operadores}`
+        - Registros: `{row.Registros}`
         """)
         st.markdown("---")
 
@@ -294,27 +378,47 @@ with col2:
 st.markdown("---")
 st.subheader("💾 Exportar Datos")
 
-col1, col2 = st.columns(2)
 
-with col1:
-    # Exportar datos filtrados
-    csv = df_filtered.to_csv(index=False).encode('utf-8')
-    st.download_button(
-        label="📥 Descargar Datos Filtrados (CSV)",
-        data=csv,
-        file_name=f"performance_{indicador_selected}_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
-        mime="text/csv"
+@st.fragment
+def export_section(df_filtered, stats_table, indicador):
+    """
+    Formato y botones de descarga. Es un fragmento: cambiar el formato solo
+    vuelve a ejecutar esta sección, no todo el script.
+    """
+    start = time.perf_counter()
+    formato = st.radio(
+        "Formato",
+        available_formats(),
+        format_func=lambda fmt: EXPORT_FORMATS[fmt]['label'],
+        horizontal=True
     )
 
-with col2:
-    # Exportar tabla resumen
-    csv_stats = stats_table.to_csv(index=False).encode('utf-8')
-    st.download_button(
-        label="📥 Descargar Tabla Resumen (CSV)",
-        data=csv_stats,
-        file_name=f"resumen_{indicador_selected}_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
-        mime="text/csv"
-    )
+    # `data` es una función: el archivo se genera solo cuando se hace clic (sin rerun)
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Exportar datos filtrados
+        st.download_button(
+            label="📥 Descargar Datos Filtrados",
+            data=lambda: export_download(df_filtered, formato, 'filtered'),
+            file_name=export_filename(f"performance_{indicador}", formato),
+            mime=EXPORT_FORMATS[formato]['mime'],
+            on_click='ignore'
+        )
+
+    with col2:
+        # Exportar tabla resumen
+        st.download_button(
+            label="📥 Descargar Tabla Resumen",
+            data=lambda: export_download(stats_table, formato, 'summary'),
+            file_name=export_filename(f"resumen_{indicador}", formato),
+            mime=EXPORT_FORMATS[formato]['mime'],
+            on_click='ignore'
+        )
+    metrics.observe_callback('streamlit_export_section', time.perf_counter() - start)
+
+
+export_section(df_filtered, stats_table, indicador_selected)
 
 # Footer
 st.markdown("---")
@@ -323,4 +427,6 @@ st.info("""
 - **Promedio Semanal**: Calculado promediando todos los turnos (S1, S2, S3) de cada semana
 - **Week 2**: Inicia el 6 de enero de 2025
 - **Datos**: Del 13 de enero al 19 de octubre de 2025 (Week 3 a Week 42)
-""")
\ No newline at end of file
+""")
+
+finish_rerun()
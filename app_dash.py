@@ -1,10 +1,32 @@
 import dash
-from dash import dcc, html, Input, Output, State, dash_table
+from dash import dcc, html, Input, Output, State, Patch, ClientsideFunction, dash_table
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 import plotly.express as px
+import plotly.io as pio
 import pandas as pd
 import numpy as np
-from datetime import datetime
+import os
+import time
+
+from flask import Response, abort, g, has_request_context, request, stream_with_context
+
+from callback_cache import CallbackCache, SQLiteTier
+from data_manager import DATA_POLL_SECONDS, DataManager
+from downsample import CHART_POINT_BUDGET, fit_to_budget, use_webgl
+from drilldown import DRILLDOWN_COLUMNS, DailyIndex, page_records
+import effects
+from exports import EXPORT_FORMATS, available_formats, export_filename, iter_export
+import metrics
+from payload import typed_array
+from queries import INDICATOR_INFO, STATS_COLUMNS, QueryEngine, filter_key
+from schema import enable_copy_on_write
+from spc import ALERT_COLUMNS, RULES, SPC_MAX_ANNOTATIONS
+from trend import TREND_COLUMNS
+from storage import DAILY, WEEKLY, dataset_version, load_processed
+
+# Los callbacks comparten el dataset: escribir sobre un resultado nunca lo modifica
+enable_copy_on_write()
 
 # Inicializar la app
 app = dash.Dash(
@@ -13,39 +35,59 @@ app = dash.Dash(
     update_title="Cargando...",
     suppress_callback_exceptions=True
 )
+# Servidor Flask para WSGI (ver wsgi.py)
+server = app.server
 
-# Cargar datos
-df = pd.read_csv('data_weekly_processed.csv')
-df['Fecha_Inicio'] = pd.to_datetime(df['Fecha_Inicio'])
-df['Fecha_Fin'] = pd.to_datetime(df['Fecha_Fin'])
-
-# Información de indicadores
-INDICATOR_INFO = {
-    'MTBF': {
-        'name': 'MTBF (Mean Time Between Failures)',
-        'better': 'higher',
-        'color': '#2ecc71',
-        'description': '⬆️ Mayor es mejor - Tiempo promedio entre fallas'
-    },
-    'Reject_Rate': {
-        'name': 'Reject Rate',
-        'better': 'lower',
-        'color': '#e74c3c',
-        'description': '⬇️ Menor es mejor - Porcentaje de productos rechazados'
-    },
-    'Strategic_PR': {
-        'name': 'Strategic PR (Production Rate)',
-        'better': 'higher',
-        'color': '#3498db',
-        'description': '⬆️ Mayor es mejor - Tasa de producción estratégica'
-    },
-    'UPDT': {
-        'name': 'UPDT (Unplanned Downtime)',
-        'better': 'lower',
-        'color': '#f39c12',
-        'description': '⬇️ Menor es mejor - Tiempo de inactividad no planificado'
-    }
-}
+
+class DashboardData:
+    """Una versión de los datos del dashboard: datasets, consultas e índices."""
+
+    def __init__(self, previous=None):
+        # Cargar datos (Parquet tipado si existe, si no CSV)
+        self.df = load_processed(WEEKLY)
+        self.df_daily = load_processed(DAILY)
+
+        # Consultas (filtro por índice de series + cache LRU de resultados);
+        # al recargar, las cartas de control reutilizan la versión anterior.
+        # El puntaje ajustado sale del modelo de efectos sobre el dataset diario
+        self.engine = QueryEngine(self.df, previous=previous.engine if previous else None,
+                                  effects=effects.EffectsModel(self.df_daily))
+
+        # Detalle por turno: índice (Maquina, Indicador, Fecha) sobre el dataset diario
+        self.daily_index = DailyIndex(self.df_daily)
+
+        # Rango completo de weeks: el servidor manda las series completas y el
+        # navegador las recorta al rango del slider
+        self.week_range = [int(self.df['Week'].min()), int(self.df['Week'].max())]
+
+        # Opciones de los filtros
+        self.coordinadores = sorted(self.df['Coordinador'].unique())
+        self.maquinas = sorted(self.df['Maquina'].unique())
+
+
+def current_data_version():
+    """Versión en disco de los dos datasets que usa el dashboard."""
+    return dataset_version(WEEKLY) + '|' + dataset_version(DAILY)
+
+
+# Versión activa de los datos; se recarga sola cuando el ETL reescribe los archivos
+data = DataManager(DashboardData, current_data_version, refresh=DashboardData)
+
+# /metrics accesible desde otros hosts (por defecto solo local)
+METRICS_PUBLIC = os.environ.get('PMI_METRICS_PUBLIC', '') == '1'
+
+# Resultados de callbacks compartidos entre workers (memoria + SQLite local),
+# ligados a la versión del dataset cargado
+callback_cache = CallbackCache.from_env(version=data.version)
+data.on_swap(lambda version, _: setattr(callback_cache, 'version', version))
+
+# Métricas de latencia y cache (ruta /metrics; log JSON si hay PMI_METRICS_LOG)
+metrics.configure_logging()
+metrics.REGISTRY.register_collector(metrics.cache_collector({
+    'callback': callback_cache,
+    **{'callback_sqlite': tier for tier in callback_cache.tiers if isinstance(tier, SQLiteTier)},
+    'queries': lambda: data.current.engine.cache
+}))
 
 # Configuración de colores
 COLORS = {
@@ -60,7 +102,168 @@ COLORS = {
     'warning': '#f39c12'
 }
 
+# Enlaces de descarga con la apariencia de los botones
+EXPORT_LINK_STYLE = {
+    'color': 'white',
+    'padding': '10px 20px',
+    'borderRadius': '5px',
+    'marginRight': '10px',
+    'fontSize': '14px',
+    'textDecoration': 'none',
+    'display': 'inline-block'
+}
+
+# ==================== COMPONENTES FIJOS ====================
+# Métricas, tabla comparativa y gráfica de coordinadores se arman vacías en el
+# layout; update_week_range_stats llena sus valores con cada rango de weeks.
+
+def metric_card(icon, label, value_id, value_color, last=False):
+    """Tarjeta de una métrica principal (el valor lo escribe update_week_range_stats)."""
+    style = {
+        'width': '23%',
+        'display': 'inline-block',
+        'backgroundColor': COLORS['card'],
+        'padding': '20px',
+        'borderRadius': '10px',
+        'textAlign': 'center',
+        'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
+    }
+    if not last:
+        style['marginRight'] = '2%'
+    return html.Div([
+        html.Div(icon, style={'fontSize': '30px', 'marginBottom': '5px'}),
+        html.Div(label, style={'fontSize': '12px', 'color': '#7f8c8d'}),
+        html.Div(id=value_id, style={'fontSize': '24px', 'fontWeight': 'bold', 'color': value_color})
+    ], style=style)
+
+
+def build_metrics():
+    """Tarjetas de métricas principales."""
+    return html.Div([
+        metric_card("📊", "Registros Totales", 'metric-registros', COLORS['text']),
+        metric_card("📅", "Weeks Analizadas", 'metric-weeks', COLORS['text']),
+        metric_card("📈", "Promedio General", 'metric-promedio', COLORS['text']),
+        metric_card("🏆", "Mejor Performance", 'metric-mejor', COLORS['success'], last=True)
+    ])
+
+
+def build_comparison_table():
+    """Tabla comparativa con ranking."""
+    table_component = dash_table.DataTable(
+        id='comparison-datatable',
+        data=[],
+        columns=[{'name': col, 'id': col}
+                 for col in ['Ranking', 'Coordinador', 'Operador', 'Maquina'] + STATS_COLUMNS + TREND_COLUMNS
+                 + ([effects.ADJUSTED_COLUMN] if effects.available() else [])],
+        style_table={'overflowX': 'auto'},
+        style_cell={
+            'textAlign': 'left',
+            'padding': '10px',
+            'fontSize': '13px'
+        },
+        style_header={
+            'backgroundColor': COLORS['primary'],
+            'color': 'white',
+            'fontWeight': 'bold',
+            'textAlign': 'center'
+        },
+        style_data_conditional=[
+            {
+                'if': {'row_index': 0},
+                'backgroundColor': '#d4edda',
+                'fontWeight': 'bold'
+            }
+        ],
+        page_size=15
+    )
+    return table_component
+
+
+def build_alerts_table():
+    """Tabla de alertas de control estadístico (SPC) de la selección."""
+    return dash_table.DataTable(
+        id='spc-alerts-table',
+        data=[],
+        columns=[{'name': col.replace('_', ' '), 'id': col} for col in ALERT_COLUMNS],
+        sort_action='native',
+        style_table={'overflowX': 'auto'},
+        style_cell={
+            'textAlign': 'left',
+            'padding': '8px',
+            'fontSize': '13px'
+        },
+        style_header={
+            'backgroundColor': COLORS['danger'],
+            'color': 'white',
+            'fontWeight': 'bold',
+            'textAlign': 'center'
+        },
+        page_size=10
+    )
+
+
+def build_coordinator_chart():
+    """Gráfica de comparación de coordinadores (barras de promedio con desviación estándar)."""
+    fig_coord = go.Figure()
+    
+    fig_coord.add_trace(go.Bar(
+        x=[],
+        y=[],
+        error_y=dict(type='data', array=[]),
+        textposition='outside'
+    ))
+    
+    fig_coord.update_layout(
+        xaxis_title="Coordinador",
+        yaxis_title="Promedio",
+        showlegend=False,
+        template='plotly_white'
+    )
+    return fig_coord
+
+
+def patch_coordinator_chart(coord_stats, indicador):
+    """Barras de la gráfica de coordinadores con las estadísticas de la ventana."""
+    colors = [COLORS['primary'], COLORS['danger'], COLORS['success']]
+    patch = Patch()
+    patch['data'][0]['x'] = coord_stats['Coordinador'].astype(str).tolist()
+    patch['data'][0]['y'] = coord_stats['Promedio'].tolist()
+    patch['data'][0]['error_y']['array'] = coord_stats['Desv_Est'].tolist()
+    patch['data'][0]['text'] = coord_stats['Promedio'].round(2).tolist()
+    patch['data'][0]['marker']['color'] = [colors[i % len(colors)] for i in range(len(coord_stats))]
+    patch['layout']['title']['text'] = (
+        f"Comparación de Coordinadores - {INDICATOR_INFO[indicador]['name']}" if indicador else ''
+    )
+    return patch
+
+
+def build_coordinator_stats(coord_stats):
+    """Resumen por coordinador (promedio, operadores y registros)."""
+    coord_stats_div = []
+    
+    for row in coord_stats.itertuples(index=False):
+        coord_stats_div.append(
+            html.Div([
+                html.H5(row.Coordinador, style={'color': COLORS['text'], 'marginBottom': '10px'}),
+                html.P(f"Promedio: {row.Promedio:.2f}", style={'margin': '5px 0'}),
+                html.P(f"Operadores: {row.Operadores}", style={'margin': '5px 0'}),
+                html.P(f"Registros: {row.Registros}", style={'margin': '5px 0'}),
+                html.Hr(style={'borderColor': COLORS['border'], 'margin': '15px 0'})
+            ])
+        )
+    return html.Div(coord_stats_div)
+
+
+def week_marks(week_range):
+    """Marcas del slider de weeks (cada 5)."""
+    return {i: str(i) for i in range(week_range[0], week_range[1] + 1, 5)}
+
+
 # ==================== LAYOUT ====================
+# Las opciones se arman con la versión de los datos al iniciar; si después
+# llega una versión nueva, refresh_filters las actualiza en el navegador.
+initial = data.current
+
 app.layout = html.Div([
     # Header
     html.Div([
@@ -90,7 +293,7 @@ app.layout = html.Div([
             dcc.Dropdown(
                 id='coordinador-dropdown',
                 options=[{'label': 'Todos', 'value': 'Todos'}] + 
-                        [{'label': c, 'value': c} for c in sorted(df['Coordinador'].unique())],
+                        [{'label': c, 'value': c} for c in initial.coordinadores],
                 value='Todos',
                 style={'marginBottom': '20px'}
             ),
@@ -107,8 +310,8 @@ app.layout = html.Div([
             html.Label("🏭 Seleccionar Máquinas", style={'color': 'white', 'fontWeight': 'bold'}),
             dcc.Dropdown(
                 id='maquinas-dropdown',
-                options=[{'label': m, 'value': m} for m in sorted(df['Maquina'].unique())],
-                value=sorted(df['Maquina'].unique())[:2],
+                options=[{'label': m, 'value': m} for m in initial.maquinas],
+                value=initial.maquinas[:2],
                 multi=True,
                 style={'marginBottom': '20px'}
             ),
@@ -138,10 +341,10 @@ app.layout = html.Div([
             html.Label("📅 Rango de Weeks", style={'color': 'white', 'fontWeight': 'bold'}),
             dcc.RangeSlider(
                 id='week-range-slider',
-                min=int(df['Week'].min()),
-                max=int(df['Week'].max()),
-                value=[int(df['Week'].min()), int(df['Week'].max())],
-                marks={i: str(i) for i in range(int(df['Week'].min()), int(df['Week'].max())+1, 5)},
+                min=initial.week_range[0],
+                max=initial.week_range[1],
+                value=initial.week_range,
+                marks=week_marks(initial.week_range),
                 tooltip={"placement": "bottom", "always_visible": True},
                 allowCross=False
             ),
@@ -166,8 +369,28 @@ app.layout = html.Div([
         
         # Main Content
         html.Div([
+            # Versión de los datos que muestra esta página (revisada cada DATA_POLL_SECONDS)
+            dcc.Store(id='data-version', data=data.version),
+            dcc.Interval(id='data-version-interval', interval=max(DATA_POLL_SECONDS, 1) * 1000,
+                         disabled=DATA_POLL_SECONDS <= 0),
+            
+            # Estado de la última actualización (para enviar solo lo que cambió)
+            dcc.Store(id='main-content-state'),
+            # Series de la selección en formato columnar (ver assets/clientside.js)
+            dcc.Store(id='series-store'),
+            # Ventana visible tras un zoom en la gráfica principal ({indicador, range})
+            dcc.Store(id='chart-window'),
+            # Datos fijos que usan los callbacks del navegador
+            dcc.Store(id='dashboard-config', data={
+                'indicators': INDICATOR_INFO,
+                'colors': COLORS,
+                'point_budget': CHART_POINT_BUDGET,
+                'spc_rules': [label for _, label in RULES],
+                'spc_max_annotations': SPC_MAX_ANNOTATIONS
+            }),
+            
             # Métricas principales
-            html.Div(id='main-metrics', style={'marginBottom': '30px'}),
+            html.Div(build_metrics(), id='main-metrics', style={'marginBottom': '30px'}),
             
             # Gráfica principal
             html.Div([
@@ -186,7 +409,75 @@ app.layout = html.Div([
             html.Div([
                 html.H3("📋 Tabla Comparativa de Performance", 
                        style={'color': COLORS['text'], 'marginBottom': '20px'}),
-                html.Div(id='comparison-table')
+                html.Div(build_comparison_table(), id='comparison-table'),
+                html.P(effects.ADJUSTED_NOTE if effects.available() else None,
+                       style={'fontSize': '13px', 'color': '#7f8c8d', 'marginTop': '10px'})
+            ], style={
+                'backgroundColor': COLORS['card'],
+                'padding': '20px',
+                'borderRadius': '10px',
+                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
+                'marginBottom': '30px'
+            }),
+            
+            # Alertas de control estadístico (calculadas al cargar los datos)
+            html.Div([
+                html.H3("🚨 Alertas SPC", 
+                       style={'color': COLORS['text'], 'marginBottom': '10px'}),
+                html.P("Puntos fuera de control en la dirección adversa del indicador "
+                       "(límites de 3σ, reglas de Western Electric/Nelson, EWMA y CUSUM).",
+                       style={'fontSize': '13px', 'color': '#7f8c8d'}),
+                build_alerts_table()
+            ], style={
+                'backgroundColor': COLORS['card'],
+                'padding': '20px',
+                'borderRadius': '10px',
+                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
+                'marginBottom': '30px'
+            }),
+            
+            # Detalle por turno (paginado en el servidor)
+            html.Div([
+                html.H3("🔎 Detalle por Turno", 
+                       style={'color': COLORS['text'], 'marginBottom': '10px'}),
+                html.Div([
+                    html.Span(id='drilldown-label', style={'fontSize': '13px', 'color': '#7f8c8d', 'marginRight': '10px'}),
+                    html.Button("Ver toda la selección", id='btn-drilldown-clear', n_clicks=0,
+                               style={
+                                   'backgroundColor': 'white',
+                                   'color': COLORS['primary'],
+                                   'border': f"1px solid {COLORS['primary']}",
+                                   'padding': '4px 10px',
+                                   'borderRadius': '5px',
+                                   'cursor': 'pointer',
+                                   'fontSize': '12px'
+                               })
+                ], style={'marginBottom': '15px'}),
+                dcc.Store(id='drilldown-selection'),
+                dash_table.DataTable(
+                    id='drilldown-table',
+                    columns=[{'name': col, 'id': col} for col in DRILLDOWN_COLUMNS],
+                    page_current=0,
+                    page_size=20,
+                    page_action='custom',
+                    sort_action='custom',
+                    sort_mode='multi',
+                    sort_by=[],
+                    filter_action='custom',
+                    filter_query='',
+                    style_table={'overflowX': 'auto'},
+                    style_cell={
+                        'textAlign': 'left',
+                        'padding': '8px',
+                        'fontSize': '13px'
+                    },
+                    style_header={
+                        'backgroundColor': COLORS['primary'],
+                        'color': 'white',
+                        'fontWeight': 'bold',
+                        'textAlign': 'center'
+                    }
+                )
             ], style={
                 'backgroundColor': COLORS['card'],
                 'padding': '20px',
@@ -201,7 +492,7 @@ app.layout = html.Div([
                        style={'color': COLORS['text'], 'marginBottom': '20px'}),
                 html.Div([
                     html.Div([
-                        dcc.Graph(id='coordinador-chart')
+                        dcc.Graph(id='coordinador-chart', figure=build_coordinator_chart())
                     ], style={'width': '65%', 'display': 'inline-block', 'verticalAlign': 'top'}),
                     
                     html.Div([
@@ -222,37 +513,29 @@ app.layout = html.Div([
                 'marginBottom': '30px'
             }),
             
-            # Botones de descarga
+            # Descargas: enlaces a /export/<dataset>, que genera el archivo por bloques
             html.Div([
                 html.H3("💾 Exportar Datos", 
                        style={'color': COLORS['text'], 'marginBottom': '20px'}),
+                dcc.RadioItems(
+                    id='export-format',
+                    options=[{'label': EXPORT_FORMATS[fmt]['label'], 'value': fmt}
+                             for fmt in available_formats()],
+                    value='csv',
+                    inline=True,
+                    inputStyle={'marginRight': '5px', 'marginLeft': '15px'},
+                    style={'marginBottom': '15px', 'color': COLORS['text']}
+                ),
                 html.Div([
-                    html.Button("📥 Descargar Datos Filtrados (CSV)", 
-                               id='btn-download-filtered',
-                               style={
-                                   'backgroundColor': COLORS['primary'],
-                                   'color': 'white',
-                                   'border': 'none',
-                                   'padding': '10px 20px',
-                                   'borderRadius': '5px',
-                                   'cursor': 'pointer',
-                                   'marginRight': '10px',
-                                   'fontSize': '14px'
-                               }),
-                    dcc.Download(id="download-filtered-data"),
-                    
-                    html.Button("📥 Descargar Tabla Resumen (CSV)", 
-                               id='btn-download-summary',
-                               style={
-                                   'backgroundColor': COLORS['success'],
-                                   'color': 'white',
-                                   'border': 'none',
-                                   'padding': '10px 20px',
-                                   'borderRadius': '5px',
-                                   'cursor': 'pointer',
-                                   'fontSize': '14px'
-                               }),
-                    dcc.Download(id="download-summary-data")
+                    html.A("📥 Descargar Datos Filtrados", 
+                           id='link-download-filtered',
+                           style={**EXPORT_LINK_STYLE, 'backgroundColor': COLORS['primary']}),
+                    html.A("📥 Descargar Tabla Resumen", 
+                           id='link-download-summary',
+                           style={**EXPORT_LINK_STYLE, 'backgroundColor': COLORS['success']}),
+                    html.A("📥 Descargar Datos por Turno", 
+                           id='link-download-daily',
+                           style={**EXPORT_LINK_STYLE, 'backgroundColor': COLORS['warning']})
                 ])
             ], style={
                 'backgroundColor': COLORS['card'],
@@ -286,201 +569,232 @@ app.layout = html.Div([
     ])
 ])
 
+# Sin esta referencia, la versión inicial se libera cuando llega la siguiente
+del initial
+
 # ==================== CALLBACKS ====================
 
+def record_callback(callback_id, seconds):
+    """
+    Guarda la duración del callback; el tamaño de la respuesta y el tiempo de
+    serialización se miden al salir la respuesta (record_response).
+    """
+    if has_request_context():
+        g.pmi_callback = (callback_id, seconds)
+    else:
+        metrics.observe_callback(callback_id, seconds)
+
+
+def instrument(callback_id):
+    """Mide la duración del callback (incluye los hits de callback_cache)."""
+    return metrics.instrument(callback_id, on_finish=record_callback)
+
+
+@server.before_request
+def start_request_timer():
+    g.pmi_request_start = time.perf_counter()
+
+
+@server.after_request
+def record_response(response):
+    """Latencia, serialización y tamaño de la respuesta de cada callback."""
+    if 'pmi_callback' in g and not response.is_streamed:
+        callback_id, seconds = g.pmi_callback
+        total = time.perf_counter() - g.pmi_request_start
+        metrics.STAGE_SECONDS.observe(max(total - seconds, 0.0), stage='serialize')
+        metrics.observe_callback(callback_id, seconds, response.content_length or 0,
+                                 status=response.status_code, request_seconds=round(total, 6))
+    return response
+
+
 # Callback 1: Actualizar operadores según coordinador
 @app.callback(
     Output('operadores-dropdown', 'options'),
     Output('operadores-dropdown', 'value'),
     Input('coordinador-dropdown', 'value')
 )
+@instrument('update_operadores')
+@callback_cache.memoize('update_operadores')
 def update_operadores(coordinador):
-    if coordinador == 'Todos':
-        operadores = sorted(df['Operador'].unique())
-    else:
-        operadores = sorted(df[df['Coordinador'] == coordinador]['Operador'].unique())
+    operadores = operator_options(data.current.df, coordinador)
     
     options = [{'label': op, 'value': op} for op in operadores]
     default_value = operadores[:2] if len(operadores) >= 2 else operadores
     
     return options, default_value
 
-# Callback 2: Actualizar descripción del indicador
+
+def operator_options(df, coordinador):
+    """Operadores del coordinador (todos si es 'Todos')."""
+    if coordinador == 'Todos':
+        return sorted(df['Operador'].unique())
+    return sorted(df[df['Coordinador'] == coordinador]['Operador'].unique())
+
+
+# Callback 1b: Versión nueva de los datos → opciones de los filtros
 @app.callback(
+    Output('data-version', 'data'),
+    Output('coordinador-dropdown', 'options'),
+    Output('coordinador-dropdown', 'value'),
+    Output('operadores-dropdown', 'options', allow_duplicate=True),
+    Output('operadores-dropdown', 'value', allow_duplicate=True),
+    Output('maquinas-dropdown', 'options'),
+    Output('maquinas-dropdown', 'value'),
+    Output('week-range-slider', 'min'),
+    Output('week-range-slider', 'max'),
+    Output('week-range-slider', 'marks'),
+    Output('week-range-slider', 'value'),
+    Input('data-version-interval', 'n_intervals'),
+    State('data-version', 'data'),
+    State('coordinador-dropdown', 'value'),
+    State('operadores-dropdown', 'value'),
+    State('maquinas-dropdown', 'value'),
+    State('week-range-slider', 'value'),
+    State('week-range-slider', 'max'),
+    prevent_initial_call=True
+)
+@instrument('refresh_filters')
+def refresh_filters(n_intervals, client_version, coordinador, operadores, maquinas, week_range, week_max):
+    """
+    Si el servidor ya tiene otra versión de los datos, actualiza las opciones
+    de los filtros conservando la selección que siga existiendo. Un rango de
+    weeks que llegaba hasta la última week se extiende a la nueva última week.
+    Los callbacks con data-version como entrada se vuelven a calcular.
+    """
+    current = data.current
+    if data.version == client_version:
+        raise PreventUpdate
+    
+    if coordinador not in current.coordinadores:
+        coordinador = 'Todos'
+    operadores_validos = operator_options(current.df, coordinador)
+    operadores = [op for op in operadores or [] if op in set(operadores_validos)]
+    maquinas = [m for m in maquinas or [] if m in set(current.maquinas)]
+    
+    week_min, new_max = current.week_range
+    start, stop = week_range or current.week_range
+    stop = new_max if stop == week_max else min(stop, new_max)
+    start = min(max(start, week_min), stop)
+    
+    return (
+        data.version,
+        [{'label': 'Todos', 'value': 'Todos'}] + [{'label': c, 'value': c} for c in current.coordinadores],
+        coordinador,
+        [{'label': op, 'value': op} for op in operadores_validos],
+        operadores,
+        [{'label': m, 'value': m} for m in current.maquinas],
+        maquinas,
+        week_min,
+        new_max,
+        week_marks(current.week_range),
+        [start, stop]
+    )
+
+# Callback 2: Actualizar descripción del indicador (en el navegador)
+app.clientside_callback(
+    ClientsideFunction(namespace='pmi', function_name='indicator_description'),
     Output('indicador-description', 'children'),
-    Input('indicador-dropdown', 'value')
+    Input('indicador-dropdown', 'value'),
+    State('dashboard-config', 'data')
 )
-def update_indicator_description(indicador):
-    return INDICATOR_INFO[indicador]['description']
 
-# Callback 3: Actualizar resumen de filtros
-@app.callback(
+# Callback 3: Actualizar resumen de filtros (en el navegador)
+app.clientside_callback(
+    ClientsideFunction(namespace='pmi', function_name='filter_summary'),
     Output('filter-summary', 'children'),
     Input('coordinador-dropdown', 'value'),
     Input('operadores-dropdown', 'value'),
     Input('maquinas-dropdown', 'value'),
-    Input('indicador-dropdown', 'value')
-)
-def update_filter_summary(coordinador, operadores, maquinas, indicador):
-    return html.Div([
-        html.P(f"Coordinador: {coordinador}", style={'marginBottom': '5px'}),
-        html.P(f"Operadores: {len(operadores) if operadores else 0}", style={'marginBottom': '5px'}),
-        html.P(f"Máquinas: {len(maquinas) if maquinas else 0}", style={'marginBottom': '5px'}),
-        html.P(f"Indicador: {INDICATOR_INFO[indicador]['name']}", style={'marginBottom': '5px'})
-    ])
-
-# Callback 4: Actualizar todos los componentes principales
-@app.callback(
-    Output('main-metrics', 'children'),
-    Output('main-chart', 'figure'),
-    Output('comparison-table', 'children'),
-    Output('coordinador-chart', 'figure'),
-    Output('coordinador-stats', 'children'),
-    Input('operadores-dropdown', 'value'),
-    Input('maquinas-dropdown', 'value'),
     Input('indicador-dropdown', 'value'),
-    Input('week-range-slider', 'value')
+    State('dashboard-config', 'data')
 )
-def update_main_content(operadores, maquinas, indicador, week_range):
-    # Validaciones
-    if not operadores or not maquinas:
-        empty_fig = go.Figure()
-        empty_fig.add_annotation(
-            text="Por favor selecciona al menos un operador y una máquina",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5, showarrow=False,
-            font=dict(size=16, color="gray")
-        )
-        return html.Div(), empty_fig, html.Div(), empty_fig, html.Div()
-    
-    # Filtrar datos
-    df_filtered = df[
-        (df['Operador'].isin(operadores)) &
-        (df['Maquina'].isin(maquinas)) &
-        (df['Indicador'] == indicador) &
-        (df['Week'] >= week_range[0]) &
-        (df['Week'] <= week_range[1])
-    ].copy()
-    
-    if len(df_filtered) == 0:
-        empty_fig = go.Figure()
-        empty_fig.add_annotation(
-            text="No hay datos disponibles con los filtros seleccionados",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5, showarrow=False,
-            font=dict(size=16, color="gray")
+
+# ==================== COMPONENTES PRINCIPALES ====================
+# Cada componente se arma en su propia función para que update_main_content
+# pueda regenerar solo los que cambiaron.
+
+def empty_figure(text):
+    """Figura vacía con un mensaje al centro."""
+    empty_fig = go.Figure()
+    empty_fig.add_annotation(
+        text=text,
+        xref="paper", yref="paper",
+        x=0.5, y=0.5, showarrow=False,
+        font=dict(size=16, color="gray")
+    )
+    return empty_fig
+
+
+def series_trace(df_plot, name, color, webgl=False):
+    """
+    Trazo de una serie operador/máquina de la gráfica principal (WebGL si
+    webgl=True). Weeks y valores viajan como arreglos tipados; el resto del
+    estilo lo pone main_chart_template.
+    """
+    scatter = go.Scattergl if webgl else go.Scatter
+    return scatter(
+        x=typed_array(df_plot['Week']),
+        y=typed_array(df_plot['Valor_Promedio']),
+        name=name,
+        line=dict(color=color)
+    )
+
+
+def main_chart_template(indicador):
+    """
+    Tema de la gráfica principal con el estilo común de las series (modo,
+    grosor, marcador, hovertemplate), para no repetirlo en cada trazo.
+    """
+    template = go.layout.Template(pio.templates['plotly_white'])
+    for defaults in (template.data.scatter[0], template.data.scattergl[0]):
+        defaults.update(
+            mode='lines+markers',
+            line=dict(width=2),
+            marker=dict(size=6),
+            hovertemplate=
+                '<b>%{fullData.name}</b><br>' +
+                'Week: %{x}<br>' +
+                f'{indicador}: ' + '%{y:.2f}<br>' +
+                '<extra></extra>'
         )
-        return html.Div(), empty_fig, html.Div(), empty_fig, html.Div()
-    
-    # 1. MÉTRICAS PRINCIPALES
-    total_registros = len(df_filtered)
-    weeks_analizadas = df_filtered['Week'].nunique()
-    promedio_general = df_filtered['Valor_Promedio'].mean()
-    mejor_performance = (df_filtered['Valor_Promedio'].min() 
-                        if INDICATOR_INFO[indicador]['better'] == 'lower' 
-                        else df_filtered['Valor_Promedio'].max())
-    
-    metrics = html.Div([
-        # Métrica 1
-        html.Div([
-            html.Div("📊", style={'fontSize': '30px', 'marginBottom': '5px'}),
-            html.Div("Registros Totales", style={'fontSize': '12px', 'color': '#7f8c8d'}),
-            html.Div(f"{total_registros:,}", style={'fontSize': '24px', 'fontWeight': 'bold', 'color': COLORS['text']})
-        ], style={
-            'width': '23%',
-            'display': 'inline-block',
-            'backgroundColor': COLORS['card'],
-            'padding': '20px',
-            'borderRadius': '10px',
-            'textAlign': 'center',
-            'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
-            'marginRight': '2%'
-        }),
-        
-        # Métrica 2
-        html.Div([
-            html.Div("📅", style={'fontSize': '30px', 'marginBottom': '5px'}),
-            html.Div("Weeks Analizadas", style={'fontSize': '12px', 'color': '#7f8c8d'}),
-            html.Div(f"{weeks_analizadas}", style={'fontSize': '24px', 'fontWeight': 'bold', 'color': COLORS['text']})
-        ], style={
-            'width': '23%',
-            'display': 'inline-block',
-            'backgroundColor': COLORS['card'],
-            'padding': '20px',
-            'borderRadius': '10px',
-            'textAlign': 'center',
-            'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
-            'marginRight': '2%'
-        }),
-        
-        # Métrica 3
-        html.Div([
-            html.Div("📈", style={'fontSize': '30px', 'marginBottom': '5px'}),
-            html.Div("Promedio General", style={'fontSize': '12px', 'color': '#7f8c8d'}),
-            html.Div(f"{promedio_general:.2f}", style={'fontSize': '24px', 'fontWeight': 'bold', 'color': COLORS['text']})
-        ], style={
-            'width': '23%',
-            'display': 'inline-block',
-            'backgroundColor': COLORS['card'],
-            'padding': '20px',
-            'borderRadius': '10px',
-            'textAlign': 'center',
-            'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
-            'marginRight': '2%'
-        }),
-        
-        # Métrica 4
-        html.Div([
-            html.Div("🏆", style={'fontSize': '30px', 'marginBottom': '5px'}),
-            html.Div("Mejor Performance", style={'fontSize': '12px', 'color': '#7f8c8d'}),
-            html.Div(f"{mejor_performance:.2f}", style={'fontSize': '24px', 'fontWeight': 'bold', 'color': COLORS['success']})
-        ], style={
-            'width': '23%',
-            'display': 'inline-block',
-            'backgroundColor': COLORS['card'],
-            'padding': '20px',
-            'borderRadius': '10px',
-            'textAlign': 'center',
-            'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
-        })
-    ])
-    
-    # 2. GRÁFICA PRINCIPAL
-    fig = go.Figure()
-    
+    return template
+
+
+def main_chart_traces(engine, key, operadores, maquinas):
+    """
+    Retorna ([(nombre, color, df_plot)], webgl) con las series con datos en
+    orden de selección. Los puntos se reducen para no pasar de
+    CHART_POINT_BUDGET (el navegador vuelve a reducir con el mismo LTTB al
+    mover el slider o hacer zoom) y `webgl` indica si conviene usar Scattergl.
+    """
     colors_plotly = px.colors.qualitative.Set3
     color_map = {op: colors_plotly[i % len(colors_plotly)] for i, op in enumerate(operadores)}
     
+    series = []
     for operador in operadores:
         for maquina in maquinas:
-            df_plot = df_filtered[
-                (df_filtered['Operador'] == operador) &
-                (df_filtered['Maquina'] == maquina)
-            ].sort_values('Week')
-            
+            df_plot = engine.series(operador, maquina, key)
             if len(df_plot) > 0:
-                fig.add_trace(go.Scatter(
-                    x=df_plot['Week'],
-                    y=df_plot['Valor_Promedio'],
-                    mode='lines+markers',
-                    name=f"{operador} - {maquina}",
-                    line=dict(width=2, color=color_map[operador]),
-                    marker=dict(size=6),
-                    hovertemplate=
-                        '<b>%{fullData.name}</b><br>' +
-                        'Week: %{x}<br>' +
-                        f'{indicador}: ' + '%{y:.2f}<br>' +
-                        '<extra></extra>'
-                ))
-    
-    # Línea de promedio
-    promedio_total = df_filtered['Valor_Promedio'].mean()
+                series.append((f"{operador} - {maquina}", color_map[operador], df_plot))
+    
+    frames, _ = fit_to_budget([df_plot for _, _, df_plot in series])
+    traces = [(name, color, df_plot) for (name, color, _), df_plot in zip(series, frames)]
+    return traces, use_webgl(sum(len(df_plot) for df_plot in frames))
+
+
+def build_main_chart(traces, indicador, promedio_general, webgl=False):
+    """Gráfica principal completa: una línea por serie más el promedio general."""
+    fig = go.Figure()
+    
+    for name, color, df_plot in traces:
+        fig.add_trace(series_trace(df_plot, name, color, webgl))
+    
+    # Línea de promedio (con etiqueta propia: las anotaciones son de las alertas SPC)
     fig.add_hline(
-        y=promedio_total,
+        y=promedio_general,
         line_dash="dash",
         line_color="red",
-        annotation_text=f"Promedio General: {promedio_total:.2f}",
-        annotation_position="top right"
+        label=dict(text=f"Promedio General: {promedio_general:.2f}", textposition="end", yanchor="bottom")
     )
     
     fig.update_layout(
@@ -495,164 +809,367 @@ def update_main_content(operadores, maquinas, indicador, week_range):
             xanchor="left",
             x=1.02
         ),
-        template='plotly_white'
+        template=main_chart_template(indicador),
+        # El zoom se conserva al mover el slider o cambiar la selección, no al cambiar de indicador
+        uirevision=indicador
     )
+    return fig
+
+
+def patch_main_chart(prev_state, state, traces):
+    """
+    Actualización parcial de la gráfica principal respecto al estado anterior:
+    quita las series que ya no están y agrega las nuevas (después el
+    navegador las recorta al rango de weeks y update_week_range_stats
+    mueve la línea de promedio).
+    Retorna None si hay que regenerar la figura (cambió el orden, los colores
+    o el tipo de trazo SVG/WebGL).
+    """
+    if state['webgl'] != prev_state['webgl']:
+        return None
+    webgl = state['webgl']
     
-    # 3. TABLA COMPARATIVA
-    stats_table = df_filtered.groupby(['Coordinador', 'Operador', 'Maquina']).agg({
-        'Valor_Promedio': ['mean', 'min', 'max', 'std', 'count']
-    }).round(2)
+    prev_names = prev_state['traces']
+    prev_colors = dict(zip(prev_names, prev_state['colors']))
+    new_names = [name for name, _, _ in traces]
+    new_set = set(new_names)
     
-    stats_table.columns = ['Promedio', 'Mínimo', 'Máximo', 'Desv. Est.', 'Weeks']
-    stats_table = stats_table.reset_index()
+    kept = [name for name in prev_names if name in new_set]
+    if kept != new_names[:len(kept)] or any(prev_colors[name] != color for name, color, _ in traces[:len(kept)]):
+        return None
     
-    # Ordenar
-    if INDICATOR_INFO[indicador]['better'] == 'lower':
-        stats_table = stats_table.sort_values('Promedio', ascending=True)
-    else:
-        stats_table = stats_table.sort_values('Promedio', ascending=False)
+    patch = Patch()
+    changed = False
     
-    stats_table.insert(0, 'Ranking', range(1, len(stats_table) + 1))
+    # Las operaciones se aplican en orden: primero se borran (de atrás hacia adelante)
+    for i in reversed(range(len(prev_names))):
+        if prev_names[i] not in new_set:
+            del patch['data'][i]
+            changed = True
     
-    table_component = dash_table.DataTable(
-        data=stats_table.to_dict('records'),
-        columns=[{'name': col, 'id': col} for col in stats_table.columns],
-        style_table={'overflowX': 'auto'},
-        style_cell={
-            'textAlign': 'left',
-            'padding': '10px',
-            'fontSize': '13px'
-        },
-        style_header={
-            'backgroundColor': COLORS['primary'],
-            'color': 'white',
-            'fontWeight': 'bold',
-            'textAlign': 'center'
-        },
-        style_data_conditional=[
-            {
-                'if': {'row_index': 0},
-                'backgroundColor': '#d4edda',
-                'fontWeight': 'bold'
-            }
-        ],
-        page_size=15
-    )
+    for name, color, df_plot in traces[len(kept):]:
+        patch['data'].append(series_trace(df_plot, name, color, webgl).to_plotly_json())
+        changed = True
     
-    # 4. GRÁFICA DE COORDINADORES
-    coord_stats = df_filtered.groupby('Coordinador')['Valor_Promedio'].agg(['mean', 'std']).reset_index()
-    coord_stats.columns = ['Coordinador', 'Promedio', 'Desv_Est']
+    return patch if changed else dash.no_update
+
+
+def build_series_store(current, key, operadores, maquinas):
+    """
+    Series de la selección (todas las weeks) en formato columnar para los
+    callbacks del navegador: una entrada por trazo de la gráfica principal,
+    en el mismo orden, con su rango [start, stop) en week/valor.
+    """
+    engine = current.engine
+    series = {'name': [], 'operador': [], 'maquina': [], 'start': [], 'stop': []}
+    frames = []
+    stop = 0
+    for operador in operadores:
+        for maquina in maquinas:
+            df_plot = engine.series(operador, maquina, key)
+            if len(df_plot) > 0:
+                series['name'].append(f"{operador} - {maquina}")
+                series['operador'].append(operador)
+                series['maquina'].append(maquina)
+                series['start'].append(stop)
+                stop += len(df_plot)
+                series['stop'].append(stop)
+                frames.append(df_plot)
     
-    fig_coord = go.Figure()
+    df_series = pd.concat(frames)
     
-    fig_coord.add_trace(go.Bar(
-        x=coord_stats['Coordinador'],
-        y=coord_stats['Promedio'],
-        error_y=dict(type='data', array=coord_stats['Desv_Est']),
-        marker_color=[COLORS['primary'], COLORS['danger'], COLORS['success']],
-        text=coord_stats['Promedio'].round(2),
-        textposition='outside'
-    ))
+    # Alertas SPC de todas las weeks; `serie` es la posición del trazo
+    alerts = engine.spc_alerts(key)
+    trace_index = {name: i for i, name in enumerate(series['name'])}
+    alert_series = (alerts['Operador'] + ' - ' + alerts['Maquina']).map(trace_index)
+    return {
+        'indicador': key[2],
+        'series': series,
+        'week': typed_array(df_series['Week']),
+        'valor': typed_array(df_series['Valor_Promedio']),
+        'alerts': {
+            'serie': typed_array(alert_series.to_numpy(dtype='int64')),
+            'week': typed_array(alerts['Week']),
+            'valor': typed_array(alerts['Valor']),
+            'linea': typed_array(alerts['Linea_Central']),
+            'flags': typed_array(alerts['Flags'])
+        }
+    }
+
+
+# Callback 4: Gráfica principal y series de la selección
+@app.callback(
+    Output('main-chart', 'figure'),
+    Output('series-store', 'data'),
+    Output('main-content-state', 'data'),
+    Input('operadores-dropdown', 'value'),
+    Input('maquinas-dropdown', 'value'),
+    Input('indicador-dropdown', 'value'),
+    Input('data-version', 'data'),
+    State('main-content-state', 'data')
+)
+@instrument('update_main_content')
+@callback_cache.memoize('update_main_content')
+def update_main_content(operadores, maquinas, indicador, version=None, prev_state=None):
+    """
+    Arma la gráfica principal y las series de todas las weeks de la
+    selección (series-store). El navegador recorta las series y las alertas
+    al rango de weeks (week_range_content); las métricas, la tabla y los
+    coordinadores los arma update_week_range_stats. `version` (data-version)
+    solo sirve para volver a calcular cuando llegan datos nuevos.
+    Con el estado de la respuesta anterior (main-content-state) la gráfica
+    viaja como Patch; si cambia el indicador (o no hay estado) se regenera.
+    """
+    # Validaciones
+    if not operadores or not maquinas:
+        return empty_figure("Por favor selecciona al menos un operador y una máquina"), None, None
     
-    fig_coord.update_layout(
-        title=f"Comparación de Coordinadores - {INDICATOR_INFO[indicador]['name']}",
-        xaxis_title="Coordinador",
-        yaxis_title="Promedio",
-        showlegend=False,
-        template='plotly_white'
-    )
+    # Filtrar datos (todas las weeks)
+    current = data.current
+    key = filter_key(operadores, maquinas, indicador, current.week_range)
+    df_filtered = current.engine.filtered(key)
     
-    # 5. ESTADÍSTICAS DE COORDINADORES
-    coordinadores_en_datos = df_filtered['Coordinador'].unique()
-    coord_stats_div = []
+    if len(df_filtered) == 0:
+        return empty_figure("No hay datos disponibles con los filtros seleccionados"), None, None
     
-    for coord in coordinadores_en_datos:
-        df_coord = df_filtered[df_filtered['Coordinador'] == coord]
-        promedio = df_coord['Valor_Promedio'].mean()
-        operadores_count = df_coord['Operador'].nunique()
+    promedio_general = current.engine.summary(key)['promedio_general']
+    with metrics.stage('figure'):
+        traces, webgl = main_chart_traces(current.engine, key, operadores, maquinas)
         
-        coord_stats_div.append(
-            html.Div([
-                html.H5(coord, style={'color': COLORS['text'], 'marginBottom': '10px'}),
-                html.P(f"Promedio: {promedio:.2f}", style={'margin': '5px 0'}),
-                html.P(f"Operadores: {operadores_count}", style={'margin': '5px 0'}),
-                html.P(f"Registros: {len(df_coord)}", style={'margin': '5px 0'}),
-                html.Hr(style={'borderColor': COLORS['border'], 'margin': '15px 0'})
-            ])
-        )
+        state = {
+            'indicador': indicador,
+            'traces': [name for name, _, _ in traces],
+            'colors': [color for _, color, _ in traces],
+            'webgl': webgl
+        }
+        
+        fig = None
+        if prev_state and prev_state['indicador'] == indicador:
+            fig = patch_main_chart(prev_state, state, traces)
+        if fig is None:
+            fig = build_main_chart(traces, indicador, promedio_general, webgl)
     
-    return metrics, fig, table_component, fig_coord, html.Div(coord_stats_div)
+    with metrics.stage('series_store'):
+        store = build_series_store(current, key, operadores, maquinas)
+    return fig, store, state
+
+
+# Callback 4a: Rango de weeks en la gráfica y en las alertas SPC (en el navegador)
+app.clientside_callback(
+    ClientsideFunction(namespace='pmi', function_name='week_range_content'),
+    Output('main-chart', 'figure', allow_duplicate=True),
+    Output('spc-alerts-table', 'data'),
+    Input('week-range-slider', 'value'),
+    Input('series-store', 'data'),
+    State('dashboard-config', 'data'),
+    State('chart-window', 'data'),
+    prevent_initial_call=True
+)
 
-# Callback 5: Descargar datos filtrados
+
+# Callback 4b: Métricas, tabla comparativa y coordinadores del rango de weeks
 @app.callback(
-    Output("download-filtered-data", "data"),
-    Input("btn-download-filtered", "n_clicks"),
+    Output('metric-registros', 'children'),
+    Output('metric-weeks', 'children'),
+    Output('metric-promedio', 'children'),
+    Output('metric-mejor', 'children'),
+    Output('main-metrics', 'style'),
+    Output('main-chart', 'figure', allow_duplicate=True),
+    Output('comparison-datatable', 'data'),
+    Output('coordinador-chart', 'figure'),
+    Output('coordinador-stats', 'children'),
+    Input('week-range-slider', 'value'),
+    Input('main-content-state', 'data'),
     State('operadores-dropdown', 'value'),
     State('maquinas-dropdown', 'value'),
-    State('indicador-dropdown', 'value'),
-    State('week-range-slider', 'value'),
+    State('main-metrics', 'style'),
+    State('data-version', 'data'),
     prevent_initial_call=True
 )
-def download_filtered(n_clicks, operadores, maquinas, indicador, week_range):
-    if not operadores or not maquinas:
-        return None
+@instrument('update_week_range_stats')
+@callback_cache.memoize('update_week_range_stats')
+def update_week_range_stats(week_range, state, operadores, maquinas, metrics_style, version=None):
+    """
+    Métricas, ranking y estadísticas por coordinador de la selección en el
+    rango de weeks, con las consultas memoizadas de QueryEngine. Corre
+    después de update_main_content (escucha main-content-state) y mueve la
+    línea de promedio de la gráfica principal.
+    """
+    hidden = {**(metrics_style or {}), 'display': 'none'}
+    no_coordinators = pd.DataFrame(columns=['Coordinador', 'Promedio', 'Desv_Est'])
+    if not state:
+        return ('', '', '', '', hidden, dash.no_update, [],
+                patch_coordinator_chart(no_coordinators, None), html.Div())
+    
+    indicador = state['indicador']
+    engine = data.current.engine
+    key = filter_key(operadores, maquinas, indicador, week_range)
+    summary = engine.summary(key)
+    fig = Patch()
+    if summary['total_registros'] == 0:
+        fig['layout']['shapes'][0]['visible'] = False
+        return ('', '', '', '', hidden, fig, [],
+                patch_coordinator_chart(no_coordinators, indicador), html.Div())
+    
+    promedio_general = summary['promedio_general']
+    fig['layout']['shapes'][0]['visible'] = True
+    fig['layout']['shapes'][0]['y0'] = promedio_general
+    fig['layout']['shapes'][0]['y1'] = promedio_general
+    fig['layout']['shapes'][0]['label']['text'] = f"Promedio General: {promedio_general:.2f}"
     
-    df_filtered = df[
-        (df['Operador'].isin(operadores)) &
-        (df['Maquina'].isin(maquinas)) &
-        (df['Indicador'] == indicador) &
-        (df['Week'] >= week_range[0]) &
-        (df['Week'] <= week_range[1])
-    ]
-    
-    return dcc.send_data_frame(
-        df_filtered.to_csv,
-        f"performance_{indicador}_{datetime.now().strftime('%Y%m%d')}.csv",
-        index=False
+    coord_stats = engine.coordinator_stats(key)
+    return (
+        f"{summary['total_registros']:,}",
+        str(summary['weeks_analizadas']),
+        f"{promedio_general:.2f}",
+        f"{summary['mejor_performance']:.2f}",
+        {**(metrics_style or {}), 'display': 'block'},
+        fig,
+        engine.stats_table(key).to_dict('records'),
+        patch_coordinator_chart(coord_stats, indicador),
+        build_coordinator_stats(coord_stats)
     )
 
-# Callback 6: Descargar tabla resumen
-@app.callback(
-    Output("download-summary-data", "data"),
-    Input("btn-download-summary", "n_clicks"),
-    State('operadores-dropdown', 'value'),
-    State('maquinas-dropdown', 'value'),
-    State('indicador-dropdown', 'value'),
+# Callback 4c: Detalle de la ventana visible al hacer zoom (en el navegador)
+app.clientside_callback(
+    ClientsideFunction(namespace='pmi', function_name='main_chart_zoom'),
+    Output('main-chart', 'figure', allow_duplicate=True),
+    Output('chart-window', 'data'),
+    Input('main-chart', 'relayoutData'),
     State('week-range-slider', 'value'),
+    State('series-store', 'data'),
+    State('dashboard-config', 'data'),
     prevent_initial_call=True
 )
-def download_summary(n_clicks, operadores, maquinas, indicador, week_range):
-    if not operadores or not maquinas:
+
+# Callback 4d: Serie del detalle por turno (clic en la gráfica principal)
+@app.callback(
+    Output('drilldown-selection', 'data'),
+    Input('main-chart', 'clickData'),
+    Input('btn-drilldown-clear', 'n_clicks'),
+    State('main-content-state', 'data'),
+    prevent_initial_call=True
+)
+@instrument('select_drilldown_series')
+def select_drilldown_series(click_data, n_clicks, state):
+    """Guarda (operador, máquina) de la serie clicada; el botón regresa a toda la selección."""
+    if dash.ctx.triggered_id == 'btn-drilldown-clear' or not click_data or not state:
         return None
     
-    df_filtered = df[
-        (df['Operador'].isin(operadores)) &
-        (df['Maquina'].isin(maquinas)) &
-        (df['Indicador'] == indicador) &
-        (df['Week'] >= week_range[0]) &
-        (df['Week'] <= week_range[1])
-    ]
-    
-    stats_table = df_filtered.groupby(['Coordinador', 'Operador', 'Maquina']).agg({
-        'Valor_Promedio': ['mean', 'min', 'max', 'std', 'count']
-    }).round(2)
+    curve = click_data['points'][0].get('curveNumber')
+    if curve is None or curve >= len(state['traces']):
+        return None
+    operador, maquina = state['traces'][curve].rsplit(' - ', 1)
+    return {'operador': operador, 'maquina': maquina}
+
+
+# Callback 4e: Página visible del detalle por turno
+@app.callback(
+    Output('drilldown-table', 'data'),
+    Output('drilldown-table', 'page_count'),
+    Output('drilldown-label', 'children'),
+    Input('drilldown-table', 'page_current'),
+    Input('drilldown-table', 'page_size'),
+    Input('drilldown-table', 'sort_by'),
+    Input('drilldown-table', 'filter_query'),
+    Input('operadores-dropdown', 'value'),
+    Input('maquinas-dropdown', 'value'),
+    Input('indicador-dropdown', 'value'),
+    Input('week-range-slider', 'value'),
+    Input('drilldown-selection', 'data'),
+    Input('data-version', 'data')
+)
+@instrument('update_drilldown')
+@callback_cache.memoize('update_drilldown')
+def update_drilldown(page_current, page_size, sort_by, filter_query,
+                     operadores, maquinas, indicador, week_range, selection, version=None):
+    """
+    Registros por turno de la selección (o de la serie clicada). Solo se
+    envía la página visible; filtro y orden se aplican en el servidor.
+    """
+    if selection:
+        operadores, maquinas = [selection['operador']], [selection['maquina']]
+        label = f"Serie: {selection['operador']} - {selection['maquina']} (clic en otra línea para cambiar)"
+    else:
+        label = "Toda la selección (clic en una línea de la gráfica para ver solo esa serie)"
     
-    stats_table.columns = ['Promedio', 'Mínimo', 'Máximo', 'Desv. Est.', 'Weeks']
-    stats_table = stats_table.reset_index()
+    if not operadores or not maquinas:
+        return [], 1, label
     
-    if INDICATOR_INFO[indicador]['better'] == 'lower':
-        stats_table = stats_table.sort_values('Promedio', ascending=True)
-    else:
-        stats_table = stats_table.sort_values('Promedio', ascending=False)
+    with metrics.stage('filter'):
+        df_rows = data.current.daily_index.query(operadores, maquinas, indicador, week_range)
+    records, page_count = page_records(df_rows, page_current, page_size, sort_by, filter_query)
+    if page_current and page_current >= page_count:
+        records, page_count = page_records(df_rows, page_count - 1, page_size, sort_by, filter_query)
+    return records, page_count, f"{label} · {len(df_rows):,} registros"
+
+# Callback 5: Enlaces de descarga con la selección actual (en el navegador)
+app.clientside_callback(
+    ClientsideFunction(namespace='pmi', function_name='export_links'),
+    Output('link-download-filtered', 'href'),
+    Output('link-download-summary', 'href'),
+    Output('link-download-daily', 'href'),
+    Input('operadores-dropdown', 'value'),
+    Input('maquinas-dropdown', 'value'),
+    Input('indicador-dropdown', 'value'),
+    Input('week-range-slider', 'value'),
+    Input('export-format', 'value')
+)
+
+# ==================== EXPORTACIÓN ====================
+
+# Dataset exportable → (prefijo del archivo, función(datos, operadores, maquinas, indicador, week_range))
+EXPORT_DATASETS = {
+    'filtered': ('performance', lambda current, *args: current.engine.filtered(filter_key(*args))),
+    'summary': ('resumen', lambda current, *args: current.engine.stats_table(filter_key(*args))),
+    'daily': ('turnos', lambda current, *args: current.daily_index.query(*args))
+}
+
+
+@server.route('/export/<dataset>')
+def export_dataset(dataset):
+    """
+    Archivo de la selección en el formato pedido, generado y enviado por
+    bloques (nunca se arma completo en memoria).
+    """
+    if dataset not in EXPORT_DATASETS:
+        abort(404)
     
-    stats_table.insert(0, 'Ranking', range(1, len(stats_table) + 1))
+    operadores = request.args.getlist('operador')
+    maquinas = request.args.getlist('maquina')
+    indicador = request.args.get('indicador')
+    fmt = request.args.get('formato', 'csv')
+    try:
+        week_range = [int(request.args['week_inicio']), int(request.args['week_fin'])]
+    except (KeyError, ValueError):
+        abort(400, "week_inicio y week_fin deben ser enteros")
+    if not operadores or not maquinas or indicador is None:
+        abort(400, "Faltan operadores, máquinas o indicador")
+    if indicador not in INDICATOR_INFO:
+        abort(400, f"Indicador no soportado: {indicador}")
+    if fmt not in available_formats():
+        abort(400, f"Formato no soportado: {fmt}")
     
-    return dcc.send_data_frame(
-        stats_table.to_csv,
-        f"resumen_{indicador}_{datetime.now().strftime('%Y%m%d')}.csv",
-        index=False
+    prefix, select = EXPORT_DATASETS[dataset]
+    df_export = select(data.current, operadores, maquinas, indicador, week_range)
+    chunks = metrics.measure_stream(iter_export(df_export, fmt), f"export_{dataset}")
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[fmt]['mime'],
+        headers={'Content-Disposition':
+                 f'attachment; filename="{export_filename(f"{prefix}_{indicador}", fmt)}"'}
     )
 
+@server.route('/metrics')
+def metrics_endpoint():
+    """
+    Métricas del worker en formato de texto de Prometheus. Solo responde a
+    conexiones locales salvo con PMI_METRICS_PUBLIC=1.
+    """
+    if not METRICS_PUBLIC and request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(404)
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 # ==================== RUN APP ====================
 if __name__ == '__main__':
     app.run(debug=True, port=8050)
@@ -0,0 +1,328 @@
+/*
+ * Callbacks del navegador (clientside) de app_dash.py.
+ *
+ * El servidor manda una sola vez, por selección de operadores/máquinas/
+ * indicador, las series de todas las weeks en formato columnar
+ * (dcc.Store 'series-store'). Al mover el slider de weeks, los trazos de la
+ * gráfica principal y las alertas SPC se recortan aquí; las métricas, la
+ * tabla comparativa y los coordinadores los calcula el servidor
+ * (update_week_range_stats). El resumen de filtros, la descripción del
+ * indicador y los enlaces de descarga tampoco van al servidor.
+ *
+ * Formato de 'series-store':
+ *   series: {name, operador, maquina, start, stop}  (una entrada por trazo)
+ *   week, valor: una posición por registro semanal; los registros de
+ *                la serie i están en [start[i], stop[i]) ordenados por week
+ *   alerts: {serie, week, valor, linea, flags}  alertas SPC de todas las weeks
+ *           (serie = posición del trazo, flags = bits de config.spc_rules)
+ * week, valor y las columnas de alerts llegan como arreglos tipados de Plotly
+ * ({dtype, bdata} en base64, ver payload.py) y se decodifican una sola vez
+ * por store.
+ *
+ * La gráfica se reduce aquí con el mismo presupuesto de puntos que
+ * downsample.fit_to_budget (y LTTB), sobre la ventana del slider o, tras un
+ * zoom, sobre la ventana visible ('chart-window').
+ */
+
+const TYPED_ARRAYS = {
+    i1: Int8Array, u1: Uint8Array, i2: Int16Array, u2: Uint16Array,
+    i4: Int32Array, u4: Uint32Array, f4: Float32Array, f8: Float64Array
+};
+
+const decodedStores = new WeakMap();
+
+function typedArray(spec) {
+    // {dtype, bdata} → arreglo tipado (las listas normales se dejan igual)
+    if (Array.isArray(spec)) {
+        return spec;
+    }
+    const binary = atob(spec.bdata);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return new TYPED_ARRAYS[spec.dtype](bytes.buffer);
+}
+
+function decodeStore(store) {
+    if (!decodedStores.has(store)) {
+        decodedStores.set(store, Object.assign({}, store, {
+            week: typedArray(store.week),
+            valor: typedArray(store.valor),
+            alerts: Object.fromEntries(Object.entries(store.alerts).map(([col, spec]) => [col, typedArray(spec)]))
+        }));
+    }
+    return decodedStores.get(store);
+}
+
+function htmlComponent(type, children, style) {
+    return {type: type, namespace: 'dash_html_components', props: {children: children, style: style}};
+}
+
+function round2(value) {
+    return Math.round(value * 100) / 100;
+}
+
+function lowerBound(values, start, stop, target) {
+    // Primera posición en [start, stop) con values[i] >= target
+    while (start < stop) {
+        const mid = (start + stop) >> 1;
+        if (values[mid] < target) {
+            start = mid + 1;
+        } else {
+            stop = mid;
+        }
+    }
+    return start;
+}
+
+function upperBound(values, start, stop, target) {
+    // Primera posición en [start, stop) con values[i] > target
+    while (start < stop) {
+        const mid = (start + stop) >> 1;
+        if (values[mid] <= target) {
+            start = mid + 1;
+        } else {
+            stop = mid;
+        }
+    }
+    return start;
+}
+
+function blockMean(values, start, stop) {
+    let sum = 0;
+    for (let i = start; i < stop; i++) {
+        sum += values[i];
+    }
+    return sum / (stop - start);
+}
+
+function lttbIndices(x, y, start, stop, nOut) {
+    // Como downsample.lttb_indices, sobre [start, stop): posiciones de nOut puntos que conservan la forma
+    const n = stop - start;
+    if (nOut >= n) {
+        return Array.from({length: n}, (_, i) => start + i);
+    }
+    if (nOut < 3) {
+        return [start, stop - 1];
+    }
+    // nOut - 2 bloques sobre los puntos intermedios (como np.linspace(1, n - 1, nOut - 1))
+    const step = (n - 2) / (nOut - 2);
+    const edges = Array.from({length: nOut - 1}, (_, i) => start + Math.trunc(i * step + 1));
+    edges[nOut - 2] = stop - 1;
+
+    const selected = [start];
+    let a = start;
+    for (let i = 0; i < nOut - 2; i++) {
+        const [from, to] = [edges[i], edges[i + 1]];
+        // Promedio del bloque siguiente (para el último bloque, el último punto)
+        let avgX = x[stop - 1], avgY = y[stop - 1];
+        if (i + 2 < edges.length) {
+            avgX = blockMean(x, to, edges[i + 2]);
+            avgY = blockMean(y, to, edges[i + 2]);
+        }
+        // Punto del bloque que forma el triángulo más grande con el anterior y el promedio
+        let best = from, bestArea = -Infinity;
+        for (let j = from; j < to; j++) {
+            const area = Math.abs((x[a] - avgX) * (y[j] - y[a]) - (x[a] - x[j]) * (avgY - y[a]));
+            if (area > bestArea) {
+                best = j;
+                bestArea = area;
+            }
+        }
+        a = best;
+        selected.push(a);
+    }
+    selected.push(stop - 1);
+    return selected;
+}
+
+function fitToBudget(store, slices, budget, xRange) {
+    // Posiciones de cada trazo, como downsample.fit_to_budget: recorte a `xRange`
+    // (con un punto extra a cada lado) y LTTB si el total pasa de `budget`
+    const clipped = slices.map(([start, stop]) => (xRange && stop > start) ? [
+        Math.max(lowerBound(store.week, start, stop, xRange[0]) - 1, start),
+        Math.min(upperBound(store.week, start, stop, xRange[1]) + 1, stop)
+    ] : [start, stop]);
+
+    const total = clipped.reduce((a, [start, stop]) => a + stop - start, 0);
+    const frames = slices.filter(([start, stop]) => stop > start).length;
+    const perSeries = total > budget ? Math.max(Math.floor(budget / frames), 3) : Infinity;
+    return clipped.map(([start, stop]) => lttbIndices(store.week, store.valor, start, stop, perSeries));
+}
+
+function relayoutWindow(relayout) {
+    // Ventana de weeks de un evento relayoutData: [inicio, fin] tras un zoom,
+    // null si se regresó al rango completo y undefined si el evento no cambia el eje x
+    if ('xaxis.range[0]' in relayout && 'xaxis.range[1]' in relayout) {
+        return [relayout['xaxis.range[0]'], relayout['xaxis.range[1]']];
+    }
+    if ('xaxis.range' in relayout) {
+        return relayout['xaxis.range'];
+    }
+    if (relayout['xaxis.autorange']) {
+        return null;
+    }
+    return undefined;
+}
+
+function chartWindow(windowData, store) {
+    // Ventana de zoom guardada, si es de la gráfica del indicador actual
+    return (windowData && windowData.indicador === store.indicador) ? windowData.range : null;
+}
+
+function tracesPatch(patch, store, slices, keep) {
+    // x/y de cada trazo con las posiciones `keep`; sin registros en la ventana, el trazo se oculta
+    keep.forEach((positions, i) => {
+        patch.assign(['data', i, 'x'], positions.map(j => store.week[j]));
+        patch.assign(['data', i, 'y'], positions.map(j => store.valor[j]));
+        patch.assign(['data', i, 'visible'], slices[i][1] > slices[i][0]);
+    });
+}
+
+function windowSlices(store, weekRange) {
+    // Rango [start, stop) de cada serie dentro de las weeks seleccionadas
+    const series = store.series;
+    return series.start.map((start, i) => [
+        lowerBound(store.week, start, series.stop[i], weekRange[0]),
+        lowerBound(store.week, start, series.stop[i], weekRange[1] + 1)
+    ]);
+}
+
+function windowAlerts(store, weekRange) {
+    // Posiciones de las alertas SPC dentro de las weeks seleccionadas, de la más reciente a la más antigua
+    const week = store.alerts.week;
+    const keep = [];
+    for (let k = 0; k < week.length; k++) {
+        if (week[k] >= weekRange[0] && week[k] <= weekRange[1]) {
+            keep.push(k);
+        }
+    }
+    return keep.sort((a, b) => week[b] - week[a]);
+}
+
+function ruleNames(flags, rules) {
+    return rules.filter((_, bit) => (flags >> bit) & 1).join(', ');
+}
+
+function alertRows(store, keep, config) {
+    // Filas de la tabla de alertas (mismas columnas que spc.ALERT_COLUMNS)
+    const alerts = store.alerts;
+    return keep.map(k => ({
+        'Week': alerts.week[k],
+        'Operador': store.series.operador[alerts.serie[k]],
+        'Maquina': store.series.maquina[alerts.serie[k]],
+        'Valor': round2(alerts.valor[k]),
+        'Linea_Central': round2(alerts.linea[k]),
+        'Reglas': ruleNames(alerts.flags[k], config.spc_rules)
+    }));
+}
+
+function alertAnnotations(store, keep, config) {
+    // Marca ⚠ sobre las alertas más recientes de la ventana
+    const alerts = store.alerts;
+    const color = config.colors.danger;
+    return keep.slice(0, config.spc_max_annotations).map(k => ({
+        x: alerts.week[k],
+        y: alerts.valor[k],
+        xref: 'x',
+        yref: 'y',
+        text: '⚠',
+        hovertext: store.series.name[alerts.serie[k]] + ': ' + ruleNames(alerts.flags[k], config.spc_rules),
+        showarrow: true,
+        arrowhead: 2,
+        arrowcolor: color,
+        ax: 0,
+        ay: -25,
+        font: {color: color, size: 14}
+    }));
+}
+
+function mainChartPatch(store, slices, keep, alertMarks) {
+    // x/y de cada trazo (posiciones `keep`) y marcas de alertas SPC; la línea de
+    // promedio la mueve el servidor (update_week_range_stats)
+    const patch = new dash_clientside.Patch();
+    tracesPatch(patch, store, slices, keep);
+
+    if (slices.every(([start, stop]) => stop === start)) {
+        patch.assign(['layout', 'annotations'], [{
+            text: 'No hay datos disponibles con los filtros seleccionados',
+            xref: 'paper', yref: 'paper', x: 0.5, y: 0.5, showarrow: false,
+            font: {size: 16, color: 'gray'}
+        }]);
+    } else {
+        patch.assign(['layout', 'annotations'], alertMarks);
+    }
+    return patch.build();
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    pmi: {
+        indicator_description: function (indicador, config) {
+            return config.indicators[indicador].description;
+        },
+
+        filter_summary: function (coordinador, operadores, maquinas, indicador, config) {
+            const p = text => htmlComponent('P', text, {marginBottom: '5px'});
+            return htmlComponent('Div', [
+                p('Coordinador: ' + coordinador),
+                p('Operadores: ' + (operadores ? operadores.length : 0)),
+                p('Máquinas: ' + (maquinas ? maquinas.length : 0)),
+                p('Indicador: ' + config.indicators[indicador].name)
+            ]);
+        },
+
+        week_range_content: function (weekRange, store, config, windowData) {
+            // Trazos de la gráfica principal y alertas SPC de la ventana de weeks
+            if (!store) {
+                return [dash_clientside.no_update, []];
+            }
+
+            store = decodeStore(store);
+            const slices = windowSlices(store, weekRange);
+            const alerts = windowAlerts(store, weekRange);
+            const keep = fitToBudget(store, slices, config.point_budget, chartWindow(windowData, store));
+            return [
+                mainChartPatch(store, slices, keep, alertAnnotations(store, alerts, config)),
+                alertRows(store, alerts, config)
+            ];
+        },
+
+        main_chart_zoom: function (relayout, weekRange, store, config) {
+            // Al hacer zoom, las series con todo el detalle que quepa en el
+            // presupuesto dentro de la ventana visible; la ventana se guarda
+            // para que mover el slider conserve ese detalle
+            const xRange = relayout ? relayoutWindow(relayout) : undefined;
+            if (xRange === undefined || !store) {
+                return [dash_clientside.no_update, dash_clientside.no_update];
+            }
+
+            store = decodeStore(store);
+            const windowData = xRange === null ? null : {indicador: store.indicador, range: xRange};
+            const slices = windowSlices(store, weekRange);
+            const total = slices.reduce((a, [start, stop]) => a + stop - start, 0);
+            if (total <= config.point_budget) {
+                // La gráfica ya lleva todos los puntos de la ventana del slider
+                return [dash_clientside.no_update, windowData];
+            }
+            const patch = new dash_clientside.Patch();
+            tracesPatch(patch, store, slices, fitToBudget(store, slices, config.point_budget, xRange));
+            return [patch.build(), windowData];
+        },
+
+        export_links: function (operadores, maquinas, indicador, weekRange, formato) {
+            // Misma consulta que arma el servidor en /export/<dataset>
+            if (!operadores || !operadores.length || !maquinas || !maquinas.length) {
+                return [null, null, null];
+            }
+            const params = new URLSearchParams();
+            operadores.forEach(op => params.append('operador', op));
+            maquinas.forEach(m => params.append('maquina', m));
+            params.append('indicador', indicador);
+            params.append('week_inicio', weekRange[0]);
+            params.append('week_fin', weekRange[1]);
+            params.append('formato', formato);
+            return ['filtered', 'summary', 'daily'].map(dataset => '/export/' + dataset + '?' + params.toString());
+        }
+    }
+});
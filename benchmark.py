@@ -0,0 +1,296 @@
+"""
+Benchmarks del ETL y de los dashboards sobre datos sintéticos.
+
+Genera (o reutiliza) un dataset con synthetic_data.py y mide:
+- Etapas del ETL: lectura de Excel, parseo de Shift, asignación de
+  operadores y agregación semanal
+- Callbacks de app_dash.py: update_main_content, update_week_range_stats y las exportaciones
+  (/export/<dataset> en CSV, CSV con gzip y Parquet)
+- Codificación JSON de la respuesta de update_main_content (tiempo y bytes)
+- El camino filtro → métricas → tabla de app.py (QueryEngine)
+- Cartas de control (spc.py) de toda la planta, completas y al recargar
+  (sin cambios y con una week nueva)
+- Tendencias de todas las series (trend.py)
+- Ajuste del modelo de efectos (effects.py) sobre el dataset diario
+
+Los callbacks se miden en frío (caches de consultas y de callbacks vacíos)
+y en caliente.
+Los resultados se guardan en JSON para comparar entre commits.
+
+Uso:
+    python benchmark.py                                   # Escala de la planta actual
+    python benchmark.py --machines 30 --operators 5 --years 3 --output bench_big.json
+    python benchmark.py --compare benchmark_results.json  # Compara contra una corrida previa
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+import effects
+import etl
+import storage
+import synthetic_data
+from exports import available_formats
+from queries import filter_key
+from series_index import SeriesIndex
+from spc import SPCEngine
+
+OUTPUT_FILE = 'benchmark_results.json'
+
+
+def measure(func, repeat=5, setup=None):
+    """
+    Ejecuta `func` `repeat` veces (llamando `setup` antes de cada una, fuera
+    del tiempo medido) y retorna min/mediana/promedio en segundos.
+    La salida de consola de `func` se descarta.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return {
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'mean_s': statistics.mean(times),
+        'repeat': repeat
+    }
+
+
+def git_commit():
+    """Commit actual del repositorio (None si no hay git)."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def list_machines(data_path):
+    """Máquinas con carpeta en data_path (KDF-*)."""
+    return sorted(name for name in os.listdir(data_path)
+                  if os.path.isdir(os.path.join(data_path, name)))
+
+
+# ==================== ETL ====================
+
+def bench_etl(data_path, operators_file, repeat):
+    """Mide cada etapa del ETL por separado sobre los Excel de data_path."""
+    results = {}
+    workbooks = etl.list_workbooks(data_path, list_machines(data_path))
+    df_operators = etl.load_operator_assignments(operators_file)
+
+    def read_excel():
+        # Shift + columna de valores (la segunda) de cada Excel, sin parsear
+        return [etl.read_sheet_columns(path, lambda header: header[:2]) for _, _, path in workbooks]
+
+    results['etl.excel_read'] = measure(read_excel, repeat)
+
+    raw = read_excel()
+    shifts = pd.concat([pd.Series(values['Shift'], dtype=object) for values in raw], ignore_index=True)
+
+    def parse():
+        parsed = etl.parse_shifts(shifts)
+        etl.week_numbers(parsed['Fecha'])
+
+    results['etl.shift_parsing'] = measure(parse, repeat)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_raw = pd.concat([etl.read_indicator_file(path, machine, prefix)
+                            for machine, prefix, path in workbooks], ignore_index=True)
+    results['etl.operator_assignment'] = measure(lambda: etl.assign_operators(df_raw, df_operators), repeat)
+
+    df_daily = etl.to_daily(etl.assign_operators(df_raw, df_operators)[0])
+    results['etl.weekly_groupby'] = measure(lambda: etl.aggregate_weekly(df_daily), repeat)
+
+    for name in results:
+        results[name]['rows'] = len(shifts)
+    return results
+
+
+# ==================== DASHBOARDS ====================
+
+def bench_dashboards(data_dir, repeat, cache_dir):
+    """
+    Mide los callbacks de app_dash.py y el camino de app.py con una selección
+    amplia (todos los operadores y máquinas, todas las weeks).
+    """
+    storage.DATA_DIR = data_dir
+    # Cache de callbacks propio del benchmark (no tocar el de los dashboards)
+    os.environ['PMI_CALLBACK_CACHE'] = os.path.join(cache_dir, 'callback_cache.sqlite')
+    import app_dash  # Carga los datasets de DATA_DIR al importar
+
+    df = app_dash.data.current.df
+    engine = app_dash.data.current.engine
+    operadores = sorted(df['Operador'].unique())
+    maquinas = sorted(df['Maquina'].unique())
+    indicador = sorted(df['Indicador'].unique())[0]
+    week_range = [int(df['Week'].min()), int(df['Week'].max())]
+    args = (operadores, maquinas, indicador, week_range)
+
+    def streamlit_path():
+        # Lo que app.py ejecuta en cada rerun después de los filtros
+        key = filter_key(*args)
+        engine.filtered(key)
+        engine.summary(key)
+        for operador in operadores:
+            for maquina in maquinas:
+                engine.series(operador, maquina, key)
+        engine.stats_table(key)
+        engine.coordinator_stats(key)
+
+    # Estado del cliente con un operador menos: la siguiente actualización
+    # de la gráfica viaja como Patch
+    version = app_dash.data.version
+    prev_state = app_dash.update_main_content(operadores[:-1], maquinas, indicador, version)[-1]
+    state = app_dash.update_main_content(*args[:3], version)[-1]
+
+    client = app_dash.app.server.test_client()
+
+    def export(dataset, fmt):
+        # Consume la respuesta completa (el archivo se genera mientras se lee)
+        query = urlencode({'operador': operadores, 'maquina': maquinas, 'indicador': indicador,
+                           'week_inicio': week_range[0], 'week_fin': week_range[1], 'formato': fmt},
+                          doseq=True)
+        return lambda: client.get(f"/export/{dataset}?{query}").get_data()
+
+    callbacks = {
+        'dash.update_main_content': lambda: app_dash.update_main_content(*args[:3], version),
+        'dash.update_main_content_patch': lambda: app_dash.update_main_content(*args[:3], version, prev_state),
+        'dash.update_week_range_stats': lambda: app_dash.update_week_range_stats(
+            week_range, state, operadores, maquinas, None, version),
+        'dash.export_filtered.csv': export('filtered', 'csv'),
+        'dash.export_filtered.csv.gz': export('filtered', 'csv.gz'),
+        'dash.export_summary.csv': export('summary', 'csv'),
+        'dash.export_daily.csv.gz': export('daily', 'csv.gz'),
+        'streamlit.filter_stats': streamlit_path
+    }
+    if 'parquet' in available_formats():
+        callbacks['dash.export_daily.parquet'] = export('daily', 'parquet')
+
+    def clear_caches():
+        engine.cache.clear()
+        app_dash.callback_cache.clear()
+
+    rows = len(engine.filtered(filter_key(*args)))
+    results = {}
+    for name, func in callbacks.items():
+        results[name + '.cold'] = measure(func, repeat, setup=clear_caches)
+        func()
+        results[name + '.warm'] = measure(func, repeat)
+        results[name + '.cold']['rows'] = results[name + '.warm']['rows'] = rows
+
+    # Respuesta completa codificada como lo hace Dash (figura, series-store y estado)
+    response = list(app_dash.update_main_content(*args[:3], version))
+    results['dash.serialize_main_content'] = measure(lambda: to_json_plotly(response), repeat)
+    results['dash.serialize_main_content']['bytes'] = len(to_json_plotly(response))
+    results['dash.serialize_main_content']['rows'] = rows
+
+    # Cartas de control de toda la planta: completas, al recargar sin cambios
+    # y al recargar con una week nueva en cada serie
+    spc = engine.spc
+    last = df.loc[df.groupby(['Indicador', 'Maquina', 'Operador'], observed=True)['Week'].idxmax()]
+    df_next = pd.concat([df, last.assign(Week=last['Week'] + 1)], ignore_index=True)
+    index_next = SeriesIndex(df_next)
+    results['spc.full'] = measure(lambda: SPCEngine(df, spc.better, engine.index), repeat)
+    results['spc.refresh'] = measure(lambda: spc.refresh(df, engine.index), repeat)
+    results['spc.refresh_week'] = measure(lambda: spc.refresh(df_next, index_next), repeat)
+    results['spc.full']['rows'] = results['spc.refresh']['rows'] = len(df)
+    results['spc.refresh_week']['rows'] = len(df_next)
+
+    # Tendencias de todas las series (ranking por mejora) en una ventana de weeks
+    results['trend.all_series'] = measure(lambda: engine.trend.all_series(week_range), repeat)
+    results['trend.all_series']['rows'] = len(df)
+
+    # Modelo de efectos (operador, máquina, turno, week) sobre el dataset diario
+    if effects.available():
+        df_daily = app_dash.data.current.df_daily
+        results['effects.fit'] = measure(lambda: effects.EffectsModel(df_daily), repeat)
+        results['effects.fit']['rows'] = len(df_daily)
+    return results
+
+
+def compare(current, previous):
+    """Imprime la mediana actual contra la de una corrida previa."""
+    print(f"\n📊 Comparación contra {previous.get('commit')} ({previous.get('timestamp')})")
+    for name, result in current['results'].items():
+        before = previous.get('results', {}).get(name)
+        if before is None:
+            continue
+        ratio = result['median_s'] / before['median_s'] if before['median_s'] else float('nan')
+        size = f"  {before['bytes']:,} → {result['bytes']:,} bytes" if 'bytes' in before and 'bytes' in result else ''
+        print(f"   {name:40s} {before['median_s'] * 1000:10.2f} ms → "
+              f"{result['median_s'] * 1000:10.2f} ms  (x{ratio:.2f}){size}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks del ETL y los dashboards")
+    parser.add_argument('--machines', type=int, default=6)
+    parser.add_argument('--operators', type=int, default=3, help="Operadores por máquina")
+    parser.add_argument('--shifts', type=int, default=3, help="Turnos por día")
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--data-dir', default=None,
+                        help="Usar un dataset ya generado en vez de generar uno temporal")
+    parser.add_argument('--skip-etl', action='store_true', help="Solo medir los dashboards")
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    parser.add_argument('--compare', default=None, help="JSON de una corrida previa")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir
+        scale = {'machines': args.machines, 'operators_per_machine': args.operators,
+                 'shifts': args.shifts, 'years': args.years}
+        if data_dir is None:
+            data_dir = tmp_dir
+            print("🔄 Generando datos sintéticos...")
+            with contextlib.redirect_stdout(io.StringIO()):
+                info = synthetic_data.generate_plant(data_dir, args.machines, args.operators,
+                                                     args.shifts, args.years, excel=not args.skip_etl)
+            scale.update({key: info[key] for key in ['lecturas', 'registros_diarios', 'registros_semanales']})
+        else:
+            scale = {'data_dir': os.path.abspath(data_dir)}
+
+        results = {}
+        if not args.skip_etl:
+            print("⏱️  Etapas del ETL...")
+            results.update(bench_etl(os.path.join(data_dir, etl.DATA_PATH),
+                                     os.path.join(data_dir, etl.OPERATORS_FILE), args.repeat))
+        print("⏱️  Callbacks de los dashboards...")
+        results.update(bench_dashboards(data_dir, args.repeat, tmp_dir))
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'scale': scale,
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\n{'Benchmark':40s} {'mediana (ms)':>14s} {'min (ms)':>10s}")
+    for name, result in results.items():
+        size = f"  {result['bytes']:,} bytes" if 'bytes' in result else ''
+        print(f"{name:40s} {result['median_s'] * 1000:14.2f} {result['min_s'] * 1000:10.2f}{size}")
+    print(f"\n✅ Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
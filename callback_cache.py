@@ -0,0 +1,257 @@
+"""
+Cache de resultados de callbacks de Dash compartido entre workers.
+
+La llave de cada resultado es (id del callback, versión del código,
+versión del dataset cargado, entradas normalizadas): ni datos nuevos ni un
+deploy con código nuevo sirven resultados viejos. Se busca en orden en una
+lista de niveles:
+- MemoryTier: LRU dentro del proceso (sin serializar)
+- SQLiteTier: archivo SQLite local que leen todos los workers del host. Los
+  resultados se guardan como JSON (como los manda Dash), nunca con pickle,
+  y el archivo vive en un directorio privado del usuario del servidor
+
+Un hit en un nivel inferior se copia a los niveles superiores. Cualquier
+objeto con get(key) / set(key, value) puede usarse como nivel.
+
+Uso:
+    cache = CallbackCache.from_env(version=dataset_version(WEEKLY))
+
+    @app.callback(...)
+    @cache.memoize('update_main_content')
+    def update_main_content(...):
+        ...
+"""
+import functools
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import stat
+import threading
+import time
+
+import dash
+import plotly
+from plotly.io.json import to_json_plotly
+
+import storage
+from queries import LRUCache
+
+# Archivo SQLite compartido ('off' lo desactiva). Por defecto en
+# PMI_CACHE_DIR o en .cache junto a los datos (storage.DATA_DIR)
+CACHE_PATH = os.environ.get('PMI_CALLBACK_CACHE')
+CACHE_DIR = os.environ.get('PMI_CACHE_DIR')
+# Segundos que vive un resultado en el nivel compartido
+CACHE_TTL = int(os.environ.get('PMI_CALLBACK_CACHE_TTL', 3600))
+
+_MISSING = object()
+
+
+def normalize_inputs(args, kwargs=None):
+    """
+    Representación canónica de las entradas de un callback: JSON con llaves
+    ordenadas. Los valores que no son JSON (fechas, numpy) se convierten a str.
+    """
+    return json.dumps([list(args), kwargs or {}], sort_keys=True, default=str,
+                      separators=(',', ':'), ensure_ascii=False)
+
+
+def code_version():
+    """
+    Huella del código que arma los resultados: los módulos de la app más las
+    versiones de Dash y Plotly. Cambia con cada deploy que toque el código.
+    """
+    digest = hashlib.sha256(f"{dash.__version__}:{plotly.__version__}".encode())
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def default_cache_path():
+    """Archivo del nivel compartido: CACHE_PATH o, si no se indica, dentro de CACHE_DIR."""
+    if CACHE_PATH:
+        return CACHE_PATH
+    cache_dir = CACHE_DIR or os.path.join(storage.DATA_DIR, '.cache')
+    return os.path.join(cache_dir, 'callback_cache.sqlite')
+
+
+def check_cache_path(path):
+    """
+    Crea el directorio del archivo (0700) si no existe y revisa que el
+    directorio y el archivo sean del usuario del proceso y que nadie más
+    pueda escribir en ellos. Retorna el motivo para rechazarlo o None.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    except OSError as e:
+        return f"no se pudo crear {directory}: {e}"
+    if not hasattr(os, 'getuid'):
+        return None
+    for target in (directory, path):
+        try:
+            info = os.lstat(target)
+        except FileNotFoundError:
+            continue
+        if stat.S_ISLNK(info.st_mode):
+            return f"{target} es un enlace simbólico"
+        if info.st_uid != os.getuid():
+            return f"{target} no es del usuario del proceso"
+        if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            return f"otros usuarios pueden escribir en {target}"
+    return None
+
+
+class MemoryTier:
+    """Nivel en memoria del proceso (LRU acotado)."""
+
+    def __init__(self, maxsize=256):
+        self.lru = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self.lru.get(key, _MISSING)
+
+    def set(self, key, value):
+        with self._lock:
+            self.lru.put(key, value)
+
+    def clear(self):
+        with self._lock:
+            self.lru.clear()
+
+
+class SQLiteTier:
+    """
+    Nivel compartido en un archivo SQLite (modo WAL, varios procesos leen y
+    escriben). Los valores se guardan como JSON de Plotly/Dash (figuras,
+    Patch y no_update incluidos) y expiran después de `ttl` segundos. Los errores de SQLite no interrumpen el callback: se tratan
+    como miss.
+    """
+
+    def __init__(self, path, ttl=CACHE_TTL, max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS callback_cache ("
+                         "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM callback_cache WHERE key = ? AND created >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️  Cache compartido no disponible: {e}")
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return _MISSING
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO callback_cache (key, value, created) VALUES (?, ?, ?)",
+                             (key, to_json_plotly(value), time.time()))
+                # Limpieza: expirados y, si se pasa del máximo, los más viejos
+                conn.execute("DELETE FROM callback_cache WHERE created < ?", (time.time() - self.ttl,))
+                conn.execute("DELETE FROM callback_cache WHERE key IN (SELECT key FROM callback_cache "
+                             "ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        except sqlite3.Error as e:
+            print(f"⚠️  No se pudo guardar en el cache compartido: {e}")
+
+    def clear(self):
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM callback_cache")
+        except sqlite3.Error as e:
+            print(f"⚠️  No se pudo limpiar el cache compartido: {e}")
+
+
+class CallbackCache:
+    """Cache de callbacks por niveles, ligado a una versión del dataset."""
+
+    def __init__(self, tiers, version='', code=None):
+        self.tiers = list(tiers)
+        self.version = version
+        self.code = code_version() if code is None else code
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, version='', memory_size=256):
+        """
+        Nivel en memoria + nivel SQLite en default_cache_path().
+        PMI_CALLBACK_CACHE=off (o un archivo que no pasa check_cache_path)
+        deja solo el nivel en memoria.
+        """
+        tiers = [MemoryTier(memory_size)]
+        path = default_cache_path()
+        if path.lower() != 'off':
+            problem = check_cache_path(path)
+            if problem is None:
+                tiers.append(SQLiteTier(path, CACHE_TTL))
+            else:
+                print(f"⚠️  Cache compartido desactivado: {problem}")
+        return cls(tiers, version)
+
+    def make_key(self, callback_id, args, kwargs=None):
+        raw = '\x1f'.join([callback_id, self.code, self.version, normalize_inputs(args, kwargs)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get_or_compute(self, key, compute):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not _MISSING:
+                # Copiar a los niveles más rápidos
+                for upper in self.tiers[:i]:
+                    upper.set(key, value)
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        value = compute()
+        for tier in self.tiers:
+            tier.set(key, value)
+        return value
+
+    def memoize(self, callback_id, normalize=None):
+        """
+        Decorador para la función de un callback. `normalize(*args)` puede
+        reordenar o limpiar las entradas antes de armar la llave (por defecto
+        se usan tal cual).
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key_args = normalize(*args) if normalize is not None else args
+                key = self.make_key(callback_id, key_args, kwargs)
+                return self.get_or_compute(key, lambda: func(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
@@ -0,0 +1,91 @@
+"""
+Cubo de agregados por serie para estadísticas de rangos de weeks en O(1).
+
+Usa el mismo orden que SeriesIndex: (Indicador, Maquina, Operador, Week).
+Sobre ese orden guarda, por fila, sumas acumuladas (valor, valor², conteo)
+y una sparse table de mínimos/máximos. La estadística de cualquier rango de
+filas contiguo [start, stop) se obtiene con restas de prefijos y dos
+consultas a la sparse table, sin recorrer las filas.
+
+Los valores se centran en el promedio de su serie antes de acumular, para
+que la varianza (suma de cuadrados menos cuadrado de la suma) no pierda
+precisión en series con valores grandes.
+"""
+import numpy as np
+
+from series_index import SeriesIndex
+
+
+def _sparse_table(values, func):
+    """Niveles k con func sobre ventanas de 2**k filas: table[k][i] = func(values[i:i + 2**k])."""
+    table = [values]
+    width = 1
+    while 2 * width <= len(values):
+        prev = table[-1]
+        table.append(func(prev[:-width], prev[width:]))
+        width *= 2
+    return table
+
+
+def _range_query(table, start, stop):
+    """func sobre values[start:stop] (stop > start) con dos ventanas traslapadas."""
+    k = (stop - start).bit_length() - 1
+    level = table[k]
+    return level[start], level[stop - (1 << k)]
+
+
+class StatsCube:
+    """Sumas acumuladas y sparse tables de Valor_Promedio en el orden del índice de series."""
+
+    def __init__(self, df, index=None, value_col='Valor_Promedio'):
+        self.index = index if index is not None else SeriesIndex(df)
+        values = df[value_col].to_numpy(dtype='float64')[self.index.positions]
+        valid = ~np.isnan(values)
+        n = len(values)
+
+        # Promedio de la serie de cada fila (referencia para centrar)
+        self.reference = np.zeros(n)
+        for start, stop in self.index.slices.values():
+            chunk = values[start:stop]
+            if valid[start:stop].any():
+                self.reference[start:stop] = np.nanmean(chunk)
+
+        # Prefijos en precisión extendida: la resta de dos prefijos no debe
+        # mover la desviación estándar de la tabla al redondear a 2 decimales
+        centered = np.where(valid, values - self.reference, 0.0).astype(np.longdouble)
+        zero = np.zeros(1, dtype=np.longdouble)
+        self.sum = np.concatenate([zero, np.cumsum(centered)])
+        self.sum_sq = np.concatenate([zero, np.cumsum(centered ** 2)])
+        self.count = np.concatenate([[0], np.cumsum(valid)])
+
+        self.min_table = _sparse_table(np.where(valid, values, np.inf), np.minimum)
+        self.max_table = _sparse_table(np.where(valid, values, -np.inf), np.maximum)
+
+    def range_stats(self, start, stop):
+        """
+        Retorna (promedio, mínimo, máximo, desv_est, conteo) de las filas
+        [start, stop) del orden del índice. Sin valores → NaN y conteo 0.
+        """
+        count = int(self.count[stop] - self.count[start])
+        if count == 0:
+            return np.nan, np.nan, np.nan, np.nan, 0
+
+        total = self.sum[stop] - self.sum[start]
+        total_sq = self.sum_sq[stop] - self.sum_sq[start]
+        mean = self.reference[start] + float(total / count)
+        if count > 1:
+            # Varianza muestral (ddof=1), igual que pandas
+            std = float(np.sqrt(max(total_sq - total * total / count, 0.0) / (count - 1)))
+        else:
+            std = np.nan
+
+        minimum = min(_range_query(self.min_table, start, stop))
+        maximum = max(_range_query(self.max_table, start, stop))
+        return mean, minimum, maximum, std, count
+
+    def series_stats(self, indicador, maquina, operador, week_range=None):
+        """Estadísticas de una serie dentro del rango de weeks [inicio, fin]."""
+        start, stop = self.index.series_slice(indicador, maquina, operador, week_range)
+        if stop <= start:
+            return np.nan, np.nan, np.nan, np.nan, 0
+        return self.range_stats(start, stop)
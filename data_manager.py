@@ -0,0 +1,142 @@
+"""
+Recarga de los datos procesados sin reiniciar los dashboards.
+
+DataManager guarda la versión activa de los datos (lo que regresa `load`)
+junto con su versión en disco (`version_fn`, por ejemplo
+storage.dataset_version). Al leer `current`, como mucho cada
+`poll_seconds`, revisa la versión de los archivos; si cambió y se mantuvo
+igual entre dos revisiones (el ETL ya terminó de escribir), carga la nueva
+versión en un hilo aparte y la activa con una sola asignación. Los
+callbacks que ya tomaron la versión anterior terminan con ella.
+
+La revisión la disparan las propias consultas: no hay un hilo vigilando
+todo el tiempo, así que es seguro crear el DataManager antes del fork de
+los workers (wsgi.py). Con gunicorn y preload_app los workers no recargan:
+el proceso maestro revisa la versión (`ready_version`), carga la nueva y
+reemplaza los workers (ver gunicorn.conf.py), así todos sirven la misma
+versión y siguen compartiendo sus páginas de memoria.
+
+Si se da `refresh(datos_anteriores)`, las recargas lo usan en lugar de
+`load()` para aprovechar lo ya calculado con la versión anterior.
+
+Uso:
+    manager = DataManager(load_data, lambda: dataset_version(WEEKLY))
+    manager.on_swap(lambda version, data: print(version))
+    data = manager.current   # Tomar una vez por callback
+"""
+import os
+import threading
+import time
+
+from metrics import log_event, stage
+
+# Segundos entre revisiones de la versión en disco (0 desactiva la recarga)
+DATA_POLL_SECONDS = int(os.environ.get('PMI_DATA_POLL', 30))
+
+
+class DataManager:
+    """Versión activa de los datos con recarga en segundo plano."""
+
+    def __init__(self, load, version_fn, poll_seconds=DATA_POLL_SECONDS, refresh=None):
+        self.load = load
+        self.refresh = refresh
+        self.version_fn = version_fn
+        self.poll_seconds = poll_seconds
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._loading = False
+        self._pending = None
+        self._last_check = time.monotonic()
+
+        version = version_fn()
+        # (versión, datos): se reemplaza completa para que el cambio sea atómico
+        with stage('load'):
+            self._active = (version, load())
+
+    @property
+    def current(self):
+        """Datos de la versión activa (revisa si hay una nueva cada poll_seconds)."""
+        return self.snapshot()[1]
+
+    def snapshot(self):
+        """
+        (versión, datos) activos, tomados juntos: sirve para usar la versión
+        como llave de cache de lo que se calcula con esos datos.
+        """
+        if self.poll_seconds > 0 and time.monotonic() - self._last_check >= self.poll_seconds:
+            self._last_check = time.monotonic()
+            self.check()
+        return self._active
+
+    @property
+    def version(self):
+        return self._active[0]
+
+    def on_swap(self, listener):
+        """Registra listener(version, datos), llamado después de activar una versión nueva."""
+        self._listeners.append(listener)
+
+    def ready_version(self):
+        """
+        Compara la versión en disco con la activa. Retorna la versión nueva
+        cuando se ve igual en dos revisiones seguidas (None si no hay o el
+        ETL sigue escribiendo).
+        """
+        try:
+            version = self.version_fn()
+        except OSError as e:
+            print(f"⚠️  No se pudo revisar la versión de los datos: {e}")
+            return None
+
+        if version == self._active[0]:
+            self._pending = None
+            return None
+        if version != self._pending:
+            # Puede que el ETL siga escribiendo: esperar a la siguiente revisión
+            self._pending = version
+            return None
+        return version
+
+    def check(self, background=True):
+        """
+        Carga la versión en disco si cambió (ver ready_version). Retorna True
+        si se inició (o, con background=False, se completó) una recarga.
+        """
+        version = self.ready_version()
+        if version is None:
+            return False
+
+        with self._lock:
+            if self._loading:
+                return False
+            self._loading = True
+        if background:
+            threading.Thread(target=self.reload, args=(version,), daemon=True,
+                             name='data-reload').start()
+            return True
+        return self.reload(version)
+
+    def reload(self, version=None):
+        """Carga los datos y los activa. Retorna True si cambió la versión activa."""
+        try:
+            version = version or self.version_fn()
+            if version == self._active[0]:
+                return False
+            start = time.perf_counter()
+            with stage('load'):
+                data = self.refresh(self._active[1]) if self.refresh else self.load()
+        except Exception as e:
+            print(f"⚠️  No se pudo cargar la versión {version} de los datos: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._loading = False
+
+        self._active = (version, data)
+        self._pending = None
+        for listener in self._listeners:
+            listener(version, data)
+        seconds = time.perf_counter() - start
+        log_event('data_swap', version=version, seconds=round(seconds, 6))
+        print(f"🔄 Datos actualizados a la versión {version} ({seconds:.1f} s)")
+        return True
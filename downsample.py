@@ -0,0 +1,127 @@
+"""
+Reducción de puntos para la gráfica de evolución.
+
+Con muchas series (vista de coordinador, historia larga) la gráfica manda
+más puntos de los que el navegador puede dibujar con SVG. Aquí se decide:
+- Cuántos puntos puede llevar cada serie para que la figura completa no
+  pase de CHART_POINT_BUDGET (reduciendo con LTTB, que conserva la forma,
+  o con mínimos/máximos por bloque)
+- Si la figura debe usar trazos WebGL (más de WEBGL_THRESHOLD puntos)
+
+Los límites se configuran con las variables de entorno
+PMI_CHART_POINT_BUDGET y PMI_WEBGL_THRESHOLD.
+"""
+import os
+
+import numpy as np
+
+CHART_POINT_BUDGET = int(os.environ.get('PMI_CHART_POINT_BUDGET', 5000))
+WEBGL_THRESHOLD = int(os.environ.get('PMI_WEBGL_THRESHOLD', 1000))
+
+# Puntos mínimos por serie (primero, último y al menos uno intermedio)
+MIN_POINTS_PER_SERIES = 3
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: posiciones de `n_out` puntos que
+    conservan la forma de la serie. Siempre incluye el primero y el último.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1], dtype=np.intp)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    # n_out - 2 bloques sobre los puntos intermedios (el primero y el último van fijos)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # Promedio del bloque siguiente (para el último bloque, el último punto)
+        if i + 2 < len(edges):
+            avg_x = x[stop:edges[i + 2]].mean()
+            avg_y = y[stop:edges[i + 2]].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+
+        # Punto del bloque que forma el triángulo más grande con el anterior y el promedio
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + (int(np.nanargmax(area)) if not np.isnan(area).all() else 0)
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(x, y, n_out):
+    """
+    Mínimo y máximo de cada bloque ((n_out - 2) // 2 bloques de igual tamaño),
+    más el primer y el último punto. Conserva los picos de la serie.
+    """
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 4:
+        return lttb_indices(x, y, n_out)
+
+    y = np.asarray(y, dtype='float64')
+    valid = np.flatnonzero(~np.isnan(y))
+    n_buckets = max((n_out - 2) // 2, 1)
+    bucket = (valid * n_buckets) // n
+
+    # Orden por (bloque, valor): el primero de cada bloque es el mínimo y el último el máximo
+    order = valid[np.lexsort((y[valid], bucket))]
+    bucket_sorted = (order * n_buckets) // n
+    first = np.flatnonzero(np.diff(bucket_sorted, prepend=-1))
+    last = np.append(first[1:] - 1, len(order) - 1)
+    return np.unique(np.concatenate([[0, n - 1], order[first], order[last]]))
+
+
+DOWNSAMPLERS = {
+    'lttb': lttb_indices,
+    'minmax': minmax_indices
+}
+
+
+def fit_to_budget(frames, budget=CHART_POINT_BUDGET, x_col='Week', y_col='Valor_Promedio',
+                  method='lttb', window=None):
+    """
+    Recorta cada DataFrame de `frames` a la ventana [x_inicio, x_fin] (si se
+    indica, con un punto extra a cada lado para que las líneas lleguen al
+    borde) y, si el total de puntos pasa de `budget`, reduce cada serie a
+    budget // número de series puntos.
+    Retorna (frames, reducido) donde reducido indica si se quitaron puntos.
+    """
+    if window is not None:
+        clipped = []
+        for df_plot in frames:
+            x = df_plot[x_col].to_numpy()
+            start = max(int(np.searchsorted(x, window[0], 'left')) - 1, 0)
+            stop = int(np.searchsorted(x, window[1], 'right')) + 1
+            clipped.append(df_plot.iloc[start:stop])
+        frames = clipped
+
+    total = sum(len(df_plot) for df_plot in frames)
+    if not frames or total <= budget:
+        return frames, False
+
+    per_series = max(budget // len(frames), MIN_POINTS_PER_SERIES)
+    downsampler = DOWNSAMPLERS[method]
+    reduced = []
+    for df_plot in frames:
+        if len(df_plot) > per_series:
+            keep = downsampler(df_plot[x_col].to_numpy(), df_plot[y_col].to_numpy(), per_series)
+            df_plot = df_plot.iloc[keep]
+        reduced.append(df_plot)
+    return reduced, True
+
+
+def use_webgl(n_points, threshold=WEBGL_THRESHOLD):
+    """True si la figura debe usar Scattergl en lugar de Scatter (SVG)."""
+    return n_points > threshold
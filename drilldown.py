@@ -0,0 +1,174 @@
+"""
+Detalle por turno (data_daily_processed) con paginación del lado del servidor.
+
+DailyIndex ordena los registros diarios por (Maquina, Indicador, Fecha) una
+sola vez: cada (máquina, indicador) queda en un rango contiguo de filas
+ordenado por fecha, así que una selección se resuelve con búsquedas binarias
+y no recorriendo la tabla completa.
+
+page_records aplica el filtro y el orden de un DataTable con
+page_action/sort_action/filter_action='custom' y regresa solo la página
+visible.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+INDEX_KEYS = ['Maquina', 'Indicador']
+
+# Columnas que se muestran en el detalle
+DRILLDOWN_COLUMNS = ['Fecha', 'Turno', 'Week', 'Maquina', 'Operador', 'Coordinador', 'Valor']
+
+# Operadores del filter_query de DataTable. Se buscan al inicio del texto que
+# sigue a '{columna}', así que un valor como 'Jorge Luis' no se confunde con
+# 'ge '; '>=' va antes que '>' (y '<=', '!=' antes que '<', '=')
+FILTER_OPERATORS = [
+    ('contains ',), ('datestartswith ',),
+    ('ge ', '>='), ('le ', '<='), ('lt ', '<'), ('gt ', '>'),
+    ('ne ', '!='), ('eq ', '=')
+]
+
+
+class DailyIndex:
+    """Mapa (Maquina, Indicador) → rango de filas del dataset diario ordenado por Fecha."""
+
+    def __init__(self, df):
+        self.df = df
+        order = np.lexsort([
+            df['Fecha'].to_numpy(),
+            *[df[col].astype(str).to_numpy() for col in reversed(INDEX_KEYS)]
+        ])
+        self.positions = order
+        self.fechas = df['Fecha'].to_numpy()[order]
+        self.weeks = df['Week'].to_numpy()[order]
+
+        df_sorted = df[INDEX_KEYS].iloc[order]
+        sizes = df_sorted.groupby(INDEX_KEYS, observed=True, sort=False).size()
+        stops = np.cumsum(sizes.to_numpy())
+        starts = stops - sizes.to_numpy()
+        self.slices = {
+            key: (int(start), int(stop))
+            for key, start, stop in zip(sizes.index, starts, stops)
+        }
+
+    def rows(self, maquinas, indicador, week_range=None, fecha_range=None):
+        """
+        Posiciones (en el orden del índice: máquina, fecha) de los registros
+        de `indicador` en `maquinas`, dentro del rango de weeks y/o fechas.
+        """
+        parts = []
+        for maquina in dict.fromkeys(maquinas):
+            start, stop = self.slices.get((maquina, indicador), (0, 0))
+            if fecha_range is not None and stop > start:
+                fechas = self.fechas[start:stop]
+                low, high = np.datetime64(fecha_range[0]), np.datetime64(fecha_range[1])
+                start, stop = (start + int(np.searchsorted(fechas, low, 'left')),
+                               start + int(np.searchsorted(fechas, high, 'right')))
+            if week_range is not None and stop > start:
+                # La week continua crece con la fecha (también entre años fiscales)
+                weeks = self.weeks[start:stop]
+                start, stop = (start + int(np.searchsorted(weeks, week_range[0], 'left')),
+                               start + int(np.searchsorted(weeks, week_range[1], 'right')))
+            if stop > start:
+                parts.append(self.positions[start:stop])
+
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate(parts)
+
+    def query(self, operadores, maquinas, indicador, week_range=None, fecha_range=None):
+        """Registros diarios de la selección (orden: máquina, fecha)."""
+        df_rows = self.df.iloc[self.rows(maquinas, indicador, week_range, fecha_range)]
+        if operadores is not None:
+            df_rows = df_rows[df_rows['Operador'].isin(operadores)]
+        return df_rows
+
+
+def split_filter_part(filter_part):
+    """
+    Separa una condición de filter_query ('{Valor} > 0.5') en
+    (columna, operador, valor). Retorna (None, None, None) si no se reconoce.
+    """
+    name_start, name_end = filter_part.find('{'), filter_part.find('}')
+    if name_start < 0 or name_end < name_start:
+        return None, None, None
+    name = filter_part[name_start + 1:name_end]
+    rest = filter_part[name_end + 1:].lstrip()
+
+    for operator_group in FILTER_OPERATORS:
+        for operator in operator_group:
+            if not rest.startswith(operator):
+                continue
+            value_part = rest[len(operator):].strip()
+            if value_part and value_part[0] == value_part[-1] and value_part[0] in ("'", '"', '`'):
+                value = value_part[1:-1].replace('\\' + value_part[0], value_part[0])
+            else:
+                value = value_part
+            return name, operator_group[0].strip(), value
+    return None, None, None
+
+
+def _column_filter(column, operator, value):
+    """Máscara booleana de una condición sobre una columna (respetando su tipo)."""
+    if operator == 'contains':
+        return column.astype(str).str.contains(value, case=False, regex=False)
+
+    if pd.api.types.is_datetime64_any_dtype(column):
+        if operator == 'datestartswith':
+            return column.dt.strftime('%Y-%m-%d').str.startswith(value)
+        try:
+            value = pd.Timestamp(value)
+        except (TypeError, ValueError):
+            # Fecha que no se puede leer ('{Fecha} > abc'): se ignora la condición, como en Dash
+            return pd.Series(True, index=column.index)
+    elif pd.api.types.is_numeric_dtype(column):
+        value = pd.to_numeric(value, errors='coerce')
+    else:
+        column = column.astype(str)
+        if operator == 'datestartswith':
+            return column.str.startswith(value)
+
+    if operator == 'datestartswith':
+        return pd.Series(False, index=column.index)
+    comparisons = {
+        'ge': column.ge, 'le': column.le, 'lt': column.lt,
+        'gt': column.gt, 'ne': column.ne, 'eq': column.eq
+    }
+    return comparisons[operator](value)
+
+
+def apply_filter_query(df_rows, filter_query):
+    """Aplica un filter_query de DataTable ('{A} > 1 && {B} contains x')."""
+    if not filter_query:
+        return df_rows
+    mask = pd.Series(True, index=df_rows.index)
+    for filter_part in filter_query.split(' && '):
+        name, operator, value = split_filter_part(filter_part)
+        if name in df_rows.columns:
+            mask &= _column_filter(df_rows[name], operator, value).fillna(False).astype(bool)
+    return df_rows[mask]
+
+
+def page_records(df_rows, page_current=0, page_size=20, sort_by=None, filter_query=''):
+    """
+    Filtra, ordena y pagina los registros del detalle.
+    Retorna (registros de la página como lista de dicts, número de páginas).
+    """
+    df_rows = apply_filter_query(df_rows[DRILLDOWN_COLUMNS], filter_query)
+
+    if sort_by:
+        df_rows = df_rows.sort_values(
+            [col['column_id'] for col in sort_by],
+            ascending=[col['direction'] == 'asc' for col in sort_by],
+            kind='stable'
+        )
+
+    page_count = max(math.ceil(len(df_rows) / page_size), 1)
+    start = (page_current or 0) * page_size
+    df_page = df_rows.iloc[start:start + page_size].copy()
+
+    # Solo la página visible se convierte a texto para el navegador
+    df_page['Fecha'] = df_page['Fecha'].dt.strftime('%Y-%m-%d')
+    df_page['Valor'] = df_page['Valor'].astype('float64').round(4)
+    return df_page.to_dict('records'), page_count
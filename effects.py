@@ -0,0 +1,126 @@
+"""
+Efectos de operador ajustados por máquina, turno y week.
+
+Los operadores rotan entre líneas KDF y turnos (operators_assignments.csv),
+así que el promedio crudo de un operador también mide las máquinas y
+turnos que le tocaron. Por indicador se ajusta, sobre el dataset diario
+(un registro por turno):
+
+    Valor = media + operador + máquina + turno + week + error
+
+con una matriz de diseño dispersa (cuatro unos por fila, sin
+get_dummies) y mínimos cuadrados iterativos (scipy.sparse.linalg.lsqr).
+Un amortiguamiento pequeño (EFFECTS_DAMP) encoge hacia cero los efectos
+con pocos turnos. Después cada bloque de efectos se centra en cero y su
+promedio pasa a la media, así que el puntaje ajustado de un operador
+(media + su efecto) es lo que promediaría en una máquina, turno y week
+promedio, en las unidades del indicador. Si un operador nunca cambió de
+máquina (o de turno), su efecto y el de la máquina no se pueden separar
+con los datos: el amortiguamiento reparte la diferencia entre los dos.
+
+La week es la Week de los datasets (continua, no se repite entre años
+fiscales; ver etl.fiscal_weeks), la misma de los dashboards.
+
+scipy es opcional: sin él no se calcula el puntaje ajustado.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy import sparse
+    from scipy.sparse.linalg import lsqr
+except ImportError:  # scipy es opcional: sin él no hay puntaje ajustado
+    sparse = None
+
+from metrics import log_event
+
+ADJUSTED_COLUMN = 'Puntaje Ajustado'
+ADJUSTED_NOTE = ("Puntaje Ajustado: promedio del operador en una máquina, turno y week promedio "
+                 "(todo el histórico, sin el efecto de las líneas y turnos que le tocaron).")
+
+# Factores del modelo (nombre del efecto → columna del dataset diario)
+FACTORS = {'operador': 'Operador', 'maquina': 'Maquina', 'turno': 'Turno', 'week': 'Week'}
+
+# Amortiguamiento de lsqr: equivale a sumar a cada efecto ~1 turno con valor 0
+EFFECTS_DAMP = 1.0
+EFFECTS_TOL = 1e-8
+
+
+def available():
+    """True si está instalado scipy (necesario para ajustar el modelo)."""
+    return sparse is not None
+
+
+def design_matrix(df):
+    """
+    Matriz dispersa (filas × niveles de todos los factores) con un 1 por
+    factor en cada fila, más los niveles de cada factor en el orden de sus
+    columnas.
+    """
+    codes, levels = [], {}
+    offset = 0
+    for name, col in FACTORS.items():
+        factor_codes, uniques = pd.factorize(df[col], sort=True)
+        codes.append(factor_codes + offset)
+        levels[name] = (offset, pd.Index(np.asarray(uniques), name=col))
+        offset += len(uniques)
+
+    n = len(df)
+    indices = np.column_stack(codes).ravel()
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices)), indices, np.arange(0, len(indices) + 1, len(FACTORS))),
+        shape=(n, offset)
+    )
+    return matrix, levels
+
+
+def fit_effects(df, damp=EFFECTS_DAMP):
+    """
+    Ajusta el modelo sobre las filas de un indicador (columnas Valor y las
+    de FACTORS). Retorna un dict con 'media', una Serie de efectos por
+    factor (centrados en cero), 'r2' e 'iteraciones'.
+    """
+    y = df['Valor'].to_numpy(dtype='float64')
+    matrix, levels = design_matrix(df)
+    mean = y.mean()
+    solution, _, iterations = lsqr(matrix, y - mean, damp=damp,
+                                   atol=EFFECTS_TOL, btol=EFFECTS_TOL)[:3]
+
+    fit = {'iteraciones': int(iterations)}
+    for name, (offset, index) in levels.items():
+        effects = solution[offset:offset + len(index)]
+        # Centrar cada bloque: el promedio del bloque pasa a la media
+        mean += effects.mean()
+        fit[name] = pd.Series(effects - effects.mean(), index=index)
+    fit['media'] = mean
+
+    total = ((y - y.mean()) ** 2).sum()
+    residual = ((y - y.mean() - matrix @ solution) ** 2).sum()
+    fit['r2'] = 1 - residual / total if total > 0 else np.nan
+    return fit
+
+
+class EffectsModel:
+    """Efectos ajustados de cada indicador (no guarda el dataset diario)."""
+
+    def __init__(self, df_daily):
+        self.fits = {}
+        if not available():
+            return
+
+        start = time.perf_counter()
+        df = df_daily[['Indicador', 'Valor', *FACTORS.values()]]
+        df = df[df['Valor'].notna()]
+        for indicador, rows in df.groupby('Indicador', observed=True):
+            self.fits[indicador] = fit_effects(rows)
+        log_event('effects_fit', seconds=round(time.perf_counter() - start, 6), rows=len(df),
+                  iterations={ind: fit['iteraciones'] for ind, fit in self.fits.items()})
+
+    def adjusted_scores(self, indicador):
+        """Puntaje ajustado por operador (media + efecto), o None si no hay modelo."""
+        fit = self.fits.get(indicador)
+        if fit is None:
+            return None
+        return fit['media'] + fit['operador']
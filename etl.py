@@ -0,0 +1,601 @@
+"""
+Pipeline ETL de los reportes KDF.
+
+Funciones reutilizables extraídas de Notebook_PMI.ipynb para procesar los
+archivos Excel de data/ y generar los CSV que consumen los dashboards.
+
+Uso:
+    python etl.py                  # Reconstrucción completa
+    python etl.py --incremental    # Solo re-procesa los Excel que cambiaron
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import storage
+
+DATA_PATH = 'data'
+OPERATORS_FILE = 'operators_assignments.csv'
+DAILY_FILE = storage.DAILY + '.csv'
+WEEKLY_FILE = storage.WEEKLY + '.csv'
+MANIFEST_FILE = 'etl_manifest.json'
+
+MACHINES = ['KDF-7', 'KDF-8', 'KDF-9', 'KDF-10', 'KDF-11', 'KDF-17']
+
+# Diccionario con nombre de archivo → nombre de indicador
+INDICATORS = {
+    'MTBF': 'MTBF',
+    'Reject Rate': 'Reject_Rate',
+    'Stratergic PR': 'Strategic_PR',
+    'UPDT Categories': 'UPDT'
+}
+
+# Lunes en que empieza la Week 2 de cada año fiscal. Los años que no estén
+# aquí usan como Week 1 la semana que contiene el 1 de enero.
+WEEK_ANCHORS = {
+    2025: '2025-01-06'
+}
+
+WEEKLY_KEYS = ['Week', 'Año', 'Week_Año', 'Mes', 'Mes_Num', 'Coordinador', 'Operador', 'Maquina', 'Indicador']
+
+
+# ==================== PARSEO ====================
+
+def week_1_start(year, anchors=None):
+    """
+    Retorna el lunes en que empieza la Week 1 del año fiscal `year`.
+    Si el año está en `anchors` (año → lunes de inicio de la Week 2) se usa
+    ese ancla; si no, la Week 1 es la semana (lunes a domingo) que contiene
+    el 1 de enero.
+    """
+    anchors = WEEK_ANCHORS if anchors is None else anchors
+    if year in anchors:
+        return pd.Timestamp(anchors[year]) - pd.Timedelta(days=7)
+    jan_1 = pd.Timestamp(year=year, month=1, day=1)
+    return jan_1 - pd.Timedelta(days=jan_1.weekday())
+
+
+def fiscal_weeks(fechas, anchors=None):
+    """
+    Calcula la week de una columna de fechas:
+    - Año: año fiscal; cada uno empieza en el lunes de su Week 1 (ver week_1_start)
+    - Week_Año: número de week dentro del año fiscal (sistema de Philip
+      Morris), de lunes a domingo; vuelve a 1 cada año
+    - Week: week continua, contada desde la Week 1 del primer año en
+      `anchors`. No se repite entre años, así que es la llave de week de
+      los datasets (orden de las series, rangos de weeks, agregación
+      semanal). En ese primer año es igual a Week_Año.
+    Las fechas anteriores a la Week 2 del primer año en `anchors` no tienen
+    week (no hay datos), igual que fechas no válidas.
+    Retorna un DataFrame de columnas Int64 con el mismo índice que `fechas`.
+    """
+    anchors = WEEK_ANCHORS if anchors is None else anchors
+    fechas = pd.to_datetime(pd.Series(fechas))
+    valid = fechas.notna().to_numpy()
+    days = _day_numbers(fechas.fillna(pd.Timestamp(0)))
+
+    years = np.full(len(fechas), -1, dtype=np.int64)
+    weeks = np.full(len(fechas), -1, dtype=np.int64)
+    if valid.any():
+        # Inicio de la Week 1 de cada año que puede contener las fechas
+        candidates = np.arange(int(fechas.dt.year.min()) - 1, int(fechas.dt.year.max()) + 2)
+        starts = _day_numbers([week_1_start(int(year), anchors) for year in candidates])
+        fiscal_year = np.searchsorted(starts, days, side='right') - 1
+        years = candidates[fiscal_year]
+        weeks = (days - starts[fiscal_year]) // 7 + 1
+
+    origin = _day_numbers([week_1_start(min(anchors), anchors)])[0]
+    missing = ~valid | (days < origin + 7)
+    result = pd.DataFrame({
+        'Año': years,
+        'Week_Año': weeks,
+        'Week': (days - origin) // 7 + 1
+    }, index=fechas.index).astype('Int64')
+    result.loc[missing] = pd.NA
+    return result
+
+
+def week_numbers(fechas, anchors=None):
+    """
+    Número de week dentro del año fiscal (Week_Año de fiscal_weeks) de una
+    columna de fechas. Retorna una Serie Int64 con el mismo índice que `fechas`.
+    """
+    return fiscal_weeks(fechas, anchors)['Week_Año']
+
+
+def parse_shifts(shifts):
+    """
+    Parsea la columna Shift con formato 'S1 07-01-2025' (turno + fecha dd-mm-yyyy).
+    Retorna un DataFrame con Turno (S1, S2, S3) y Fecha (datetime), con el
+    mismo índice que `shifts`. Los valores que no se pueden parsear quedan
+    vacíos y se reportan en bloque.
+    """
+    parts = shifts.astype('string').str.split()
+    turno = parts.str[0]
+    fecha = pd.to_datetime(parts.str[1], format='%d-%m-%Y', errors='coerce')
+
+    invalid = fecha.isna()
+    if invalid.any():
+        ejemplos = ', '.join(repr(x) for x in shifts[invalid].unique()[:5])
+        print(f"❌ {int(invalid.sum())} valores de Shift sin formato 'S1 dd-mm-yyyy': {ejemplos}")
+
+    return pd.DataFrame({
+        'Turno': turno.astype(object).where(~invalid, None),
+        'Fecha': fecha
+    }, index=shifts.index)
+
+
+# ==================== ASIGNACIÓN DE OPERADORES ====================
+
+def load_operator_assignments(path=OPERATORS_FILE):
+    """
+    Lee el CSV de asignaciones de operadores.
+    Retorna un DataFrame con Fecha_Inicio y Fecha_Fin como datetime.
+    """
+    df_operators = pd.read_csv(path)
+    df_operators['Fecha_Inicio'] = pd.to_datetime(df_operators['Fecha_Inicio'])
+    df_operators['Fecha_Fin'] = pd.to_datetime(df_operators['Fecha_Fin'])
+    return df_operators
+
+
+def _day_numbers(fechas):
+    """Convierte fechas a número de día (int64) para comparar con searchsorted."""
+    return pd.to_datetime(fechas).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def assign_operators(df, df_operators):
+    """
+    Asigna Operador y Coordinador a todos los registros de una sola vez.
+
+    Reemplaza a la función fila por fila `assign_operator`: el match es por
+    (Maquina, Turno) y el intervalo [Fecha_Inicio, Fecha_Fin] que contiene
+    la Fecha del registro. Las asignaciones se ordenan una vez por una llave
+    compuesta (grupo, día) y cada registro se resuelve con búsqueda binaria,
+    así que el costo es O((filas + asignaciones) · log asignaciones).
+
+    Retorna (df_asignado, reporte):
+    - df_asignado: copia de df con columnas 'Operador' y 'Coordinador'
+      (NaN cuando no hay asignación)
+    - reporte: registros con 0 o más de 1 asignación posible, con la
+      columna 'Coincidencias'. Si hay varias, se toma la primera en el
+      orden de df_operators (igual que la versión anterior)
+    """
+    df_out = df.copy()
+    fechas = pd.to_datetime(df_out['Fecha'])
+
+    # Llave de grupo (Maquina, Turno) como entero; -1 si no existe en asignaciones
+    op_keys = pd.MultiIndex.from_frame(df_operators[['Maquina', 'Turno']])
+    unique_keys = op_keys.unique()
+    op_group = unique_keys.get_indexer(op_keys).astype(np.int64)
+    row_group = unique_keys.get_indexer(
+        pd.MultiIndex.from_frame(df_out[['Maquina', 'Turno']])
+    ).astype(np.int64)
+    valid = (row_group >= 0) & fechas.notna().to_numpy()
+
+    # Días relativos a la primera asignación (>= 1) para armar la llave compuesta
+    origin = _day_numbers(df_operators['Fecha_Inicio']).min() - 1
+    start = _day_numbers(df_operators['Fecha_Inicio']) - origin
+    end = _day_numbers(df_operators['Fecha_Fin']) - origin
+    span = int(end.max()) + 2
+    day = np.zeros(len(df_out), dtype=np.int64)
+    day[valid] = np.clip(_day_numbers(fechas[valid]) - origin, 0, span - 1)
+
+    order = np.argsort(op_group * span + start, kind='stable')
+    start_keys = (op_group * span + start)[order]
+    end_keys = np.sort(op_group * span + end)
+
+    base = np.where(valid, row_group, 0) * span
+    query = base + day
+    started = np.searchsorted(start_keys, query, 'right')
+    n_started = started - np.searchsorted(start_keys, base, 'left')
+    n_ended = np.searchsorted(end_keys, query, 'left') - np.searchsorted(end_keys, base, 'left')
+    n_matches = np.where(valid, np.maximum(n_started - n_ended, 0), 0)
+
+    # Caso normal: la asignación que empezó más recientemente cubre la fecha
+    candidate = order[np.maximum(started - 1, 0)]
+    match = np.full(len(df_out), -1, dtype=np.int64)
+    simple = (n_matches == 1) & (end[candidate] >= day)
+    match[simple] = candidate[simple]
+
+    # Casos ambiguos (traslapes): primera asignación en orden de la tabla,
+    # resuelta una sola vez por cada (grupo, día) distinto
+    ambiguous = np.flatnonzero((n_matches > 0) & ~simple)
+    pairs, inverse = np.unique(query[ambiguous], return_inverse=True)
+    resolved = np.empty(len(pairs), dtype=np.int64)
+    for j, pair in enumerate(pairs):
+        group, d = divmod(int(pair), span)
+        resolved[j] = np.flatnonzero((op_group == group) & (start <= d) & (end >= d))[0]
+    match[ambiguous] = resolved[inverse]
+
+    found = match >= 0
+    operador = np.full(len(df_out), np.nan, dtype=object)
+    coordinador = np.full(len(df_out), np.nan, dtype=object)
+    operador[found] = df_operators['Operador'].to_numpy()[match[found]]
+    coordinador[found] = df_operators['Coordinador'].to_numpy()[match[found]]
+    df_out['Operador'] = operador
+    df_out['Coordinador'] = coordinador
+
+    reporte = df_out.loc[n_matches != 1, ['Fecha', 'Turno', 'Maquina']].copy()
+    reporte['Coincidencias'] = n_matches[n_matches != 1]
+    return df_out, reporte
+
+
+# ==================== LECTURA DE EXCEL ====================
+
+def find_workbook(data_path, machine, file_prefix):
+    """
+    Busca el archivo de un indicador (el número después de "Shift" puede variar).
+    Retorna la ruta del primer archivo que coincida o None.
+    """
+    pattern = os.path.join(data_path, machine, f"{file_prefix} - Shift*.xlsx")
+    files = sorted(glob.glob(pattern))
+    return files[0] if files else None
+
+
+def list_workbooks(data_path=DATA_PATH, machines=MACHINES):
+    """Retorna una lista de (machine, file_prefix, file_path) de los Excel disponibles."""
+    workbooks = []
+    for machine in machines:
+        for file_prefix in INDICATORS:
+            file_path = find_workbook(data_path, machine, file_prefix)
+            if file_path is not None:
+                workbooks.append((machine, file_prefix, file_path))
+    return workbooks
+
+
+def read_sheet_columns(file_path, columns_for, skiprows=2):
+    """
+    Lee la primera hoja de un Excel en modo streaming (read_only + values_only)
+    sin cargar el workbook completo en memoria.
+
+    `columns_for(header)` recibe la fila de encabezados (fila skiprows + 1)
+    y retorna los nombres de las columnas a conservar.
+    Retorna un dict {columna: lista de valores}.
+    """
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # Algunos exports traen mal la dimensión de la hoja (A1:A1)
+        ws.reset_dimensions()
+        rows = ws.iter_rows(min_row=skiprows + 1, values_only=True)
+        header = list(next(rows, ()))
+        columns = columns_for(header)
+        positions = [header.index(col) for col in columns]
+        values = {col: [] for col in columns}
+
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            for col, pos in zip(columns, positions):
+                values[col].append(row[pos] if pos < len(row) else None)
+    finally:
+        wb.close()
+    return values
+
+
+def read_indicator_file(file_path, machine, file_prefix):
+    """
+    Lee un Excel de un indicador y lo deja en formato largo:
+    Shift, Valor, Turno, Fecha, Week, Año, Week_Año, Mes, Maquina, Indicador.
+    Lanza ValueError si el archivo no tiene las columnas esperadas.
+    """
+    indicator_name = INDICATORS[file_prefix]
+
+    def columns_for(header):
+        if 'Shift' not in header:
+            raise ValueError(f"{indicator_name}: No tiene columna 'Shift'")
+
+        # Para UPDT usamos 'Total', para los demás el nombre del indicador
+        if indicator_name == 'UPDT':
+            if 'Total' not in header:
+                raise ValueError("UPDT: No tiene columna 'Total'")
+            return ['Shift', 'Total']
+
+        for col in header:
+            if isinstance(col, str) and (file_prefix in col or indicator_name.replace('_', ' ') in col):
+                return ['Shift', col]
+        raise ValueError(f"{indicator_name}: No se encontró columna de valores")
+
+    # Los datos empiezan en la fila 3 (encabezados); las 2 primeras son filtros
+    values = read_sheet_columns(file_path, columns_for)
+    shift_col, value_col = list(values)
+
+    df_temp = pd.DataFrame({
+        'Shift': pd.Series(values[shift_col], dtype=object),
+        'Valor': pd.to_numeric(pd.Series(values[value_col], dtype=object), errors='coerce').astype('float64')
+    })
+
+    # Parsear Shift y calcular Week y Mes para toda la columna a la vez
+    df_temp[['Turno', 'Fecha']] = parse_shifts(df_temp['Shift'])
+    df_temp[['Week', 'Año', 'Week_Año']] = fiscal_weeks(df_temp['Fecha'])[['Week', 'Año', 'Week_Año']]
+    df_temp['Mes'] = df_temp['Fecha'].dt.month_name()
+
+    df_temp['Maquina'] = machine
+    df_temp['Indicador'] = indicator_name
+    return df_temp
+
+
+def _read_workbook_task(workbook):
+    """Tarea para el pool de procesos: retorna (workbook, df, error)."""
+    machine, file_prefix, file_path = workbook
+    try:
+        return workbook, read_indicator_file(file_path, machine, file_prefix), None
+    except Exception as e:
+        return workbook, None, str(e)
+
+
+def read_workbooks(workbooks, df_operators, max_workers=None):
+    """
+    Lee una lista de (machine, file_prefix, file_path) y asigna operadores.
+
+    Los Excel se parsean en paralelo en un pool de procesos (parsear xlsx
+    es CPU-bound). `max_workers` por defecto usa un proceso por workbook
+    hasta el número de CPUs; con 1 se lee en el proceso actual.
+    El orden del resultado es el mismo que el de `workbooks`.
+    Retorna el DataFrame consolidado o None si no se leyó ningún archivo.
+    """
+    if max_workers is None:
+        max_workers = min(len(workbooks), os.cpu_count() or 1)
+
+    if max_workers <= 1 or len(workbooks) <= 1:
+        results = map(_read_workbook_task, workbooks)
+        all_data = _collect_results(results)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            all_data = _collect_results(executor.map(_read_workbook_task, workbooks))
+
+    if len(all_data) == 0:
+        return None
+
+    df_consolidated = pd.concat(all_data, ignore_index=True)
+
+    # Asignar operadores a todos los registros en una sola pasada
+    df_consolidated, reporte = assign_operators(df_consolidated, df_operators)
+    if len(reporte) > 0:
+        print(f"\n⚠️  {len(reporte)} registros sin operador o con múltiples operadores")
+
+    return df_consolidated
+
+
+def _collect_results(results):
+    all_data = []
+    for (machine, file_prefix, file_path), df_temp, error in results:
+        if error is not None:
+            print(f"   ❌ Error leyendo {file_path}: {error}")
+            continue
+        all_data.append(df_temp)
+        print(f"   ✅ {machine} / {INDICATORS[file_prefix]}: {len(df_temp)} registros")
+    return all_data
+
+
+def read_all_data(data_path, df_operators, machines=MACHINES, max_workers=None):
+    """
+    Lee todos los archivos de todas las máquinas y todos los indicadores
+    Retorna un DataFrame consolidado
+    """
+    print("🔄 Leyendo archivos...")
+    return read_workbooks(list_workbooks(data_path, machines), df_operators, max_workers)
+
+
+# ==================== AGREGACIÓN ====================
+
+def to_daily(df_all):
+    """
+    Filtra los registros con operador asignado y agrega Mes_Num.
+    Es el formato de data_daily_processed.csv.
+    """
+    df_with_operator = df_all[df_all['Operador'].notna()].copy()
+    df_with_operator['Mes_Num'] = df_with_operator['Fecha'].dt.month
+    return df_with_operator
+
+
+def aggregate_weekly(df_daily):
+    """
+    Agregación semanal: promedia por Week + Operador + Máquina + Indicador
+    (Week es la week continua, única entre años fiscales).
+    Es el formato de data_weekly_processed.csv.
+    """
+    df_weekly = df_daily.groupby(WEEKLY_KEYS, as_index=False, observed=True).agg({
+        'Valor': 'mean',  # Promedio de todos los turnos
+        'Fecha': ['min', 'max', 'count']  # Info adicional para validación
+    })
+
+    # Aplanar columnas multi-nivel
+    df_weekly.columns = WEEKLY_KEYS + ['Valor_Promedio', 'Fecha_Inicio', 'Fecha_Fin', 'Dias_Trabajados']
+    df_weekly['Valor_Promedio'] = df_weekly['Valor_Promedio'].round(2)
+    return df_weekly
+
+
+# ==================== MANIFEST ====================
+
+def file_fingerprint(file_path, previous=None):
+    """
+    Retorna {'size', 'mtime', 'sha256'} de un archivo.
+    Si `previous` tiene el mismo tamaño y mtime, reutiliza su hash sin leer el archivo.
+    """
+    stat = os.stat(file_path)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime_ns:
+        fingerprint['sha256'] = previous['sha256']
+        return fingerprint
+
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    fingerprint['sha256'] = sha.hexdigest()
+    return fingerprint
+
+
+def load_manifest(path):
+    """Lee el manifest de archivos ya procesados (vacío si no existe)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    """Escribe el manifest de forma atómica."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_manifest(workbooks, operators_file, previous=None):
+    """Construye el manifest de los workbooks y del CSV de asignaciones."""
+    previous = previous or {}
+    previous_files = previous.get('files', {})
+    files = {}
+    for machine, file_prefix, file_path in workbooks:
+        entry = file_fingerprint(file_path, previous_files.get(file_path))
+        entry.update({'machine': machine, 'file_prefix': file_prefix})
+        files[file_path] = entry
+    return {
+        'operators': file_fingerprint(operators_file, previous.get('operators')),
+        'files': files
+    }
+
+
+# ==================== EJECUCIÓN ====================
+
+def _output_paths(output_dir):
+    return (os.path.join(output_dir, DAILY_FILE),
+            os.path.join(output_dir, WEEKLY_FILE),
+            os.path.join(output_dir, MANIFEST_FILE))
+
+
+def write_outputs(df_daily, df_weekly, output_dir='.'):
+    """Guarda los datasets diario y semanal (CSV + Parquet tipado)."""
+    for name, df in [(storage.WEEKLY, df_weekly), (storage.DAILY, df_daily)]:
+        for path in storage.write_processed(df, name, output_dir):
+            print(f"   ✅ {path} guardado ({len(df)} registros)")
+
+
+def run_full(data_path=DATA_PATH, output_dir='.', operators_file=OPERATORS_FILE, max_workers=None):
+    """Reprocesa todos los Excel y reescribe las salidas y el manifest."""
+    _, _, manifest_path = _output_paths(output_dir)
+    df_operators = load_operator_assignments(operators_file)
+    workbooks = list_workbooks(data_path)
+
+    print("🔄 Leyendo archivos...")
+    df_all = read_workbooks(workbooks, df_operators, max_workers)
+    if df_all is None:
+        print("\n❌ No se pudo leer ningún archivo")
+        return None
+
+    df_daily = to_daily(df_all)
+    df_weekly = aggregate_weekly(df_daily)
+
+    print("💾 Guardando datos procesados...")
+    write_outputs(df_daily, df_weekly, output_dir)
+    save_manifest(manifest_path, build_manifest(workbooks, operators_file, load_manifest(manifest_path)))
+    return df_weekly
+
+
+def _read_processed(daily_path, weekly_path):
+    df_daily = pd.read_csv(daily_path)
+    df_daily['Fecha'] = pd.to_datetime(df_daily['Fecha'])
+    df_weekly = pd.read_csv(weekly_path)
+    df_weekly['Fecha_Inicio'] = pd.to_datetime(df_weekly['Fecha_Inicio'])
+    df_weekly['Fecha_Fin'] = pd.to_datetime(df_weekly['Fecha_Fin'])
+    return df_daily, df_weekly
+
+
+def run_incremental(data_path=DATA_PATH, output_dir='.', operators_file=OPERATORS_FILE, max_workers=None):
+    """
+    Procesa solo los Excel nuevos o modificados según el manifest.
+
+    - Compara tamaño, mtime y hash de cada workbook contra el manifest
+    - Re-lee únicamente los workbooks que cambiaron (o se eliminaron)
+    - Recalcula solo las filas semanales (Maquina, Indicador, Week) afectadas
+      y las combina con las salidas existentes
+
+    Si no hay manifest, faltan salidas, las salidas son de una versión
+    anterior del ETL o cambió el CSV de asignaciones, hace una
+    reconstrucción completa.
+    """
+    daily_path, weekly_path, manifest_path = _output_paths(output_dir)
+    previous = load_manifest(manifest_path)
+    workbooks = list_workbooks(data_path)
+    manifest = build_manifest(workbooks, operators_file, previous)
+
+    if (not previous or not os.path.exists(daily_path) or not os.path.exists(weekly_path)
+            or manifest['operators']['sha256'] != previous['operators']['sha256']):
+        print("ℹ️  Sin manifest válido o asignaciones modificadas: reconstrucción completa")
+        return run_full(data_path, output_dir, operators_file, max_workers)
+    if not set(WEEKLY_KEYS) <= set(pd.read_csv(weekly_path, nrows=0).columns):
+        # Salidas de una versión anterior del ETL (sin Año ni week continua)
+        print("ℹ️  Salidas sin las columnas de week actuales: reconstrucción completa")
+        return run_full(data_path, output_dir, operators_file, max_workers)
+
+    previous_files = previous.get('files', {})
+    changed = [wb for wb in workbooks
+               if previous_files.get(wb[2], {}).get('sha256') != manifest['files'][wb[2]]['sha256']]
+    removed = [entry for path, entry in previous_files.items() if path not in manifest['files']]
+
+    if not changed and not removed:
+        print("✅ Sin cambios en los archivos de datos")
+        save_manifest(manifest_path, manifest)
+        return None
+
+    print(f"🔄 Archivos modificados: {len(changed)} | eliminados: {len(removed)}")
+    df_daily, df_weekly = _read_processed(daily_path, weekly_path)
+
+    # Pares (Maquina, Indicador) cuyos datos diarios se reemplazan
+    pairs = {(machine, INDICATORS[file_prefix]) for machine, file_prefix, _ in changed}
+    pairs |= {(entry['machine'], INDICATORS[entry['file_prefix']]) for entry in removed}
+    pair_index = pd.MultiIndex.from_tuples(sorted(pairs), names=['Maquina', 'Indicador'])
+    in_pairs = pd.MultiIndex.from_frame(df_daily[['Maquina', 'Indicador']]).isin(pair_index)
+
+    df_old = df_daily[in_pairs]
+    df_new = df_daily.iloc[:0]
+    if changed:
+        df_all = read_workbooks(changed, load_operator_assignments(operators_file), max_workers)
+        if df_all is not None:
+            df_new = to_daily(df_all)[df_daily.columns]
+
+    # Weeks afectadas: registros diarios que aparecen, desaparecen o cambian
+    compare_cols = ['Shift', 'Valor', 'Maquina', 'Indicador', 'Operador', 'Coordinador', 'Week']
+    diff = pd.concat([df_old[compare_cols], df_new[compare_cols]]).drop_duplicates(keep=False)
+    affected = pd.MultiIndex.from_frame(diff[['Maquina', 'Indicador', 'Week']]).unique()
+
+    df_daily = pd.concat([df_daily[~in_pairs], df_new], ignore_index=True)
+
+    daily_keys = pd.MultiIndex.from_frame(df_daily[['Maquina', 'Indicador', 'Week']])
+    weekly_keys = pd.MultiIndex.from_frame(df_weekly[['Maquina', 'Indicador', 'Week']])
+    df_weekly_new = aggregate_weekly(df_daily[daily_keys.isin(affected)])
+    df_weekly = pd.concat([df_weekly[~weekly_keys.isin(affected)], df_weekly_new], ignore_index=True)
+    df_weekly = df_weekly.sort_values(WEEKLY_KEYS, ignore_index=True)
+
+    print(f"   Weeks recalculadas: {len(affected)} (Maquina, Indicador, Week)")
+    print("💾 Guardando datos procesados...")
+    write_outputs(df_daily, df_weekly, output_dir)
+    save_manifest(manifest_path, manifest)
+    return df_weekly
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="ETL de reportes KDF")
+    parser.add_argument('--data-path', default=DATA_PATH)
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--operators-file', default=OPERATORS_FILE)
+    parser.add_argument('--incremental', action='store_true',
+                        help="Solo re-procesa los workbooks que cambiaron desde la última corrida")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Procesos para leer los Excel (por defecto: número de CPUs)")
+    args = parser.parse_args()
+
+    if args.incremental:
+        run_incremental(args.data_path, args.output_dir, args.operators_file, args.workers)
+    else:
+        run_full(args.data_path, args.output_dir, args.operators_file, args.workers)
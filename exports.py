@@ -0,0 +1,116 @@
+"""
+Exportación de resultados por bloques (CSV, CSV con gzip y Parquet).
+
+iter_export genera el archivo como una secuencia de bytes, CHUNK_ROWS filas
+a la vez, sin armar nunca el archivo completo en memoria. Dash lo sirve
+como respuesta en streaming de Flask; Streamlit lo genera solo cuando
+alguien hace clic en el botón de descarga.
+"""
+import zlib
+from datetime import datetime
+
+import storage
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él solo se exporta CSV
+    pq = None
+
+CHUNK_ROWS = 50_000
+
+EXPORT_FORMATS = {
+    'csv': {'label': 'CSV', 'extension': '.csv', 'mime': 'text/csv'},
+    'csv.gz': {'label': 'CSV (gzip)', 'extension': '.csv.gz', 'mime': 'application/gzip'},
+    'parquet': {'label': 'Parquet', 'extension': '.parquet', 'mime': 'application/vnd.apache.parquet'}
+}
+
+
+def available_formats():
+    """Formatos que se pueden exportar con las dependencias instaladas."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or pq is not None]
+
+
+def export_filename(prefix, fmt):
+    """Nombre del archivo: <prefix>_<AAAAMMDD><extensión>."""
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d')}{EXPORT_FORMATS[fmt]['extension']}"
+
+
+def iter_chunks(df, chunk_rows=CHUNK_ROWS):
+    """Bloques consecutivos de `chunk_rows` filas (al menos uno, aunque esté vacío)."""
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+class _ByteSink:
+    """Archivo de solo escritura que acumula lo escrito hasta que se retira con take()."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _iter_csv(df, chunk_rows):
+    for i, chunk in enumerate(iter_chunks(df, chunk_rows)):
+        yield chunk.to_csv(index=False, header=(i == 0)).encode('utf-8')
+
+
+def _iter_csv_gzip(df, chunk_rows):
+    # wbits=31: formato gzip (encabezado + CRC) en modo streaming
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for data in _iter_csv(df, chunk_rows):
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _iter_parquet(df, chunk_rows):
+    # Un row group por bloque; el sink se vacía después de cada uno
+    sink = _ByteSink()
+    writer = None
+    for chunk in iter_chunks(df, chunk_rows):
+        table = storage.to_arrow(chunk)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression='zstd')
+        writer.write_table(table.cast(writer.schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def iter_export(df, fmt, chunk_rows=CHUNK_ROWS):
+    """Genera el contenido del archivo exportado en bloques de bytes."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportación no soportado: {fmt}")
+    if fmt == 'parquet' and pq is None:
+        raise ValueError("Exportar a Parquet requiere pyarrow")
+
+    writers = {'csv': _iter_csv, 'csv.gz': _iter_csv_gzip, 'parquet': _iter_parquet}
+    for data in writers[fmt](df, chunk_rows):
+        if data:
+            yield data
+
+
+def export_bytes(df, fmt, chunk_rows=CHUNK_ROWS):
+    """Exportación completa como bytes (para st.download_button, que la pide al hacer clic)."""
+    return b''.join(iter_export(df, fmt, chunk_rows))
@@ -0,0 +1,67 @@
+"""
+Configuración de gunicorn para servir el dashboard Dash en producción.
+
+preload_app carga los datos en el proceso maestro antes del fork (ver
+wsgi.py): todos los workers comparten el mismo dataset en memoria.
+
+Recarga de datos: los workers no revisan la versión en disco. Un hilo del
+maestro la revisa cada PMI_DATA_POLL segundos y, cuando hay una versión
+nueva lista, el maestro se manda SIGHUP: gunicorn llama a on_reload (que
+carga los datos en el maestro), crea workers nuevos con fork y retira los
+anteriores cuando terminan sus peticiones. Los workers que se reinician por
+max_requests también salen del maestro, así que siempre tienen la versión
+más reciente. `kill -HUP <pid del maestro>` fuerza la misma revisión.
+
+Variables de entorno: PMI_BIND, PMI_WORKERS, PMI_THREADS, PMI_DATA_POLL.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from data_manager import DATA_POLL_SECONDS
+
+wsgi_app = 'wsgi:create_app()'
+preload_app = True
+
+bind = os.environ.get('PMI_BIND', '0.0.0.0:8050')
+# Callbacks con cálculo en pandas/numpy: un worker por núcleo
+workers = int(os.environ.get('PMI_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('PMI_THREADS', 2))
+timeout = 60
+# Reiniciar workers de vez en cuando acota el crecimiento de los caches por proceso
+max_requests = 2000
+max_requests_jitter = 200
+
+
+def _watch_data(server):
+    """Hilo del maestro: SIGHUP cuando hay una versión nueva de los datos lista para cargar."""
+    import app_dash
+
+    signaled = None
+    while True:
+        time.sleep(DATA_POLL_SECONDS)
+        version = app_dash.data.ready_version()
+        # Una sola vez por versión: si no se pudo cargar, se espera a la siguiente
+        if version is not None and version != signaled:
+            signaled = version
+            os.kill(server.pid, signal.SIGHUP)
+
+
+def when_ready(server):
+    if server.cfg.preload_app and DATA_POLL_SECONDS > 0:
+        threading.Thread(target=_watch_data, args=(server,), daemon=True, name='data-watch').start()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        # La recarga la hace el maestro
+        import app_dash
+        app_dash.data.poll_seconds = 0
+
+
+def on_reload(server):
+    if server.cfg.preload_app:
+        import wsgi
+        wsgi.reload_data()
@@ -0,0 +1,286 @@
+"""
+Métricas de latencia y de cache de los dashboards.
+
+Registra, por proceso:
+- pmi_callback_seconds{callback}: duración de cada callback de Dash (y del
+  rerun de Streamlit), con hits de cache incluidos
+- pmi_stage_seconds{stage}: etapas internas (filter, groupby, spc, figure,
+  series_store, serialize, load)
+- pmi_payload_bytes{callback}: tamaño de la respuesta enviada al navegador
+- pmi_cache_hits_total / pmi_cache_misses_total{cache}: contadores de los
+  caches (se leen al exportar y siguen sumando cuando una recarga de datos
+  reemplaza el cache)
+- pmi_dataset_load_seconds{dataset}: tiempo de carga de cada dataset
+
+Se exponen en formato de texto de Prometheus (render(); ruta /metrics en
+Dash, servidor local en PMI_METRICS_PORT para Streamlit) y, si se define
+PMI_METRICS_LOG (ruta de archivo o '-' para stderr), cada evento se escribe
+además como una línea JSON.
+
+Con varios workers de gunicorn cada proceso lleva sus propias métricas
+(etiqueta pid).
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 20_000_000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+logger = logging.getLogger('pmi.metrics')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{str(value)}"'.replace('\n', ' ') for key, value in labels)
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Histograma acumulado por combinación de etiquetas (buckets fijos)."""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[key] = (counts, total + value)
+
+    def samples(self, const_labels):
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            labels = const_labels + tuple(zip(self.label_names, key))
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", labels + (('le', _format_value(bound)),), count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, counts[-1]
+
+
+class Registry:
+    """Histogramas del proceso más colectores que leen contadores al exportar."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.collectors = []
+
+    def histogram(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, help_text, label_names, buckets)
+        return self.histograms[name]
+
+    def register_collector(self, collector):
+        """
+        `collector()` regresa [(nombre, tipo, ayuda, [(etiquetas dict, valor)])];
+        se llama en cada render().
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        """Todas las métricas en formato de texto de Prometheus."""
+        const_labels = (('pid', os.getpid()),)
+        lines = []
+        for histogram in self.histograms.values():
+            lines.append(f"# HELP {histogram.name} {histogram.help_text}")
+            lines.append(f"# TYPE {histogram.name} histogram")
+            for name, labels, value in histogram.samples(const_labels):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        families = {}
+        for collector in self.collectors:
+            for name, kind, help_text, samples in collector():
+                families.setdefault((name, kind, help_text), []).extend(samples)
+        for (name, kind, help_text), samples in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(const_labels + tuple(labels.items()))} "
+                             f"{_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CALLBACK_SECONDS = REGISTRY.histogram(
+    'pmi_callback_seconds', 'Duración de los callbacks (incluye hits de cache)', ['callback'])
+STAGE_SECONDS = REGISTRY.histogram(
+    'pmi_stage_seconds', 'Duración de las etapas internas de los callbacks', ['stage'])
+PAYLOAD_BYTES = REGISTRY.histogram(
+    'pmi_payload_bytes', 'Tamaño de la respuesta enviada al navegador', ['callback'], SIZE_BUCKETS)
+DATASET_LOAD_SECONDS = REGISTRY.histogram(
+    'pmi_dataset_load_seconds', 'Tiempo de carga de los datasets procesados', ['dataset'])
+
+
+def configure_logging(target=None):
+    """
+    Escribe los eventos como JSON por línea en `target` (ruta o '-' para
+    stderr; por defecto PMI_METRICS_LOG). Sin destino no se escribe nada.
+    """
+    target = target if target is not None else os.environ.get('PMI_METRICS_LOG')
+    if not target or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if target == '-' else logging.FileHandler(target)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def log_event(event, **fields):
+    """Evento estructurado (una línea JSON) si el log está configurado."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'ts': round(time.time(), 3), 'event': event, 'pid': os.getpid(), **fields},
+                               default=str, ensure_ascii=False))
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Mide una etapa interna (filter, groupby, figure, ...)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+
+
+def observe_callback(callback_id, seconds, payload_bytes=None, **fields):
+    """Registra una ejecución de callback (y su respuesta, si se conoce el tamaño)."""
+    CALLBACK_SECONDS.observe(seconds, callback=callback_id)
+    if payload_bytes is not None:
+        PAYLOAD_BYTES.observe(payload_bytes, callback=callback_id)
+    log_event('callback', callback=callback_id, seconds=round(seconds, 6),
+              payload_bytes=payload_bytes, **fields)
+
+
+def instrument(callback_id, on_finish=None):
+    """
+    Decorador que mide la duración de un callback. `on_finish(callback_id,
+    segundos)` se llama al terminar (Dash lo usa para ligar la medición con
+    el tamaño de la respuesta).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                if on_finish is not None:
+                    on_finish(callback_id, seconds)
+                else:
+                    observe_callback(callback_id, seconds)
+        return wrapper
+    return decorator
+
+
+def measure_stream(chunks, callback_id):
+    """
+    Pasa los bloques de una respuesta por streaming y, al terminar de
+    enviarlos, registra la duración total y los bytes enviados.
+    """
+    start = time.perf_counter()
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        observe_callback(callback_id, time.perf_counter() - start, size)
+
+
+def observe_dataset_load(dataset, seconds, rows):
+    DATASET_LOAD_SECONDS.observe(seconds, dataset=dataset)
+    log_event('dataset_load', dataset=dataset, seconds=round(seconds, 6), rows=rows)
+
+
+def cache_collector(caches):
+    """
+    Colector de hits/misses para un dict nombre → objeto con atributos
+    `hits` y `misses` (LRUCache, CallbackCache, SQLiteTier) o función que
+    regresa ese objeto (para caches que se reemplazan al recargar datos).
+    Cuando la función regresa un cache nuevo, los conteos del anterior se
+    suman a una base para que los contadores nunca bajen.
+    """
+    # nombre → (referencia débil al último cache visto, hits, misses) y base acumulada
+    seen, base = {}, {}
+    lock = threading.Lock()
+
+    def totals(name, cache):
+        if not callable(cache):
+            return cache.hits, cache.misses
+        cache = cache()
+        base_hits, base_misses = base.get(name, (0, 0))
+        if name in seen:
+            ref, last_hits, last_misses = seen[name]
+            retired = ref()
+            if retired is not cache:
+                # Si el cache retirado ya se liberó, cuentan los últimos valores exportados
+                if retired is not None:
+                    last_hits, last_misses = retired.hits, retired.misses
+                base_hits, base_misses = base_hits + last_hits, base_misses + last_misses
+                base[name] = (base_hits, base_misses)
+        seen[name] = (weakref.ref(cache), cache.hits, cache.misses)
+        return base_hits + cache.hits, base_misses + cache.misses
+
+    def collect():
+        hits, misses = [], []
+        with lock:
+            for name, cache in caches.items():
+                cache_hits, cache_misses = totals(name, cache)
+                hits.append(({'cache': name}, cache_hits))
+                misses.append(({'cache': name}, cache_misses))
+        return [
+            ('pmi_cache_hits_total', 'counter', 'Hits de cache', hits),
+            ('pmi_cache_misses_total', 'counter', 'Misses de cache', misses)
+        ]
+    return collect
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """Sirve /metrics en un hilo aparte (para Streamlit, que no tiene rutas propias)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-http').start()
+    return server
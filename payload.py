@@ -0,0 +1,56 @@
+"""
+Serialización compacta de las respuestas de los callbacks de Dash.
+
+- typed_array convierte columnas numéricas al formato de arreglos tipados
+  de Plotly ({'dtype': 'f4', 'bdata': <base64>}): bytes crudos en base64 en
+  lugar de listas de números en texto. Plotly.js los lee directo en las
+  figuras y assets/clientside.js los decodifica en el series-store.
+  Los enteros usan el tipo más chico que alcance y los flotantes conservan
+  su tipo (Valor_Promedio es float32 en memoria, así que no se pierde nada).
+- Las respuestas se codifican con orjson cuando está instalado (Dash usa el
+  codificador JSON de Plotly; sin orjson usa el json estándar).
+"""
+import base64
+
+import numpy as np
+import plotly.io as pio
+
+try:
+    import orjson  # noqa: F401
+except ImportError:  # orjson es opcional: sin él se usa json estándar
+    orjson = None
+else:
+    pio.json.config.default_engine = 'orjson'
+
+# Tipos de arreglo que entiende Plotly.js (no hay enteros de 64 bits)
+INT_DTYPES = ['i1', 'u1', 'i2', 'u2', 'i4', 'u4']
+
+
+def smallest_int_dtype(values):
+    """Tipo entero más chico de INT_DTYPES que contiene todos los valores."""
+    if len(values) == 0:
+        return 'u1'
+    lo, hi = int(values.min()), int(values.max())
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    raise ValueError(f"Valores fuera del rango de 32 bits: [{lo}, {hi}]")
+
+
+def typed_array(values):
+    """Arreglo tipado de Plotly (little-endian) a partir de una Serie o arreglo numérico."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iub':
+        dtype = smallest_int_dtype(values)
+    elif values.dtype == np.float32:
+        dtype = 'f4'
+    else:
+        dtype = 'f8'
+    data = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(data.tobytes()).decode('ascii')}
+
+
+def json_engine():
+    """Codificador JSON activo para las respuestas ('orjson' o 'json')."""
+    return 'orjson' if orjson is not None else 'json'
@@ -0,0 +1,281 @@
+"""
+Capa de consultas compartida por los dashboards (Streamlit y Dash).
+
+Concentra el pipeline filtro → estadísticas por operador/máquina → ranking
+según el indicador. Los resultados se guardan en un cache LRU acotado,
+indexado por una llave de filtro normalizada, así que la misma selección
+(por ejemplo la tabla en pantalla y "Descargar Tabla Resumen") se calcula
+una sola vez.
+
+Los DataFrames que regresa QueryEngine se comparten entre llamadas:
+no se deben modificar en el lugar.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from cube import StatsCube
+from effects import ADJUSTED_COLUMN
+from metrics import stage
+from series_index import SERIES_KEYS, SeriesIndex
+from spc import SPCEngine
+from trend import TREND_COLUMNS, TrendCube, trend_from_rows
+
+# Información de indicadores (para colores, descripciones y ranking)
+INDICATOR_INFO = {
+    'MTBF': {
+        'name': 'MTBF (Mean Time Between Failures)',
+        'better': 'higher',
+        'color': '#2ecc71',
+        'description': '⬆️ Mayor es mejor - Tiempo promedio entre fallas'
+    },
+    'Reject_Rate': {
+        'name': 'Reject Rate',
+        'better': 'lower',
+        'color': '#e74c3c',
+        'description': '⬇️ Menor es mejor - Porcentaje de productos rechazados'
+    },
+    'Strategic_PR': {
+        'name': 'Strategic PR (Production Rate)',
+        'better': 'higher',
+        'color': '#3498db',
+        'description': '⬆️ Mayor es mejor - Tasa de producción estratégica'
+    },
+    'UPDT': {
+        'name': 'UPDT (Unplanned Downtime)',
+        'better': 'lower',
+        'color': '#f39c12',
+        'description': '⬇️ Menor es mejor - Tiempo de inactividad no planificado'
+    }
+}
+
+STATS_COLUMNS = ['Promedio', 'Mínimo', 'Máximo', 'Desv. Est.', 'Weeks']
+
+
+def filter_key(operadores, maquinas, indicador, week_range):
+    """
+    Normaliza una selección de filtros a una llave hashable:
+    (operadores ordenados, máquinas ordenadas, indicador, (week_inicio, week_fin)).
+    """
+    return (
+        tuple(sorted(set(operadores or []))),
+        tuple(sorted(set(maquinas or []))),
+        indicador,
+        (int(week_range[0]), int(week_range[1]))
+    )
+
+
+class LRUCache:
+    """
+    Cache LRU de tamaño acotado con contadores de hits y misses. Es seguro
+    entre hilos (threads de gunicorn, sesiones de Streamlit): un lock cubre
+    cada lectura y escritura del OrderedDict, no el cálculo de un valor.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Valor guardado en `key` (lo marca como reciente) o `default`."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+
+        # Dos hilos con la misma llave pueden calcularla a la vez; gana el último
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class QueryEngine:
+    """Consultas del dataset semanal con resultados memoizados por filtro."""
+
+    def __init__(self, df, cache_size=128, previous=None, effects=None):
+        """
+        `previous` es el QueryEngine de la versión anterior de los datos: las
+        cartas de control (SPC) de las series que no cambiaron se reutilizan.
+        `effects` (effects.EffectsModel) agrega el puntaje ajustado por
+        máquina, turno y week a la tabla de estadísticas.
+        """
+        self.df = df
+        self.effects = effects
+        self.index = SeriesIndex(df)
+        self.cube = StatsCube(df, self.index)
+        self.trend = TrendCube(df, self.index)
+        self.cache = LRUCache(cache_size)
+        with stage('spc'):
+            if previous is not None:
+                self.spc = previous.spc.refresh(df, self.index)
+            else:
+                better = {name: info['better'] for name, info in INDICATOR_INFO.items()}
+                self.spc = SPCEngine(df, better, self.index)
+
+        # Coordinador de cada serie; si alguna serie tiene varios, la tabla
+        # de estadísticas no se puede armar por serie y se usa groupby
+        coordinadores = df.groupby(SERIES_KEYS, observed=True)['Coordinador']
+        if (coordinadores.nunique() <= 1).all():
+            self.series_coordinator = coordinadores.first().to_dict()
+        else:
+            self.series_coordinator = None
+
+    def filtered(self, key):
+        """Filas del dataset que cumplen el filtro `key` (ver filter_key)."""
+        operadores, maquinas, indicador, week_range = key
+        def compute():
+            with stage('filter'):
+                return self.index.query(operadores, maquinas, indicador, week_range)
+
+        return self.cache.get_or_compute(('filtered', key), compute)
+
+    def series(self, operador, maquina, key):
+        """Filas de una serie operador/máquina dentro del filtro, ordenadas por Week."""
+        _, _, indicador, week_range = key
+        return self.index.series(operador, maquina, indicador, week_range)
+
+    def summary(self, key):
+        """Métricas principales: registros, weeks, promedio general y mejor valor."""
+        def compute():
+            df_filtered = self.filtered(key)
+            with stage('groupby'):
+                valores = df_filtered['Valor_Promedio'].astype('float64')
+                better = INDICATOR_INFO[key[2]]['better']
+                return {
+                    'total_registros': len(df_filtered),
+                    'weeks_analizadas': df_filtered['Week'].nunique(),
+                    'promedio_general': valores.mean(),
+                    'mejor_performance': valores.min() if better == 'lower' else valores.max()
+                }
+
+        return self.cache.get_or_compute(('summary', key), compute)
+
+    def stats_table(self, key):
+        """
+        Estadísticas por (Coordinador, Operador, Maquina) ordenadas de mejor
+        a peor según el indicador, con columna 'Ranking', la tendencia en
+        el rango de weeks (pendiente por week y R², ver trend.py) y, si hay
+        modelo de efectos, el puntaje ajustado del operador (todo el histórico).
+        """
+        def compute():
+            if self.series_coordinator is None:
+                df_filtered = self.filtered(key)
+                with stage('groupby'):
+                    stats_table = self._stats_from_rows(df_filtered)
+            else:
+                with stage('groupby'):
+                    stats_table = self._stats_from_cube(key)
+
+            scores = self.adjusted_scores(key[2])
+            if scores is not None:
+                stats_table[ADJUSTED_COLUMN] = stats_table['Operador'].astype(str).map(scores).round(2)
+
+            # Ordenar según el indicador (mejor performance primero)
+            ascending = INDICATOR_INFO[key[2]]['better'] == 'lower'
+            stats_table = stats_table.sort_values('Promedio', ascending=ascending)
+            stats_table.insert(0, 'Ranking', range(1, len(stats_table) + 1))
+            return stats_table
+
+        return self.cache.get_or_compute(('stats_table', key), compute)
+
+    def adjusted_scores(self, indicador):
+        """Puntaje ajustado por operador (Serie indexada por Operador) o None sin modelo."""
+        if self.effects is None:
+            return None
+        return self.effects.adjusted_scores(indicador)
+
+    def _stats_from_cube(self, key):
+        """Estadísticas por serie con el cubo de prefijos: O(1) por serie seleccionada."""
+        operadores, maquinas, indicador, week_range = key
+        rows, bounds = [], []
+        for maquina in maquinas:
+            for operador in operadores:
+                start, stop = self.index.series_slice(indicador, maquina, operador, week_range)
+                if stop > start:
+                    coordinador = self.series_coordinator[(indicador, maquina, operador)]
+                    rows.append((coordinador, operador, maquina, *self.cube.range_stats(start, stop)))
+                    bounds.append((start, stop))
+
+        stats_table = pd.DataFrame(rows, columns=['Coordinador', 'Operador', 'Maquina'] + STATS_COLUMNS)
+        # Tendencias de todas las series seleccionadas en una sola pasada
+        bounds = np.array(bounds, dtype=np.int64).reshape(-1, 2)
+        slope, _, r2, _ = self.trend.fit(bounds[:, 0], bounds[:, 1])
+        stats_table[TREND_COLUMNS[0]] = slope
+        stats_table[TREND_COLUMNS[1]] = r2
+        # Mismo orden que groupby sobre (Coordinador, Operador, Maquina)
+        stats_table = stats_table.sort_values(['Coordinador', 'Operador', 'Maquina'], ignore_index=True)
+        rounded = STATS_COLUMNS[:-1] + TREND_COLUMNS
+        stats_table[rounded] = stats_table[rounded].round(2)
+        return stats_table
+
+    def _stats_from_rows(self, df_filtered):
+        """Estadísticas por (Coordinador, Operador, Maquina) recorriendo las filas filtradas."""
+        stats_table = df_filtered.astype({'Valor_Promedio': 'float64'}).groupby(
+            ['Coordinador', 'Operador', 'Maquina'], observed=True
+        ).agg({
+            'Valor_Promedio': ['mean', 'min', 'max', 'std', 'count']
+        }).round(2)
+
+        stats_table.columns = STATS_COLUMNS
+        trends = trend_from_rows(df_filtered, ['Coordinador', 'Operador', 'Maquina'])
+        stats_table[TREND_COLUMNS[0]] = trends['Pendiente'].round(2)
+        stats_table[TREND_COLUMNS[1]] = trends['R2'].round(2)
+        return stats_table.reset_index()
+
+    def coordinator_stats(self, key):
+        """
+        Promedio y desviación estándar por coordinador, más el número de
+        operadores y registros.
+        """
+        def compute():
+            df_filtered = self.filtered(key)
+            with stage('groupby'):
+                return df_filtered.astype({'Valor_Promedio': 'float64'}).groupby(
+                    'Coordinador', observed=True
+                ).agg(
+                    Promedio=('Valor_Promedio', 'mean'),
+                    Desv_Est=('Valor_Promedio', 'std'),
+                    Operadores=('Operador', 'nunique'),
+                    Registros=('Valor_Promedio', 'size')
+                ).reset_index()
+
+        return self.cache.get_or_compute(('coordinator_stats', key), compute)
+
+    def spc_alerts(self, key):
+        """Alertas de control estadístico (spc.RULES) de las series dentro del filtro."""
+        operadores, maquinas, indicador, week_range = key
+        def compute():
+            with stage('spc'):
+                return self.spc.alerts(operadores, maquinas, indicador, week_range)
+
+        return self.cache.get_or_compute(('spc_alerts', key), compute)
@@ -0,0 +1,122 @@
+"""
+Esquema en memoria de los datasets procesados.
+
+Cada worker de los dashboards tiene su propia copia del DataFrame, así que
+los datos se cargan con tipos compactos: dimensiones como categóricas
+(códigos enteros pequeños), weeks y años como int16/int8 y medidas como
+float32.
+
+El DataFrame cargado se comparte entre sesiones de Streamlit y callbacks
+de Dash. Con Copy-on-Write las selecciones de columnas y los rangos de
+filas son vistas sin copia, y escribir sobre un resultado copia solo lo
+que cambia: nunca modifica los datos compartidos. Importar este módulo no
+cambia opciones de pandas: los dashboards llaman enable_copy_on_write()
+al arrancar.
+
+Uso:
+    python schema.py    # Reporte de memoria por columna (antes/después)
+"""
+import pandas as pd
+
+WEEKLY_SCHEMA = {
+    'Week': 'int16',
+    'Año': 'int16',
+    'Week_Año': 'int8',
+    'Mes': 'category',
+    'Mes_Num': 'int8',
+    'Coordinador': 'category',
+    'Operador': 'category',
+    'Maquina': 'category',
+    'Indicador': 'category',
+    'Valor_Promedio': 'float32',
+    'Dias_Trabajados': 'int8'
+}
+
+DAILY_SCHEMA = {
+    'Shift': 'category',
+    'Valor': 'float32',
+    'Turno': 'category',
+    'Week': 'int16',
+    'Año': 'int16',
+    'Week_Año': 'int8',
+    'Mes': 'category',
+    'Maquina': 'category',
+    'Indicador': 'category',
+    'Operador': 'category',
+    'Coordinador': 'category',
+    'Mes_Num': 'int8'
+}
+
+SCHEMAS = {
+    'data_weekly_processed': WEEKLY_SCHEMA,
+    'data_daily_processed': DAILY_SCHEMA
+}
+
+
+def enable_copy_on_write():
+    """
+    Activa Copy-on-Write en pandas 2.x (desde pandas 3.0 siempre está activo).
+    Es una opción global del proceso: solo la llaman los puntos de entrada
+    de los dashboards.
+    """
+    if int(pd.__version__.split('.')[0]) < 3:
+        pd.set_option('mode.copy_on_write', True)
+
+
+def apply_schema(df, schema):
+    """
+    Convierte las columnas de `df` a los tipos compactos de `schema`.
+    Las columnas enteras con valores faltantes usan el tipo nullable (Int16, Int8)
+    y las categóricas quedan con sus categorías en orden alfabético.
+    """
+    dtypes = {}
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        if dtype.startswith('int') and df[col].isna().any():
+            dtype = dtype.capitalize()
+        dtypes[col] = dtype
+    df = df.astype(dtypes)
+
+    # Categorías en orden alfabético para que groupby/sort ordenen igual que con strings
+    for col, dtype in dtypes.items():
+        if dtype == 'category':
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+    return df
+
+
+def memory_report(df):
+    """
+    Retorna el uso de memoria por columna (bytes reales, incluyendo strings).
+    Columnas: Columna, Tipo, Bytes, MB. La última fila es el total.
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'Columna': usage.index,
+        'Tipo': [str(df[col].dtype) for col in usage.index],
+        'Bytes': usage.values
+    })
+    total = pd.DataFrame([{'Columna': 'TOTAL', 'Tipo': '', 'Bytes': int(usage.sum())}])
+    report = pd.concat([report, total], ignore_index=True)
+    report['MB'] = (report['Bytes'] / 1024 ** 2).round(3)
+    return report
+
+
+if __name__ == '__main__':
+    from storage import dataset_paths, load_processed
+
+    for name in SCHEMAS:
+        csv_path, _ = dataset_paths(name)
+        df_raw = pd.read_csv(csv_path)
+        df_compact = load_processed(name)
+
+        before = memory_report(df_raw).set_index('Columna')
+        after = memory_report(df_compact).set_index('Columna')
+        comparison = pd.DataFrame({
+            'Tipo (CSV)': before['Tipo'],
+            'MB (CSV)': before['MB'],
+            'Tipo (compacto)': after['Tipo'],
+            'MB (compacto)': after['MB']
+        })
+        print(f"\n📊 {name} ({len(df_raw):,} registros)")
+        print(comparison.to_string())
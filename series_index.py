@@ -0,0 +1,73 @@
+"""
+Índice de series para filtrar el dataset semanal sin máscaras booleanas.
+
+Se construye una vez al cargar los datos: las filas se ordenan por
+(Indicador, Maquina, Operador, Week), así que cada serie queda en un rango
+contiguo de filas ordenado por Week. Un filtro de los dashboards se
+resuelve con una búsqueda por serie seleccionada más una búsqueda binaria
+sobre Week, con costo proporcional a las filas que regresa.
+"""
+import numpy as np
+
+SERIES_KEYS = ['Indicador', 'Maquina', 'Operador']
+
+
+class SeriesIndex:
+    """Mapa (Indicador, Maquina, Operador) → rango de filas ordenado por Week."""
+
+    def __init__(self, df):
+        self.df = df
+        order = np.lexsort([
+            df['Week'].to_numpy(),
+            *[df[col].astype(str).to_numpy() for col in reversed(SERIES_KEYS)]
+        ])
+        # Posiciones en `df` ordenadas por serie y Week
+        self.positions = order
+        self.weeks = df['Week'].to_numpy()[order]
+
+        df_sorted = df[SERIES_KEYS].iloc[order]
+        sizes = df_sorted.groupby(SERIES_KEYS, observed=True, sort=False).size()
+        stops = np.cumsum(sizes.to_numpy())
+        starts = stops - sizes.to_numpy()
+        self.slices = {
+            key: (int(start), int(stop))
+            for key, start, stop in zip(sizes.index, starts, stops)
+        }
+
+    def series_slice(self, indicador, maquina, operador, week_range=None):
+        """
+        Retorna (start, stop) de una serie dentro de `positions`,
+        recortado al rango de weeks [inicio, fin] si se indica.
+        """
+        start, stop = self.slices.get((indicador, maquina, operador), (0, 0))
+        if week_range is not None and stop > start:
+            weeks = self.weeks[start:stop]
+            start, stop = (start + int(np.searchsorted(weeks, week_range[0], 'left')),
+                           start + int(np.searchsorted(weeks, week_range[1], 'right')))
+        return start, stop
+
+    def rows(self, operadores, maquinas, indicador, week_range=None):
+        """Posiciones (en el orden original de `df`) de las filas que cumplen el filtro."""
+        parts = []
+        for maquina in dict.fromkeys(maquinas):
+            for operador in dict.fromkeys(operadores):
+                start, stop = self.series_slice(indicador, maquina, operador, week_range)
+                if stop > start:
+                    parts.append(self.positions[start:stop])
+
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(parts))
+
+    def query(self, operadores, maquinas, indicador, week_range=None):
+        """
+        Equivalente a:
+            df[df['Operador'].isin(operadores) & df['Maquina'].isin(maquinas) &
+               (df['Indicador'] == indicador) & df['Week'].between(*week_range)]
+        """
+        return self.df.iloc[self.rows(operadores, maquinas, indicador, week_range)]
+
+    def series(self, operador, maquina, indicador, week_range=None):
+        """Filas de una sola serie, ordenadas por Week."""
+        start, stop = self.series_slice(indicador, maquina, operador, week_range)
+        return self.df.iloc[self.positions[start:stop]]
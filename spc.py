@@ -0,0 +1,332 @@
+"""
+Control estadístico de procesos (SPC) de todas las series a la vez.
+
+Cada serie (Indicador, Maquina, Operador) es una carta de individuos:
+- Línea central y sigma de la fase base: las primeras SPC_BASELINE
+  observaciones de la serie (sigma = rango móvil promedio / 1.128). Con
+  menos de MIN_BASELINE observaciones la serie no tiene límites.
+- Reglas de Western Electric / Nelson sobre la desviación estandarizada
+- EWMA y CUSUM de un lado
+
+Todo se evalúa solo en la dirección adversa según `better` de
+INDICATOR_INFO: para MTBF (mayor es mejor) se alerta cuando baja, para
+Reject Rate (menor es mejor) cuando sube.
+
+Las series se acomodan en una matriz (series × observación) alineada a la
+izquierda y las reglas son operaciones de arreglos sobre toda la matriz;
+EWMA y CUSUM recorren las observaciones (columnas), no las series.
+
+Los resultados de una serie solo dependen de sus propias observaciones:
+al recargar los datos, refresh() reutiliza las series que no cambiaron. A
+las que solo recibieron weeks nuevas (con la fase base ya completa) se les
+evalúan solo esas weeks, a partir de los límites y del estado final de
+EWMA/CUSUM guardados. Las nuevas o modificadas se recalculan completas.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from series_index import SeriesIndex
+
+# Observaciones de la fase base (límites de control) y mínimo para tener límites
+SPC_BASELINE = int(os.environ.get('PMI_SPC_BASELINE', 20))
+MIN_BASELINE = 8
+
+# Constante d2 para rangos móviles de 2 observaciones
+D2 = 1.128
+
+EWMA_LAMBDA = 0.2
+EWMA_L = 3.0
+CUSUM_K = 0.5
+CUSUM_H = 5.0
+
+# Reglas en el orden de sus bits en `flags`
+RULES = [
+    ('limite_3s', 'Fuera de 3σ'),
+    ('racha_9', '9 seguidos del lado malo'),
+    ('tendencia_6', '6 seguidos empeorando'),
+    ('dos_de_tres', '2 de 3 más allá de 2σ'),
+    ('cuatro_de_cinco', '4 de 5 más allá de 1σ'),
+    ('ewma', 'EWMA fuera de límite'),
+    ('cusum', 'CUSUM fuera de límite')
+]
+
+# Alertas marcadas como anotación en una gráfica (las más recientes); la tabla muestra todas
+SPC_MAX_ANNOTATIONS = int(os.environ.get('PMI_SPC_MAX_ANNOTATIONS', 50))
+
+ALERT_COLUMNS = ['Week', 'Operador', 'Maquina', 'Valor', 'Linea_Central', 'Reglas']
+
+# Observaciones anteriores que usan las reglas de rachas y ventanas (racha de 9)
+CONTEXT = 8
+
+
+def rule_names(flags):
+    """Descripción de las reglas activas en un valor de `flags`."""
+    return ', '.join(label for bit, (_, label) in enumerate(RULES) if flags >> bit & 1)
+
+
+def _padded(values, lengths):
+    """
+    Matriz (series × máx. longitud) con cada serie alineada a la izquierda y
+    NaN de relleno, más (fila, columna) de cada valor de `values`.
+    """
+    offsets = np.cumsum(lengths) - lengths
+    row = np.repeat(np.arange(len(lengths)), lengths)
+    col = np.arange(len(values)) - np.repeat(offsets, lengths)
+    matrix = np.full((len(lengths), int(lengths.max()) if len(lengths) else 0), np.nan)
+    matrix[row, col] = values
+    return matrix, row, col
+
+
+def _run_length(mask):
+    """Largo de la racha de True que termina en cada posición, por fila."""
+    positions = np.arange(mask.shape[1])
+    last_false = np.maximum.accumulate(np.where(mask, -1, positions), axis=1)
+    return positions - last_false
+
+
+def _window_count(mask, width):
+    """Cuántos True hay en las últimas `width` posiciones (incluida la actual), por fila."""
+    counts = np.cumsum(mask, axis=1)
+    shifted = np.zeros_like(counts)
+    shifted[:, width:] = counts[:, :-width]
+    return counts - shifted
+
+
+def _evaluate(matrix, direction, center, sigma, offset, context, ewma, cusum):
+    """
+    Reglas sobre `matrix` (series × observación, alineada a la izquierda)
+    con límites ya calculados. La columna 0 de la fila i es la observación
+    offset[i] de su serie; las primeras context[i] columnas ya se evaluaron
+    antes (solo sirven para rachas y ventanas) y EWMA/CUSUM siguen desde
+    `ewma` y `cusum`. Retorna (flags, ewma, cusum) con flags en 0 en las
+    columnas de contexto.
+    """
+    n_series, width = matrix.shape
+    positions = np.arange(width)
+    fresh = positions >= context[:, None]
+
+    # Desviación estandarizada en la dirección adversa (NaN en relleno y sin límites)
+    with np.errstate(invalid='ignore'):
+        adverse = direction[:, None] * (matrix - center[:, None]) / sigma[:, None]
+        valid = ~np.isnan(adverse)
+        worse = np.zeros_like(valid)
+        worse[:, 1:] = direction[:, None] * np.diff(matrix, axis=1) > 0
+
+        rules = [
+            adverse > 3,
+            _run_length(adverse > 0) >= 9,
+            _run_length(worse) >= 5,
+            (_window_count(adverse > 2, 3) >= 2) & (adverse > 2),
+            (_window_count(adverse > 1, 5) >= 4) & (adverse > 1)
+        ]
+
+    # EWMA y CUSUM: recursivos en el tiempo, vectorizados entre series
+    ewma_limit = EWMA_L * np.sqrt(EWMA_LAMBDA / (2 - EWMA_LAMBDA)
+                                  * (1 - (1 - EWMA_LAMBDA) ** (2 * (offset[:, None] + positions + 1))))
+    ewma_signal = np.zeros_like(valid)
+    cusum_signal = np.zeros_like(valid)
+    for t in range(width):
+        ok = valid[:, t] & fresh[:, t]
+        z = np.where(ok, adverse[:, t], 0.0)
+        ewma = np.where(ok, EWMA_LAMBDA * z + (1 - EWMA_LAMBDA) * ewma, ewma)
+        cusum = np.where(ok, np.maximum(0.0, cusum + z - CUSUM_K), cusum)
+        ewma_signal[:, t] = ok & (ewma > ewma_limit[:, t])
+        cusum_signal[:, t] = ok & (cusum > CUSUM_H)
+        # Después de una señal el CUSUM vuelve a empezar
+        cusum = np.where(cusum_signal[:, t], 0.0, cusum)
+    rules += [ewma_signal, cusum_signal]
+
+    flags = np.zeros((n_series, width), dtype=np.uint8)
+    for bit, fired in enumerate(rules):
+        flags |= ((fired & valid & fresh).astype(np.uint8) << bit)
+    return flags, ewma, cusum
+
+
+def control_chart(values, lengths, direction, baseline=SPC_BASELINE):
+    """
+    Evalúa las cartas de un lote de series concatenadas en `values`
+    (`lengths` observaciones cada una, ordenadas por Week). `direction` es
+    +1 si lo adverso es subir y -1 si es bajar.
+    Retorna (flags por observación, línea central y sigma por serie,
+    EWMA y CUSUM al final de cada serie).
+    """
+    matrix, row, col = _padded(values, lengths)
+    n_series, width = matrix.shape
+    positions = np.arange(width)
+
+    # Fase base: primeras `baseline` observaciones de cada serie
+    base = positions < np.minimum(lengths, baseline)[:, None]
+    n_base = base.sum(axis=1)
+    center = np.where(base, matrix, 0.0).sum(axis=1) / np.maximum(n_base, 1)
+    moving_range = np.abs(np.diff(matrix, axis=1))
+    base_mr = base[:, 1:]
+    sigma = (np.where(base_mr, moving_range, 0.0).sum(axis=1)
+             / np.maximum(base_mr.sum(axis=1), 1) / D2)
+    usable = (n_base >= MIN_BASELINE) & (sigma > 0)
+    center = np.where(usable, center, np.nan)
+    sigma = np.where(usable, sigma, np.nan)
+
+    zeros = np.zeros(n_series, dtype=np.int64)
+    flags, ewma, cusum = _evaluate(matrix, direction, center, sigma, zeros, zeros,
+                                   np.zeros(n_series), np.zeros(n_series))
+    return flags[row, col], center, sigma, ewma, cusum
+
+
+def extend_chart(values, lengths, evaluated, direction, center, sigma, ewma, cusum):
+    """
+    Evalúa solo las observaciones nuevas de series que crecieron y ya tenían
+    la fase base completa. `evaluated` es cuántas observaciones de cada
+    serie ya se evaluaron; `values` trae, por serie, las últimas
+    min(evaluated, CONTEXT) de ellas seguidas de las nuevas (`lengths` en
+    total). Retorna (flags de las observaciones nuevas, EWMA y CUSUM al final).
+    """
+    context = np.minimum(evaluated, CONTEXT)
+    matrix, row, col = _padded(values, lengths)
+    flags, ewma, cusum = _evaluate(matrix, direction, center, sigma, evaluated - context, context,
+                                   ewma, cusum)
+    fresh = col >= context[row]
+    return flags[row[fresh], col[fresh]], ewma, cusum
+
+
+def _ranges(starts, lengths):
+    """Posiciones de los rangos [start, start + length) concatenados."""
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+
+
+class SPCEngine:
+    """
+    Cartas de control de todas las series del dataset semanal. `better`
+    mapea cada indicador a 'higher' o 'lower' (INDICATOR_INFO).
+    """
+
+    def __init__(self, df, better, index=None, baseline=SPC_BASELINE, previous=None,
+                 value_col='Valor_Promedio'):
+        self.better = better
+        self.index = index if index is not None else SeriesIndex(df)
+        self.baseline = baseline
+        self.keys = list(self.index.slices)
+        bounds = np.array(list(self.index.slices.values()), dtype=np.int64).reshape(-1, 2)
+        self.starts, stops = bounds[:, 0], bounds[:, 1]
+        self.lengths = stops - self.starts
+        self.values = df[value_col].to_numpy(dtype='float64')[self.index.positions]
+        self.weeks = self.index.weeks
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+
+        self.direction = np.array([1.0 if better.get(key[0]) == 'lower' else -1.0
+                                   for key in self.keys])
+
+        self.flags = np.zeros(len(self.values), dtype=np.uint8)
+        self.center = np.full(len(self.keys), np.nan)
+        self.sigma = np.full(len(self.keys), np.nan)
+        # EWMA y CUSUM al final de cada serie (para seguir con weeks nuevas)
+        self.ewma = np.zeros(len(self.keys))
+        self.cusum = np.zeros(len(self.keys))
+
+        changed = np.ones(len(self.keys), dtype=bool)
+        self.extended = 0
+        if previous is not None and previous.baseline == baseline and len(previous.keys):
+            changed = self._reuse(previous)
+
+        self.recomputed = int(changed.sum())
+        if self.recomputed:
+            series = np.flatnonzero(changed)
+            rows = _ranges(self.starts[series], self.lengths[series])
+            (self.flags[rows], self.center[series], self.sigma[series],
+             self.ewma[series], self.cusum[series]) = control_chart(
+                self.values[rows], self.lengths[series], self.direction[series], baseline)
+
+    def _reuse(self, previous):
+        """
+        Copia de `previous` los resultados de las series que no cambiaron y
+        evalúa solo las weeks nuevas de las que crecieron (mismas
+        observaciones al inicio y fase base completa). Retorna la máscara de
+        series que hay que recalcular completas.
+        """
+        if previous.keys == self.keys:
+            old = np.arange(len(self.keys))
+        else:
+            old = np.array([previous.positions.get(key, -1) for key in self.keys], dtype=np.int64)
+        old_lengths = np.where(old >= 0, previous.lengths[old], 0)
+
+        # Las observaciones que ya tenía la serie deben seguir iguales (mismas weeks y valores)
+        candidates = np.flatnonzero((old >= 0) & (self.lengths >= old_lengths))
+        prefix = old_lengths[candidates]
+        rows = _ranges(self.starts[candidates], prefix)
+        old_rows = _ranges(previous.starts[old[candidates]], prefix)
+        new_values, old_values = self.values[rows], previous.values[old_rows]
+        equal = ((new_values == old_values) | (np.isnan(new_values) & np.isnan(old_values))) \
+            & (self.weeks[rows] == previous.weeks[old_rows])
+        kept = candidates[np.logical_and.reduceat(equal, np.cumsum(prefix) - prefix)] \
+            if len(candidates) else candidates
+        kept_old = old[kept]
+
+        self.flags[_ranges(self.starts[kept], old_lengths[kept])] = \
+            previous.flags[_ranges(previous.starts[kept_old], old_lengths[kept])]
+        self.center[kept] = previous.center[kept_old]
+        self.sigma[kept] = previous.sigma[kept_old]
+        self.ewma[kept] = previous.ewma[kept_old]
+        self.cusum[kept] = previous.cusum[kept_old]
+
+        changed = np.ones(len(self.keys), dtype=bool)
+        changed[kept] = False
+        # Series con weeks nuevas: con la fase base completa los límites no cambian
+        grown = kept[self.lengths[kept] > old_lengths[kept]]
+        changed[grown[old_lengths[grown] < self.baseline]] = True
+        grown = grown[old_lengths[grown] >= self.baseline]
+
+        self.extended = len(grown)
+        if self.extended:
+            evaluated = old_lengths[grown]
+            context = np.minimum(evaluated, CONTEXT)
+            lengths = self.lengths[grown] - evaluated + context
+            rows = _ranges(self.starts[grown] + evaluated - context, lengths)
+            new_rows = _ranges(self.starts[grown] + evaluated, self.lengths[grown] - evaluated)
+            self.flags[new_rows], self.ewma[grown], self.cusum[grown] = extend_chart(
+                self.values[rows], lengths, evaluated, self.direction[grown],
+                self.center[grown], self.sigma[grown], self.ewma[grown], self.cusum[grown])
+        return changed
+
+    def refresh(self, df, index=None):
+        """
+        Motor para una versión nueva de los datos: reutiliza las series que no
+        cambiaron, evalúa solo las weeks nuevas de las que crecieron y
+        recalcula completas las demás.
+        """
+        return SPCEngine(df, self.better, index, self.baseline, previous=self)
+
+    def alerts(self, operadores, maquinas, indicador, week_range=None):
+        """
+        Observaciones con alguna regla activa dentro de la selección, en orden
+        de selección y por Week. Columnas: ALERT_COLUMNS más 'Flags'.
+        """
+        rows, series = [], []
+        for operador in operadores:
+            for maquina in maquinas:
+                i = self.positions.get((indicador, maquina, operador))
+                if i is None:
+                    continue
+                start, stop = self.index.series_slice(indicador, maquina, operador, week_range)
+                hits = start + np.flatnonzero(self.flags[start:stop])
+                rows.append(hits)
+                series.append(np.full(len(hits), i))
+
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        series = np.concatenate(series) if series else np.empty(0, dtype=np.int64)
+        keys = [self.keys[i] for i in series]
+        alerts = pd.DataFrame({
+            'Week': self.index.weeks[rows].astype('int64'),
+            'Operador': pd.Series([key[2] for key in keys], dtype=object),
+            'Maquina': pd.Series([key[1] for key in keys], dtype=object),
+            'Valor': self.values[rows].round(2),
+            'Linea_Central': self.center[series].round(2),
+            'Reglas': [rule_names(int(f)) for f in self.flags[rows]],
+            'Flags': self.flags[rows]
+        })
+        return alerts
+
+    def summary(self):
+        """Número de observaciones con alerta por regla (toda la planta)."""
+        return {name: int((self.flags >> bit & 1).sum()) for bit, (name, _) in enumerate(RULES)}
@@ -0,0 +1,115 @@
+"""
+Lectura y escritura de los datasets procesados.
+
+Además del CSV, el ETL escribe un archivo Parquet tipado de cada dataset:
+columnas de dimensión con dictionary encoding y fechas como tipo fecha
+nativo. Los dashboards cargan primero el Parquet y solo usan el CSV si el
+Parquet no existe, está desactualizado o no hay pyarrow instalado.
+"""
+import os
+import time
+
+import pandas as pd
+
+from metrics import observe_dataset_load
+from schema import SCHEMAS, apply_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él solo se usa CSV
+    pa = None
+    pq = None
+
+WEEKLY = 'data_weekly_processed'
+DAILY = 'data_daily_processed'
+
+# Carpeta de los datasets procesados (por defecto el directorio actual)
+DATA_DIR = os.environ.get('PMI_DATA_DIR', '.')
+
+DIMENSION_COLUMNS = ['Shift', 'Turno', 'Mes', 'Coordinador', 'Operador', 'Maquina', 'Indicador']
+DATE_COLUMNS = ['Fecha', 'Fecha_Inicio', 'Fecha_Fin']
+
+
+def dataset_paths(name, data_dir=DATA_DIR):
+    """Retorna (ruta_csv, ruta_parquet) de un dataset."""
+    base = os.path.join(data_dir, name)
+    return base + '.csv', base + '.parquet'
+
+
+def to_arrow(df):
+    """Convierte a tabla Arrow con dimensiones como diccionario y fechas como date32."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = []
+    for field in table.schema:
+        if field.name in DIMENSION_COLUMNS and (pa.types.is_string(field.type)
+                                                or pa.types.is_large_string(field.type)):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type))
+        elif field.name in DATE_COLUMNS and pa.types.is_timestamp(field.type):
+            field = field.with_type(pa.date32())
+        fields.append(field)
+    return table.cast(pa.schema(fields))
+
+
+def write_processed(df, name, output_dir='.'):
+    """
+    Guarda un dataset procesado como CSV y, si hay pyarrow, como Parquet.
+    Retorna la lista de archivos escritos.
+    """
+    csv_path, parquet_path = dataset_paths(name, output_dir)
+    # Se escribe a un temporal y se renombra: los dashboards que recargan
+    # los datos nunca leen un archivo a medias
+    tmp_path = csv_path + '.tmp'
+    df.to_csv(tmp_path, index=False, encoding='utf-8')
+    os.replace(tmp_path, csv_path)
+    written = [csv_path]
+
+    if pq is not None:
+        tmp_path = parquet_path + '.tmp'
+        pq.write_table(to_arrow(df), tmp_path, compression='zstd')
+        os.replace(tmp_path, parquet_path)
+        written.append(parquet_path)
+
+    return written
+
+
+def _parquet_is_fresh(csv_path, parquet_path):
+    if pq is None or not os.path.exists(parquet_path):
+        return False
+    # Si alguien reescribió solo el CSV, el Parquet ya no es válido
+    return not os.path.exists(csv_path) or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)
+
+
+def dataset_version(name, data_dir=None):
+    """
+    Versión del dataset que cargaría load_processed: archivo, tamaño y fecha
+    de modificación. Cambia cada vez que el ETL reescribe los datos.
+    """
+    csv_path, parquet_path = dataset_paths(name, DATA_DIR if data_dir is None else data_dir)
+    path = parquet_path if _parquet_is_fresh(csv_path, parquet_path) else csv_path
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_processed(name, data_dir=None):
+    """
+    Carga un dataset procesado: Parquet si está disponible y al día,
+    si no el CSV (parseando las columnas de fecha).
+    Por defecto se lee de DATA_DIR (evaluado al llamar, no al importar).
+    Las columnas se convierten a los tipos compactos de schema.py.
+    El tiempo de carga se registra en metrics.py.
+    """
+    start = time.perf_counter()
+    csv_path, parquet_path = dataset_paths(name, DATA_DIR if data_dir is None else data_dir)
+
+    if _parquet_is_fresh(csv_path, parquet_path):
+        df = pq.read_table(parquet_path).to_pandas(date_as_object=False)
+    else:
+        df = pd.read_csv(csv_path)
+        for col in DATE_COLUMNS:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col])
+
+    df = apply_schema(df, SCHEMAS.get(name, {}))
+    observe_dataset_load(name, time.perf_counter() - start, len(df))
+    return df
@@ -0,0 +1,193 @@
+"""
+Generador de datos sintéticos de planta para pruebas de rendimiento.
+
+Genera, a la escala que se pida (máquinas, operadores, turnos, años):
+- Excel con la misma forma que data/KDF-*/<Indicador> - Shift N.xlsx
+  (2 filas de filtros, encabezados en la fila 3, columna Shift 'S1 dd-mm-yyyy')
+- operators_assignments.csv con rotación de turnos por bloques de weeks
+- data_weekly_processed / data_daily_processed (CSV + Parquet) con el ETL
+
+Uso:
+    python synthetic_data.py --output-dir /tmp/pmi_synth --machines 20 --operators 4 --years 3
+    python synthetic_data.py --output-dir /tmp/pmi_synth --no-excel   # Solo datasets procesados
+"""
+import argparse
+import os
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import etl
+import storage
+
+COORDINATORS = ['ANDRES', 'MAYRA', 'PEDRO']
+START_DATE = '2025-01-06'
+
+# Columna de valores de cada Excel y distribución de sus valores
+VALUE_COLUMNS = {
+    'MTBF': 'MTBF',
+    'Reject Rate': 'Reject Rate',
+    'Stratergic PR': 'Strategic PR',
+    'UPDT Categories': 'Total'
+}
+
+
+def machine_names(n_machines):
+    """Nombres de máquina KDF-1 ... KDF-n."""
+    return [f'KDF-{i}' for i in range(1, n_machines + 1)]
+
+
+def synthetic_assignments(machines, operators_per_machine=3, shifts=3,
+                          start=START_DATE, years=1, rotation_weeks=4):
+    """
+    Asignaciones de operadores con el formato de operators_assignments.csv.
+    Cada máquina tiene `operators_per_machine` operadores que rotan entre los
+    turnos cada `rotation_weeks` weeks; si hay más operadores que turnos, los
+    que sobran descansan en ese bloque.
+    """
+    start = pd.Timestamp(start)
+    end = start + pd.DateOffset(years=years) - pd.Timedelta(days=1)
+    block_starts = pd.date_range(start, end, freq=f'{7 * rotation_weeks}D')
+
+    rows = []
+    for m, machine in enumerate(machines):
+        operators = [f'Operador {machine} {i + 1:02d}' for i in range(operators_per_machine)]
+        for b, block_start in enumerate(block_starts):
+            block_end = min(block_start + pd.Timedelta(days=7 * rotation_weeks - 1), end)
+            for s in range(min(shifts, operators_per_machine)):
+                o = (s + b) % operators_per_machine
+                rows.append({
+                    'Operador': operators[o],
+                    'Coordinador': COORDINATORS[(m + o) % len(COORDINATORS)],
+                    'Fecha_Inicio': block_start.strftime('%Y-%m-%d'),
+                    'Fecha_Fin': block_end.strftime('%Y-%m-%d'),
+                    'Turno': f'S{s + 1}',
+                    'Maquina': machine
+                })
+    return pd.DataFrame(rows)
+
+
+def synthetic_readings(machines, shifts=3, start=START_DATE, years=1, seed=0):
+    """
+    Lecturas por turno en el formato crudo de los Excel:
+    Maquina, Indicador (prefijo de archivo), Shift ('S1 dd-mm-yyyy'), Valor.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start)
+    dates = pd.date_range(start, start + pd.DateOffset(years=years) - pd.Timedelta(days=1))
+    date_str = dates.strftime('%d-%m-%Y').to_numpy()
+
+    shift_labels = np.array([f'S{s + 1}' for s in range(shifts)])
+    shift_strings = np.char.add(np.char.add(np.repeat(shift_labels, len(dates)), ' '),
+                                np.tile(date_str, shifts).astype(str))
+    n = len(shift_strings)
+
+    generators = {
+        'MTBF': lambda: rng.gamma(2.0, 60.0, n),
+        'Reject Rate': lambda: rng.beta(1.5, 60.0, n),
+        'Stratergic PR': lambda: rng.beta(8.0, 3.0, n),
+        'UPDT Categories': lambda: rng.beta(1.2, 12.0, n)
+    }
+
+    parts = []
+    for machine in machines:
+        for file_prefix, generate in generators.items():
+            parts.append(pd.DataFrame({
+                'Maquina': machine,
+                'Indicador': file_prefix,
+                'Shift': shift_strings,
+                'Valor': generate()
+            }))
+    return pd.concat(parts, ignore_index=True)
+
+
+def write_workbooks(df_readings, data_path):
+    """Escribe un Excel por (máquina, indicador) con la forma de los exports reales."""
+    for (machine, file_prefix), df_wb in df_readings.groupby(['Maquina', 'Indicador'], sort=False):
+        folder = os.path.join(data_path, machine)
+        os.makedirs(folder, exist_ok=True)
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet('Sheet1')
+        ws.append([f'Applied filters:\nLINE_NAME is {machine} (sintético)'])
+        ws.append([])
+        value_col = VALUE_COLUMNS[file_prefix]
+        ws.append(['Shift', value_col, f'{value_col} Target'])
+        for shift, valor in zip(df_wb['Shift'].tolist(), df_wb['Valor'].tolist()):
+            ws.append([shift, valor, None])
+        wb.save(os.path.join(folder, f'{file_prefix} - Shift 1.xlsx'))
+
+
+def build_processed(df_readings, df_operators):
+    """
+    Pasa las lecturas por las mismas etapas del ETL (parseo, asignación,
+    agregación semanal). Retorna (df_daily, df_weekly).
+    """
+    df_all = df_readings.copy()
+    df_all['Indicador'] = df_all['Indicador'].map(etl.INDICATORS)
+    df_all[['Turno', 'Fecha']] = etl.parse_shifts(df_all['Shift'])
+    df_all[['Week', 'Año', 'Week_Año']] = etl.fiscal_weeks(df_all['Fecha'])[['Week', 'Año', 'Week_Año']]
+    df_all['Mes'] = df_all['Fecha'].dt.month_name()
+
+    df_operators = df_operators.copy()
+    df_operators['Fecha_Inicio'] = pd.to_datetime(df_operators['Fecha_Inicio'])
+    df_operators['Fecha_Fin'] = pd.to_datetime(df_operators['Fecha_Fin'])
+    df_all, _ = etl.assign_operators(df_all, df_operators)
+
+    df_daily = etl.to_daily(df_all)
+    return df_daily, etl.aggregate_weekly(df_daily)
+
+
+def generate_plant(output_dir, n_machines=6, operators_per_machine=3, shifts=3,
+                   years=1, start=START_DATE, seed=0, excel=True):
+    """
+    Genera un dataset sintético completo en `output_dir`:
+    data/KDF-*/ (si excel=True), operators_assignments.csv y los datasets procesados.
+    Retorna un dict con las rutas y el tamaño generado.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    machines = machine_names(n_machines)
+
+    df_operators = synthetic_assignments(machines, operators_per_machine, shifts, start, years)
+    operators_file = os.path.join(output_dir, etl.OPERATORS_FILE)
+    df_operators.to_csv(operators_file, index=False, encoding='utf-8')
+
+    df_readings = synthetic_readings(machines, shifts, start, years, seed)
+    data_path = os.path.join(output_dir, etl.DATA_PATH)
+    if excel:
+        write_workbooks(df_readings, data_path)
+
+    df_daily, df_weekly = build_processed(df_readings, df_operators)
+    storage.write_processed(df_weekly, storage.WEEKLY, output_dir)
+    storage.write_processed(df_daily, storage.DAILY, output_dir)
+
+    return {
+        'output_dir': output_dir,
+        'data_path': data_path if excel else None,
+        'operators_file': operators_file,
+        'machines': machines,
+        'lecturas': len(df_readings),
+        'registros_diarios': len(df_daily),
+        'registros_semanales': len(df_weekly)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Datos sintéticos de planta (formato KDF)")
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--machines', type=int, default=6)
+    parser.add_argument('--operators', type=int, default=3, help="Operadores por máquina")
+    parser.add_argument('--shifts', type=int, default=3, help="Turnos por día")
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-excel', action='store_true', help="No escribir los Excel de data/")
+    args = parser.parse_args()
+
+    info = generate_plant(args.output_dir, args.machines, args.operators, args.shifts,
+                          args.years, seed=args.seed, excel=not args.no_excel)
+    print(f"✅ Datos sintéticos en {info['output_dir']}")
+    print(f"   Máquinas: {len(info['machines'])}")
+    print(f"   Lecturas: {info['lecturas']:,}")
+    print(f"   Registros diarios: {info['registros_diarios']:,}")
+    print(f"   Registros semanales: {info['registros_semanales']:,}")
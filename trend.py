@@ -0,0 +1,155 @@
+"""
+Tendencia lineal (mínimos cuadrados de Valor_Promedio contra Week) de todas
+las series a la vez.
+
+Usa el mismo orden que SeriesIndex y la misma idea que StatsCube: por fila
+guarda sumas acumuladas de n, x, y, x·y, x² y y² (x = Week). La recta de
+cualquier rango de filas [start, stop) sale de restas de prefijos, así que
+se ajustan todas las series (o todas las de una selección) con operaciones
+de arreglos, sin recorrer grupos. Los valores faltantes (NaN) no suman y
+las weeks sin registro simplemente no están: la recta usa solo las weeks
+con dato.
+
+x y y se centran en el promedio de su serie antes de acumular, para no
+perder precisión al restar prefijos.
+"""
+import numpy as np
+import pandas as pd
+
+from series_index import SERIES_KEYS, SeriesIndex
+
+TREND_COLUMNS = ['Tendencia', 'R²']
+
+# Varianza mínima para considerar que x o y varían, relativa al segundo
+# momento del grupo (sumas directas) o al prefijo acumulado (TrendCube)
+VAR_TOLERANCE = 1e-9
+PREFIX_TOLERANCE = 1e-15
+
+
+def ols_from_sums(n, sx, sy, sxx, sxy, syy, tol_x=None, tol_y=None):
+    """
+    Pendiente, intercepto y R² a partir de las sumas de cada grupo (arreglos).
+    Con menos de 2 weeks distintas la pendiente es NaN; R² es NaN si los
+    valores no varían. Varianzas por debajo de `tol_x`/`tol_y` son error de
+    redondeo y cuentan como cero (por defecto VAR_TOLERANCE · sxx/syy).
+    """
+    tol_x = VAR_TOLERANCE * sxx if tol_x is None else tol_x
+    tol_y = VAR_TOLERANCE * syy if tol_y is None else tol_y
+    n = np.asarray(n, dtype='float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x, mean_y = sx / n, sy / n
+        var_x = sxx - sx * mean_x
+        var_y = syy - sy * mean_y
+        cov = sxy - sx * mean_y
+        ok = (n >= 2) & (var_x > tol_x)
+        slope = np.where(ok, cov / np.where(ok, var_x, 1), np.nan)
+        intercept = mean_y - slope * mean_x
+        r2 = np.where(ok & (var_y > tol_y), cov * cov / (var_x * var_y), np.nan)
+    return slope.astype('float64'), intercept.astype('float64'), np.clip(r2, 0, 1).astype('float64')
+
+
+def _prefix(values):
+    """Sumas acumuladas con un cero al inicio (prefix[i] = suma de values[:i])."""
+    return np.concatenate([np.zeros(1, dtype=values.dtype), np.cumsum(values)])
+
+
+class TrendCube:
+    """Sumas acumuladas para ajustar rectas sobre cualquier rango de weeks."""
+
+    def __init__(self, df, index=None, value_col='Valor_Promedio'):
+        self.index = index if index is not None else SeriesIndex(df)
+        self.keys = list(self.index.slices)
+        bounds = np.array(list(self.index.slices.values()), dtype=np.int64).reshape(-1, 2)
+        self.starts, self.stops = bounds[:, 0], bounds[:, 1]
+
+        y = df[value_col].to_numpy(dtype='float64')[self.index.positions]
+        x = self.index.weeks.astype('float64')
+        valid = ~np.isnan(y)
+        n = len(y)
+
+        # Promedio de x y y de la serie de cada fila (referencia para centrar)
+        self.ref_x = np.zeros(n)
+        self.ref_y = np.zeros(n)
+        if len(self.keys):
+            lengths = self.stops - self.starts
+            count = np.add.reduceat(valid.astype('float64'), self.starts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean_x = np.add.reduceat(np.where(valid, x, 0.0), self.starts) / count
+                mean_y = np.add.reduceat(np.where(valid, y, 0.0), self.starts) / count
+            self.ref_x = np.repeat(np.nan_to_num(mean_x), lengths)
+            self.ref_y = np.repeat(np.nan_to_num(mean_y), lengths)
+
+        cx = np.where(valid, x - self.ref_x, 0.0).astype(np.longdouble)
+        cy = np.where(valid, y - self.ref_y, 0.0).astype(np.longdouble)
+        self.n = np.concatenate([[0], np.cumsum(valid)])
+        self.sx, self.sy = _prefix(cx), _prefix(cy)
+        self.sxx, self.sxy, self.syy = _prefix(cx * cx), _prefix(cx * cy), _prefix(cy * cy)
+
+        # Llave (serie, week) ordenada: ventanas de todas las series con un solo searchsorted
+        series_id = np.repeat(np.arange(len(self.keys), dtype=np.int64), self.stops - self.starts)
+        self._week_key = series_id * (1 << 32) + self.index.weeks.astype(np.int64)
+
+    def fit(self, starts, stops):
+        """
+        Rectas de los rangos de filas [starts[i], stops[i]) (arreglos del
+        mismo largo, cada rango dentro de una serie).
+        Retorna (pendiente, intercepto, r2, weeks) por rango.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        stops = np.asarray(stops, dtype=np.int64)
+        n = self.n[stops] - self.n[starts]
+        sums = [prefix[stops] - prefix[starts] for prefix in (self.sx, self.sy, self.sxx, self.sxy, self.syy)]
+        # El error de redondeo de restar prefijos depende del tamaño del prefijo
+        slope, intercept, r2 = ols_from_sums(n, *sums, tol_x=PREFIX_TOLERANCE * self.sxx[stops],
+                                             tol_y=PREFIX_TOLERANCE * self.syy[stops])
+        # Intercepto en unidades originales (las sumas están centradas por serie)
+        ref = np.minimum(starts, len(self.ref_x) - 1)
+        if len(self.ref_x):
+            intercept = intercept + self.ref_y[ref] - slope * self.ref_x[ref]
+        return slope, intercept, r2, n
+
+    def window(self, week_range=None):
+        """Rango de filas [start, stop) de cada serie dentro de las weeks [inicio, fin]."""
+        if week_range is None:
+            return self.starts, self.stops
+        series_id = np.arange(len(self.keys), dtype=np.int64) * (1 << 32)
+        return (np.searchsorted(self._week_key, series_id + int(week_range[0]), 'left'),
+                np.searchsorted(self._week_key, series_id + int(week_range[1]), 'right'))
+
+    def all_series(self, week_range=None):
+        """
+        Recta de cada serie (Indicador, Maquina, Operador) en el rango de
+        weeks: columnas Pendiente, Intercepto, R2 y Weeks.
+        """
+        slope, intercept, r2, n = self.fit(*self.window(week_range))
+        trends = pd.DataFrame(self.keys, columns=SERIES_KEYS)
+        trends['Pendiente'] = slope
+        trends['Intercepto'] = intercept
+        trends['R2'] = r2
+        trends['Weeks'] = n
+        return trends
+
+
+def trend_from_rows(df, by, value_col='Valor_Promedio'):
+    """Recta de cada grupo `by` de filas sueltas (mismo resultado que TrendCube)."""
+    y = df[value_col].astype('float64')
+    x = df['Week'].astype('float64').where(y.notna())
+    grouped = pd.DataFrame({
+        'x': x, 'y': y, 'xx': x * x, 'xy': x * y, 'yy': y * y
+    }).assign(**{col: df[col] for col in by}).groupby(by, observed=True)
+    sums = grouped.sum(min_count=1)
+    n = grouped['y'].count()
+    # Centrar con el promedio del grupo para no perder precisión
+    mx, my = sums['x'] / n, sums['y'] / n
+    sxx = sums['xx'] - n * mx * mx
+    sxy = sums['xy'] - n * mx * my
+    syy = sums['yy'] - n * my * my
+    zeros = np.zeros(len(n))
+    slope, intercept, r2 = ols_from_sums(n.to_numpy(), zeros, zeros,
+                                         sxx.to_numpy(), sxy.to_numpy(), syy.to_numpy())
+    return pd.DataFrame({
+        'Pendiente': slope,
+        'Intercepto': my.to_numpy() - slope * mx.to_numpy(),
+        'R2': r2,
+        'Weeks': n.to_numpy()
+    }, index=n.index)
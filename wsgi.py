@@ -0,0 +1,67 @@
+"""
+Punto de entrada de producción (WSGI) del dashboard Dash.
+
+create_app() carga los datasets e índices de app_dash.py una sola vez, en
+el proceso maestro, antes de que el servidor cree los workers con fork.
+Los workers comparten esas páginas de memoria (copy-on-write) en lugar de
+leer y guardar cada uno su propia copia, así que la memoria por host casi
+no crece al agregar workers.
+
+Para que las páginas sigan compartidas:
+- gc.freeze() mueve los objetos ya cargados a la generación permanente del
+  recolector de basura, que así no les escribe encima al recorrerlos
+- Los DataFrames y arreglos cargados son de solo lectura (ver queries.py):
+  ningún callback los modifica en el lugar
+
+Los datos nuevos también se cargan en el maestro (reload_data, llamado
+desde gunicorn.conf.py), que después reemplaza los workers: así ningún
+worker carga su propia copia ni sirve una versión distinta a los demás.
+
+Este camino nunca activa el modo debug de Dash (`python app_dash.py` es
+solo para desarrollo).
+
+Uso (gunicorn lee gunicorn.conf.py, con preload_app = True):
+    gunicorn
+    gunicorn --workers 8 --bind 0.0.0.0:8050
+"""
+import gc
+
+import storage
+
+
+def create_app(data_dir=None):
+    """
+    Carga el dashboard Dash con los datos de `data_dir` (por defecto
+    storage.DATA_DIR) y retorna el servidor Flask para el servidor WSGI.
+    """
+    if data_dir is not None:
+        storage.DATA_DIR = data_dir
+
+    import app_dash  # Carga datasets, índices y cubo al importar
+
+    # Lo cargado hasta aquí no se libera: que el GC no lo toque después del fork
+    gc.collect()
+    gc.freeze()
+
+    current = app_dash.data.current
+    print(f"✅ Dashboard listo: {len(current.df):,} registros semanales, "
+          f"{len(current.df_daily):,} diarios (versión {app_dash.data.version})")
+    return app_dash.server
+
+
+def reload_data():
+    """
+    Carga en el proceso maestro la versión nueva de los datos, antes de que
+    gunicorn cree los workers que la van a servir. Retorna True si cambió.
+    """
+    import app_dash
+
+    # Lo congelado en la generación permanente nunca se recolecta: sin
+    # unfreeze, los ciclos de referencias de la versión anterior
+    # (DashboardData, QueryEngine) quedarían vivos en el maestro y cada
+    # recarga sumaría un dataset completo
+    gc.unfreeze()
+    changed = app_dash.data.reload()
+    gc.collect()
+    gc.freeze()
+    return changed